@@ -6,6 +6,11 @@ Flask API for Atrial Fibrillation prediction using CNN-LSTM model.
 Endpoints:
 - GET  /health          - Health check
 - POST /api/predict-af  - Predict AF from ECG signal
+- POST /api/predict-af/recording/<id> - Predict AF for a recording read from the database
+- POST /api/predict-af/recording/<id>/range - Predict AF for a time range of a stored recording
+- POST /api/signal/recording/<id> - Append samples to the recording signal store
+- POST /api/waveform/recording/<id>/pyramid - Build the min/max waveform pyramid of a recording
+- GET  /api/waveform/recording/<id>/tile    - Waveform tile (level, start, end)
 
 Usage:
     python app.py
@@ -14,6 +19,7 @@ Usage:
 
 import os
 import sys
+import json
 
 # FORCE LEGACY KERAS (IMPORTANT for TF 2.16+ loading models from TF 2.15)
 # This must be set before importing tensorflow/keras
@@ -21,52 +27,78 @@ os.environ["TF_USE_LEGACY_KERAS"] = "1"
 
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import numpy as np
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from models.cnn_lstm_model import AFPredictor, MODEL_SAMPLE_RATE
-from models.hr_calculator import HeartRateCalculator
-from scipy import signal as scipy_signal
+import handlers
+from handlers import ApiError, get_af_predictor
+from utils.request_decoding import (
+    read_body, BodyDecodingError, BodyTooLarge, UnsupportedEncoding, DEFAULT_MAX_BODY_BYTES
+)
 
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)  # Enable CORS for Rails integration
 
-# Initialize models
-af_predictor = None
-hr_calculator = None
+# Largest decoded request body accepted (compressed uploads are checked while decoding)
+MAX_BODY_BYTES = int(os.environ.get('AF_API_MAX_BODY_BYTES', DEFAULT_MAX_BODY_BYTES))
 
 
-def get_af_predictor():
-    """Lazy load AF predictor"""
-    global af_predictor
-    if af_predictor is None:
-        af_predictor = AFPredictor()
-    return af_predictor
+def read_json_body(silent=False):
+    """
+    Parse the JSON request body
+    
+    Bodies sent with Content-Encoding gzip, deflate or zstd are
+    decompressed from the request stream chunk by chunk into one buffer
+    of at most MAX_BODY_BYTES, which is then parsed.
+    
+    Returns:
+        (data, error_response); error_response is None on success
+    """
+    encoding = request.headers.get('Content-Encoding')
+    if not encoding or encoding.strip().lower() == 'identity':
+        return request.get_json(silent=silent), None
+    
+    try:
+        body = read_body(request.stream, encoding, MAX_BODY_BYTES)
+    except UnsupportedEncoding as e:
+        return None, (jsonify({'status': 'error', 'message': str(e)}), 415)
+    except BodyTooLarge as e:
+        return None, (jsonify({'status': 'error', 'message': str(e)}), 413)
+    except BodyDecodingError as e:
+        return None, (jsonify({'status': 'error', 'message': str(e)}), 400)
+    
+    if not body and silent:
+        return None, None
+    
+    try:
+        return json.loads(body), None
+    except ValueError:
+        if silent:
+            return None, None
+        return None, (jsonify({'status': 'error', 'message': 'Invalid JSON body'}), 400)
 
 
-def get_hr_calculator():
-    """Lazy load HR calculator"""
-    global hr_calculator
-    if hr_calculator is None:
-        hr_calculator = HeartRateCalculator(MODEL_SAMPLE_RATE)
-    return hr_calculator
+def respond(handler, *args):
+    """Run a request handler and turn its result or error into a Flask response"""
+    try:
+        return jsonify(handler(*args))
+    except ApiError as e:
+        return jsonify(e.payload), e.status
+    except Exception as e:
+        import traceback
+        return jsonify({
+            'status': 'error',
+            'message': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
 
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    predictor = get_af_predictor()
-    model_loaded = predictor.model is not None
-    
-    return jsonify({
-        'status': 'healthy',
-        'model_loaded': model_loaded,
-        'model_sample_rate': MODEL_SAMPLE_RATE,
-        'version': '1.0.0'
-    })
+    return respond(handlers.health)
 
 
 @app.route('/api/predict-af', methods=['POST'])
@@ -74,7 +106,7 @@ def predict_af():
     """
     Predict Atrial Fibrillation from ECG signal
     
-    Request body:
+    Request body (optionally sent with Content-Encoding gzip/deflate/zstd):
     {
         "samples": [array of ECG values],
         "sample_rate": 400  // Device sample rate in Hz
@@ -89,153 +121,170 @@ def predict_af():
         "heart_rate": {...}
     }
     """
-    try:
-        # Parse request
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                'status': 'error',
-                'message': 'No JSON data provided'
-            }), 400
-        
-        samples = data.get('samples')
-        
-        # Ensure numeric parameters are safely casted
-        try:
-            sample_rate = int(data.get('sample_rate', 400))
-            threshold = float(data.get('threshold', 0.5))
-        except (ValueError, TypeError):
-             return jsonify({
-                'status': 'error',
-                'message': 'Invalid format for sample_rate or threshold (must be numbers)'
-            }), 400
-        
-        if samples is None:
-            return jsonify({
-                'status': 'error',
-                'message': 'Missing required field: samples'
-            }), 400
-        
-        if not isinstance(samples, list) or len(samples) == 0:
-            return jsonify({
-                'status': 'error',
-                'message': 'samples must be a non-empty array'
-            }), 400
-        
-        # Convert to numpy array
-        samples_array = np.array(samples, dtype=np.float32)
-        
-        # Check minimum length (need at least 10 seconds of data)
-        min_samples = 10 * sample_rate
-        if len(samples_array) < min_samples:
-            return jsonify({
-                'status': 'error',
-                'message': f'Signal too short. Need at least 10 seconds ({min_samples} samples at {sample_rate}Hz)'
-            }), 400
-        
-        # Get predictor and run prediction
-        predictor = get_af_predictor()
-        af_result = predictor.predict(samples_array, sample_rate, threshold)
-        
-        if af_result.get('status') == 'error':
-            return jsonify(af_result), 500
-        
-        # Calculate heart rate
-        hr_calc = get_hr_calculator()
-        
-        # Resample signal for HR calculation
-        preprocessed = predictor.preprocess_signal(samples_array, sample_rate)
-        hr_result = hr_calc.calculate_statistics(preprocessed)
-        
-        # Combine results
-        response = {
-            'status': 'success',
-            'af_detected': af_result.get('af_detected', False),
-            'af_events': af_result.get('af_events', []),
-            'summary': af_result.get('summary', {}),
-            'heart_rate': hr_result.get('heart_rate', {
-                'min_bpm': 0,
-                'avg_bpm': 0,
-                'max_bpm': 0
-            }),
-            'hrv_metrics': hr_result.get('hrv_metrics', {}),
-            'r_peak_count': hr_result.get('r_peak_count', 0)
-        }
-        
-        # Generate conclusion
-        response['conclusion'] = generate_conclusion(response)
-        
-        return jsonify(response)
-        
-    except Exception as e:
-        import traceback
-        return jsonify({
-            'status': 'error',
-            'message': str(e),
-            'traceback': traceback.format_exc()
-        }), 500
+    data, error_response = read_json_body()
+    if error_response is not None:
+        return error_response
+    return respond(handlers.predict_samples, data)
 
 
-def generate_conclusion(result):
-    """Generate human-readable conclusion in Indonesian"""
-    summary = result.get('summary', {})
-    hr = result.get('heart_rate', {})
-    af_events = result.get('af_events', [])
+@app.route('/api/predict-af/recording/<int:recording_id>', methods=['POST'])
+def predict_af_recording(recording_id):
+    """
+    Predict Atrial Fibrillation for a recording stored in the database
     
-    total_minutes = summary.get('total_analyzed_minutes', 0)
-    af_minutes = summary.get('af_minutes', 0)
-    af_count = summary.get('af_event_count', 0)
-    af_burden = summary.get('af_burden_percent', 0)
+    The biopotential batches are read directly from the Rails database
+    (AF_DATABASE_URL), so the samples do not travel as JSON.
+    
+    Request body (optional):
+    {
+        "sample_rate": 400,  // Override the recording's sample rate
+        "threshold": 0.5
+    }
+    
+    Response: same as /api/predict-af
+    """
+    data, error_response = read_json_body(silent=True)
+    if error_response is not None:
+        return error_response
+    return respond(handlers.predict_recording, recording_id, data)
+
+
+@app.route('/api/predict-af/recording/<int:recording_id>/range', methods=['POST'])
+def predict_af_recording_range(recording_id):
+    """
+    Predict Atrial Fibrillation for a time range of a recording
     
-    hr_min = hr.get('min_bpm', 0)
-    hr_avg = hr.get('avg_bpm', 0)
-    hr_max = hr.get('max_bpm', 0)
+    Only the requested range of the stored 250 Hz signal is read from the
+    signal store. Recordings not yet in the store are loaded once from
+    the database (AF_DATABASE_URL) and stored.
     
-    lines = []
+    Request body:
+    {
+        "start_seconds": 600,
+        "end_seconds": 900,  // Optional, default end of recording
+        "threshold": 0.5
+    }
     
-    # Recording summary
-    lines.append(f"📊 Analisis EKG: {total_minutes:.1f} menit data telah dianalisis.")
+    Response: same as /api/predict-af, with event and trend times relative
+    to the start of the recording, plus "range"
+    """
+    data, error_response = read_json_body(silent=True)
+    if error_response is not None:
+        return error_response
+    return respond(handlers.predict_recording_range, recording_id, data)
+
+
+@app.route('/api/signal/recording/<int:recording_id>', methods=['POST'])
+def append_recording_signal(recording_id):
+    """
+    Append samples to a recording in the signal store
     
-    # AF findings
-    if af_count > 0:
-        lines.append(f"\n⚠️ TERDETEKSI AF: {af_count} episode Atrial Fibrillation dengan total durasi {af_minutes:.1f} menit ({af_burden:.1f}% dari total rekaman).")
-        
-        if len(af_events) > 0:
-            lines.append("\nDetail episode AF:")
-            for i, event in enumerate(af_events[:5], 1):  # Show max 5 events
-                start = event.get('start_seconds', 0)
-                end = event.get('end_seconds', 0)
-                duration = event.get('duration_seconds', 0)
-                confidence = event.get('confidence', 0)
-                
-                # Convert to time format
-                start_min = int(start // 60)
-                start_sec = int(start % 60)
-                end_min = int(end // 60)
-                end_sec = int(end % 60)
-                
-                lines.append(f"  {i}. {start_min:02d}:{start_sec:02d} - {end_min:02d}:{end_sec:02d} (durasi: {duration:.0f} detik, confidence: {confidence:.0%})")
-            
-            if len(af_events) > 5:
-                lines.append(f"  ... dan {len(af_events) - 5} episode lainnya")
-    else:
-        lines.append("\n✅ TIDAK TERDETEKSI AF: Tidak ditemukan episode Atrial Fibrillation.")
+    Lets a recording be stored while it is still being uploaded, so range
+    analysis does not need the database.
     
-    # Heart rate summary
-    lines.append(f"\n❤️ Denyut Jantung:")
-    lines.append(f"   • Minimum: {hr_min:.0f} BPM")
-    lines.append(f"   • Rata-rata: {hr_avg:.0f} BPM")
-    lines.append(f"   • Maksimum: {hr_max:.0f} BPM")
+    Request body:
+    {
+        "samples": [0.1, 0.2, ...],
+        "sample_rate": 400,
+        "final": false  // true once the recording is complete
+    }
+    
+    Response:
+    {
+        "status": "success",
+        "recording": {"device_samples": ..., "model_samples": ..., "final": false, ...}
+    }
+    """
+    data, error_response = read_json_body()
+    if error_response is not None:
+        return error_response
+    return respond(handlers.append_signal, recording_id, data)
+
+
+@app.route('/api/waveform/recording/<int:recording_id>/pyramid', methods=['POST'])
+def build_recording_pyramid(recording_id):
+    """
+    Build (or rebuild) the min/max waveform pyramid of a database recording
     
-    # Recommendations
-    lines.append("\n📋 CATATAN:")
-    lines.append("Hasil ini adalah prediksi AI dan HARUS dikonfirmasi oleh dokter spesialis jantung.")
+    Request body (optional):
+    {
+        "resample": false  // true: pyramid of the 250 Hz preprocessed signal
+    }
+    
+    Response:
+    {
+        "status": "success",
+        "pyramid": {"sample_rate": 400, "length": ..., "levels": [1, 8, 64, 512], ...}
+    }
+    """
+    data, error_response = read_json_body(silent=True)
+    if error_response is not None:
+        return error_response
+    return respond(handlers.build_pyramid, recording_id, data)
+
+
+@app.route('/api/waveform/recording/<int:recording_id>/tile', methods=['GET'])
+def recording_waveform_tile(recording_id):
+    """
+    Waveform tile for a time range at one pyramid level
     
-    if af_count > 0:
-        lines.append("Disarankan untuk konsultasi lebih lanjut dengan dokter untuk evaluasi dan tatalaksana.")
+    Query parameters:
+        level: Decimation factor (1, 8, 64, 512)
+        start: Start time in seconds (default 0)
+        end: End time in seconds (default end of recording)
     
-    return '\n'.join(lines)
+    The pyramid is built from the database on first access. Values are
+    int16; the signal value is value * scale + offset. Level 1 returns
+    "values", coarser levels "min" and "max" per bucket.
+    """
+    return respond(handlers.waveform_tile, recording_id, request.args)
+
+
+@app.route('/api/embeddings/recording/<int:recording_id>/similar', methods=['POST'])
+def similar_recording_episodes(recording_id):
+    """
+    Find episodes in other recordings similar to a time range of this one
+    
+    Uses the window embeddings stored when recordings are predicted with
+    AF_EMBEDDING_INDEX=true (/api/predict-af/recording/<id>).
+    
+    Request body:
+    {
+        "start_seconds": 600,
+        "end_seconds": 660,     // Optional, default end of recording
+        "k": 10,
+        "mode": "approximate",  // or "exact"
+        "nprobe": 16
+    }
+    
+    Response:
+    {
+        "status": "success",
+        "search_ms": 2.1,
+        "episodes": [{"recording_id": 7, "start_seconds": ..., "end_seconds": ..., "score": 0.93, ...}]
+    }
+    """
+    data, error_response = read_json_body(silent=True)
+    if error_response is not None:
+        return error_response
+    return respond(handlers.similar_episodes, recording_id, data)
+
+
+@app.route('/api/embeddings/build', methods=['POST'])
+def build_embedding_index():
+    """
+    Build the approximate search structure (IVF-PQ) of the embedding index
+    
+    Request body (optional):
+    {
+        "n_lists": null,     // default sqrt(indexed windows)
+        "n_subvectors": 16
+    }
+    """
+    data, error_response = read_json_body(silent=True)
+    if error_response is not None:
+        return error_response
+    return respond(handlers.build_embedding_index, data)
 
 
 if __name__ == '__main__':
@@ -264,6 +313,13 @@ if __name__ == '__main__':
     print("API Endpoints:")
     print("  GET  /health          - Health check")
     print("  POST /api/predict-af  - Predict AF from ECG")
+    print("  POST /api/predict-af/recording/<id> - Predict AF from database recording")
+    print("  POST /api/predict-af/recording/<id>/range - Predict AF for a time range")
+    print("  POST /api/signal/recording/<id> - Append samples to the signal store")
+    print("  POST /api/waveform/recording/<id>/pyramid - Build waveform pyramid")
+    print("  GET  /api/waveform/recording/<id>/tile    - Waveform tile")
+    print("  POST /api/embeddings/recording/<id>/similar - Similar episodes")
+    print("  POST /api/embeddings/build - Build approximate embedding search")
     print("=" * 60)
     
     app.run(host=HOST, port=PORT, debug=DEBUG)
@@ -0,0 +1,259 @@
+"""
+AF Prediction API Server (ASGI)
+
+The endpoints of app.py served by Starlette under uvicorn. Request bodies
+are received asynchronously, so a slow upload holds a coroutine rather
+than a worker. Decoding, JSON parsing, the request handler and response
+encoding run as one job in an executor, with at most AF_ASGI_CPU_WORKERS
+jobs at a time; further requests wait on the event loop, so a single
+process can keep many client connections open while the CPU cores stay
+busy with inference.
+
+Executor (AF_ASGI_EXECUTOR):
+- thread (default): one model in memory; NumPy, SciPy and TensorFlow
+  release the GIL in their heavy loops
+- process: one model per worker process (more memory, no shared GIL);
+  the signal store and embedding index serialize appends across the
+  processes with file locks
+
+Usage:
+    python asgi_app.py
+    # or: uvicorn asgi_app:app --host 0.0.0.0 --port 5050
+"""
+
+import os
+import sys
+import io
+import json
+import asyncio
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import asynccontextmanager
+
+# FORCE LEGACY KERAS (IMPORTANT for TF 2.16+ loading models from TF 2.15)
+# This must be set before importing tensorflow/keras
+os.environ["TF_USE_LEGACY_KERAS"] = "1"
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response
+from starlette.routing import Route
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import handlers
+from handlers import ApiError
+from utils.request_decoding import (
+    read_body, BodyDecodingError, BodyTooLarge, UnsupportedEncoding, DEFAULT_MAX_BODY_BYTES
+)
+
+# Largest request body accepted (raw while receiving, decoded while decompressing)
+MAX_BODY_BYTES = int(os.environ.get('AF_API_MAX_BODY_BYTES', DEFAULT_MAX_BODY_BYTES))
+
+CPU_WORKERS = int(os.environ.get('AF_ASGI_CPU_WORKERS', os.cpu_count() or 1))
+EXECUTOR_KIND = os.environ.get('AF_ASGI_EXECUTOR', 'thread').lower()
+
+executor = None
+cpu_slots = None
+
+
+def decode_json(body, content_encoding=None, silent=False):
+    """Decode a raw request body to JSON (same rules as app.read_json_body)"""
+    if content_encoding and content_encoding.strip().lower() != 'identity':
+        try:
+            body = read_body(io.BytesIO(body), content_encoding, MAX_BODY_BYTES)
+        except UnsupportedEncoding as e:
+            raise ApiError(str(e), 415)
+        except BodyTooLarge as e:
+            raise ApiError(str(e), 413)
+        except BodyDecodingError as e:
+            raise ApiError(str(e), 400)
+    
+    if not body:
+        return None
+    
+    try:
+        return json.loads(body)
+    except ValueError:
+        if silent:
+            return None
+        raise ApiError('Invalid JSON body')
+
+
+def run_job(handler, args, body=None, content_encoding=None, silent=False):
+    """
+    Executor side of a request: decode the body, run the handler and
+    encode the response
+    
+    Returns:
+        (JSON bytes, HTTP status)
+    """
+    try:
+        if body is not None:
+            args = args + (decode_json(body, content_encoding, silent),)
+        payload, status = handler(*args), 200
+    except ApiError as e:
+        payload, status = e.payload, e.status
+    except Exception as e:
+        import traceback
+        payload, status = {
+            'status': 'error',
+            'message': str(e),
+            'traceback': traceback.format_exc()
+        }, 500
+    return json.dumps(payload).encode('utf-8'), status
+
+
+async def receive_body(request):
+    """Receive the raw request body without blocking the event loop"""
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > MAX_BODY_BYTES:
+            raise ApiError(f'Request body exceeds {MAX_BODY_BYTES} bytes', 413)
+    # json.loads and BytesIO take the bytearray as is (no copy)
+    return body
+
+
+async def call_handler(handler, *args, request=None, silent=False):
+    """Run a handler in the executor (bounded by cpu_slots) and build the response"""
+    body = content_encoding = None
+    if request is not None:
+        try:
+            body = await receive_body(request)
+        except ApiError as e:
+            return Response(json.dumps(e.payload), status_code=e.status, media_type='application/json')
+        content_encoding = request.headers.get('content-encoding')
+    
+    async with cpu_slots:
+        content, status = await asyncio.get_running_loop().run_in_executor(
+            executor, run_job, handler, args, body, content_encoding, silent
+        )
+    return Response(content, status_code=status, media_type='application/json')
+
+
+async def health_check(request):
+    """Health check endpoint"""
+    return await call_handler(handlers.health)
+
+
+async def predict_af(request):
+    """Predict Atrial Fibrillation from ECG signal (see app.predict_af)"""
+    return await call_handler(handlers.predict_samples, request=request)
+
+
+async def predict_af_recording(request):
+    """Predict Atrial Fibrillation for a database recording (see app.predict_af_recording)"""
+    recording_id = request.path_params['recording_id']
+    return await call_handler(handlers.predict_recording, recording_id, request=request, silent=True)
+
+
+async def predict_af_recording_range(request):
+    """Predict Atrial Fibrillation for a time range (see app.predict_af_recording_range)"""
+    recording_id = request.path_params['recording_id']
+    return await call_handler(handlers.predict_recording_range, recording_id, request=request, silent=True)
+
+
+async def append_recording_signal(request):
+    """Append samples to the signal store (see app.append_recording_signal)"""
+    recording_id = request.path_params['recording_id']
+    return await call_handler(handlers.append_signal, recording_id, request=request)
+
+
+async def build_recording_pyramid(request):
+    """Build the waveform pyramid (see app.build_recording_pyramid)"""
+    recording_id = request.path_params['recording_id']
+    return await call_handler(handlers.build_pyramid, recording_id, request=request, silent=True)
+
+
+async def recording_waveform_tile(request):
+    """Waveform tile (see app.recording_waveform_tile)"""
+    recording_id = request.path_params['recording_id']
+    return await call_handler(handlers.waveform_tile, recording_id, dict(request.query_params))
+
+
+async def similar_recording_episodes(request):
+    """Similar episodes (see app.similar_recording_episodes)"""
+    recording_id = request.path_params['recording_id']
+    return await call_handler(handlers.similar_episodes, recording_id, request=request, silent=True)
+
+
+async def build_embedding_index(request):
+    """Build the approximate embedding search (see app.build_embedding_index)"""
+    return await call_handler(handlers.build_embedding_index, request=request, silent=True)
+
+
+def warm_up():
+    """Load the model in an executor worker before its first request"""
+    try:
+        handlers.get_af_predictor()
+    except Exception:
+        # Reported by the requests that need the model, as in app.py
+        pass
+
+
+def create_executor():
+    if EXECUTOR_KIND == 'process':
+        # spawn: TensorFlow state does not survive fork; each worker loads its own model
+        return ProcessPoolExecutor(
+            max_workers=CPU_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=warm_up
+        )
+    if EXECUTOR_KIND == 'thread':
+        return ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix='af-cpu')
+    raise ValueError(f"Unknown AF_ASGI_EXECUTOR: {EXECUTOR_KIND} (thread or process)")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global executor, cpu_slots
+    executor = create_executor()
+    cpu_slots = asyncio.Semaphore(CPU_WORKERS)
+    
+    if EXECUTOR_KIND == 'thread':
+        # Load the model before the first request instead of inside it
+        await asyncio.get_running_loop().run_in_executor(executor, warm_up)
+    
+    yield
+    
+    executor.shutdown(wait=True)
+
+
+routes = [
+    Route('/health', health_check, methods=['GET']),
+    Route('/api/predict-af', predict_af, methods=['POST']),
+    Route('/api/predict-af/recording/{recording_id:int}', predict_af_recording, methods=['POST']),
+    Route('/api/predict-af/recording/{recording_id:int}/range', predict_af_recording_range, methods=['POST']),
+    Route('/api/signal/recording/{recording_id:int}', append_recording_signal, methods=['POST']),
+    Route('/api/waveform/recording/{recording_id:int}/pyramid', build_recording_pyramid, methods=['POST']),
+    Route('/api/waveform/recording/{recording_id:int}/tile', recording_waveform_tile, methods=['GET']),
+    Route('/api/embeddings/recording/{recording_id:int}/similar', similar_recording_episodes, methods=['POST']),
+    Route('/api/embeddings/build', build_embedding_index, methods=['POST']),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    
+    # Configuration
+    HOST = os.environ.get('AF_API_HOST', '0.0.0.0')
+    PORT = int(os.environ.get('AF_API_PORT', 5050))
+    
+    print("=" * 60)
+    print("AF Prediction API Server (ASGI)")
+    print("=" * 60)
+    print(f"Host: {HOST}")
+    print(f"Port: {PORT}")
+    print(f"Executor: {EXECUTOR_KIND} ({CPU_WORKERS} workers)")
+    print("=" * 60)
+    
+    uvicorn.run(app, host=HOST, port=PORT, log_level='info')
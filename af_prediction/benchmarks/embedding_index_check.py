@@ -0,0 +1,98 @@
+"""
+Embedding index search check
+
+Fills a temporary EmbeddingIndex with synthetic window embeddings
+(ReLU-like 64-d vectors drawn around cluster centres, 2000 windows per
+recording), builds the IVF-PQ structure and compares approximate search
+with exact search:
+- recall@k: fraction of the exact top-k windows also returned by the
+  approximate search (queries are single windows plus noise)
+- mean query latency of both modes
+
+Exit code 1 when recall@k is below --min-recall.
+
+Usage:
+    python benchmarks/embedding_index_check.py                  # 500k windows
+    python benchmarks/embedding_index_check.py --windows 2000000 --nprobe 32
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.embedding_index import EmbeddingIndex
+
+WINDOWS_PER_RECORDING = 2000
+
+
+def fill_index(index, n_windows, dim=64, n_clusters=300, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = np.maximum(rng.normal(size=(n_clusters, dim)), 0)
+    for recording_id, start in enumerate(range(0, n_windows, WINDOWS_PER_RECORDING)):
+        n = min(WINDOWS_PER_RECORDING, n_windows - start)
+        embeddings = np.maximum(centres[rng.integers(0, n_clusters, n)] + 0.3 * rng.normal(size=(n, dim)), 0)
+        index.add(recording_id, embeddings, np.arange(n) * 5.0, rng.random(n))
+
+
+def timed_search(index, queries, **kwargs):
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append({hit['id'] for hit in index.search(query, **kwargs)})
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare approximate (IVF-PQ) and exact embedding search')
+    parser.add_argument('--windows', type=int, default=500000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--nprobe', type=int, default=16)
+    parser.add_argument('--refine', type=int, default=500)
+    parser.add_argument('--min-recall', type=float, default=0.95)
+    args = parser.parse_args()
+    
+    print("=" * 60)
+    print("Embedding index search check")
+    print("=" * 60)
+    
+    root = tempfile.mkdtemp(prefix='af_embeddings_')
+    try:
+        index = EmbeddingIndex(root)
+        
+        start = time.perf_counter()
+        fill_index(index, args.windows)
+        print(f"Indexed windows: {len(index)} ({time.perf_counter() - start:.1f}s)")
+        
+        start = time.perf_counter()
+        summary = index.build_ivf()
+        print(f"IVF-PQ build: {summary['n_lists']} lists, {summary['bytes_per_vector']} B/vector "
+              f"({time.perf_counter() - start:.1f}s)")
+        
+        rng = np.random.default_rng(1)
+        vectors = index.vectors()
+        queries = [np.asarray(vectors[i]) + 0.05 * rng.normal(size=vectors.shape[1])
+                   for i in rng.integers(0, len(vectors), args.queries)]
+        
+        exact, exact_ms = timed_search(index, queries, k=args.k, mode='exact')
+        approx, approx_ms = timed_search(index, queries, k=args.k, nprobe=args.nprobe, refine=args.refine)
+        recall = float(np.mean([len(e & a) / args.k for e, a in zip(exact, approx)]))
+        
+        print(f"\n  {'exact_ms':<16} {exact_ms:.2f}")
+        print(f"  {'approximate_ms':<16} {approx_ms:.2f} ({exact_ms / approx_ms:.1f}x faster)")
+        print(f"  {f'recall@{args.k}':<16} {recall:.3f}")
+    finally:
+        shutil.rmtree(root)
+    
+    if recall < args.min_recall:
+        print(f"\n✗ recall@{args.k} below {args.min_recall}")
+        sys.exit(1)
+    print(f"\n✓ Approximate search recall@{args.k} ≥ {args.min_recall}")
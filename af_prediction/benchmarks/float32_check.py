@@ -0,0 +1,165 @@
+"""
+Float32 vs float64 pipeline check
+
+The signal pipeline runs in float32 end to end (preprocess_signal,
+create_windows, signal quality, QRSDetector). This script runs the same
+synthetic recordings through the float32 path and a float64 reference
+path and checks that results agree within tolerance:
+- preprocessed signal: max absolute difference (signal is in [-1, 1])
+- signal-quality mask: fraction of windows with the same decision
+- R-peaks: fraction of float64 peaks found within 1 sample in float32
+- heart rate: average BPM difference (min/max BPM are single-beat
+  extremes, so one borderline beat moves them; reported only)
+- AF window probabilities (with TensorFlow, random-init model)
+
+It also reports the traced peak memory (tracemalloc) of preprocessing
+plus R-peak detection for both paths.
+
+Exit code 1 when any check is out of tolerance.
+
+Usage:
+    python benchmarks/float32_check.py                   # 1m, 1h at 400 Hz
+    python benchmarks/float32_check.py --lengths 24h --rates 250 400
+"""
+
+import sys
+import argparse
+import tracemalloc
+
+import numpy as np
+
+from synthetic_ecg import generate_ecg
+from run_benchmarks import LENGTHS, MODEL_SAMPLE_RATE, build_predictor, reference_preprocess
+from models.qrs_detector import QRSDetector
+from models.hr_calculator import HeartRateCalculator
+from models.signal_quality import assess_windows
+
+TOLERANCES = {
+    'signal_max_abs_diff': 1e-4,
+    'quality_agreement': 0.999,  # min
+    'peak_agreement': 0.999,     # min
+    'avg_bpm_diff': 0.5,
+    'probability_max_abs_diff': 1e-3,
+}
+
+
+def sliding_windows(signal, window_size=2500, step=1250):
+    return np.lib.stride_tricks.sliding_window_view(signal, window_size)[::step]
+
+
+def peak_agreement(reference, peaks, max_offset=1):
+    """Fraction of reference peaks with a peak within max_offset samples"""
+    if len(reference) == 0:
+        return 1.0 if len(peaks) == 0 else 0.0
+    if len(peaks) == 0:
+        return 0.0
+    idx = np.clip(np.searchsorted(peaks, reference), 1, len(peaks) - 1)
+    nearest = np.minimum(np.abs(peaks[idx] - reference), np.abs(peaks[idx - 1] - reference))
+    return float(np.mean(nearest <= max_offset))
+
+
+def traced_peak(func, *args):
+    """Peak traced allocation (bytes) while running func"""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        result = func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, result
+
+
+def run_path(samples, sample_rate, dtype, predictor):
+    if predictor is not None:
+        signal = predictor.preprocess_signal(samples, sample_rate, dtype=dtype)
+    else:
+        signal = reference_preprocess(samples, sample_rate, dtype=dtype)
+    return signal, QRSDetector(MODEL_SAMPLE_RATE).detect(signal)
+
+
+def check_case(length_name, sample_rate, predictor):
+    duration = LENGTHS[length_name]
+    samples, _ = generate_ecg(duration, sample_rate=sample_rate, heart_rate=90,
+                              af=True, seed=duration + sample_rate)
+    
+    memory = {}
+    outputs = {}
+    for dtype in (np.float64, np.float32):
+        memory[dtype], outputs[dtype] = traced_peak(run_path, samples, sample_rate, dtype, predictor)
+    
+    signal64, peaks64 = outputs[np.float64]
+    signal32, peaks32 = outputs[np.float32]
+    
+    metrics = {
+        'signal_dtype': str(signal32.dtype),
+        'signal_max_abs_diff': float(np.max(np.abs(signal32.astype(np.float64) - signal64))),
+        'quality_agreement': float(np.mean(
+            assess_windows(sliding_windows(signal32), MODEL_SAMPLE_RATE)['usable']
+            == assess_windows(sliding_windows(signal64), MODEL_SAMPLE_RATE)['usable']
+        )),
+        'peak_agreement': peak_agreement(peaks64, peaks32),
+    }
+    
+    hr_calc = HeartRateCalculator(MODEL_SAMPLE_RATE)
+    hr64 = hr_calc.calculate_statistics(signal64)['heart_rate']
+    hr32 = hr_calc.calculate_statistics(signal32)['heart_rate']
+    metrics['avg_bpm_diff'] = abs(hr32['avg_bpm'] - hr64['avg_bpm'])
+    metrics['min_max_bpm_diff'] = max(abs(hr32[k] - hr64[k]) for k in ('min_bpm', 'max_bpm'))
+    
+    if predictor is not None:
+        windows32, _ = predictor.create_windows(signal32)
+        windows64, _ = predictor.create_windows(signal64)
+        metrics['probability_max_abs_diff'] = float(np.max(np.abs(
+            predictor.predict_windows(windows32) - predictor.predict_windows(windows64)
+        )))
+    
+    failures = []
+    for name, value in metrics.items():
+        if name not in TOLERANCES:
+            continue
+        limit = TOLERANCES[name]
+        ok = value >= limit if name.endswith('agreement') else value <= limit
+        if not ok:
+            failures.append(name)
+    
+    return {
+        'case': f'{length_name}@{sample_rate}Hz',
+        'metrics': metrics,
+        'peak_memory_bytes': {'float64': memory[np.float64], 'float32': memory[np.float32]},
+        'failures': failures
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the float32 pipeline against float64')
+    parser.add_argument('--lengths', nargs='+', choices=list(LENGTHS), default=['1m', '1h'])
+    parser.add_argument('--rates', nargs='+', type=int, default=[400])
+    args = parser.parse_args()
+    
+    print("=" * 72)
+    print("Float32 vs float64 pipeline check")
+    print("=" * 72)
+    
+    predictor = build_predictor()
+    failed = False
+    
+    for length_name in args.lengths:
+        for sample_rate in args.rates:
+            result = check_case(length_name, sample_rate, predictor)
+            memory = result['peak_memory_bytes']
+            
+            print(f"\n{result['case']}")
+            for name, value in result['metrics'].items():
+                flag = ' ✗' if name in result['failures'] else ''
+                print(f"  {name:<26} {value}{flag}")
+            print(f"  {'peak_memory_float64':<26} {memory['float64'] / 2**20:.1f} MiB")
+            print(f"  {'peak_memory_float32':<26} {memory['float32'] / 2**20:.1f} MiB "
+                  f"({memory['float32'] / memory['float64']:.2f}x)")
+            
+            failed = failed or bool(result['failures'])
+    
+    if failed:
+        print("\n✗ float32 results out of tolerance")
+        sys.exit(1)
+    print("\n✓ float32 results match float64 within tolerance")
@@ -0,0 +1,399 @@
+"""
+HTTP load test for the AF Prediction API
+
+Replays a realistic request mix against a running server (python app.py
+or gunicorn): mostly short recordings plus a fraction of multi-hour
+ones, at 250 and 400 Hz, built from the deterministic synthetic ECG
+generator. Requests are issued either closed-loop (each of --concurrency
+clients sends its next request as soon as the last one finishes) or
+open-loop with Poisson arrivals at --rate requests/sec. Open-loop
+latency is measured from the scheduled arrival, so time an arrival
+waits for the client counts; an arrival finding --concurrency requests
+in flight is not sent and counted as dropped (an error), instead of
+delaying the arrivals after it.
+
+Reports throughput, p50/p95/p99 latency (overall and per request kind),
+error rate and, with --server-pid, the server's resident memory (the
+process plus its children, e.g. gunicorn workers) sampled over time.
+
+Usage:
+    python app.py &
+    python benchmarks/load_test.py --server-pid $! --concurrency 4 --requests 200
+    python benchmarks/load_test.py --rate 2 --duration 300 --long-fraction 0.05
+"""
+
+import os
+import gzip
+import zlib
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import requests
+
+from synthetic_ecg import generate_ecg
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+DEFAULT_URL = 'http://localhost:5050'
+
+
+def encode_body(body, content_encoding):
+    if content_encoding == 'gzip':
+        return gzip.compress(body, compresslevel=6)
+    if content_encoding == 'deflate':
+        return zlib.compress(body, 6)
+    if content_encoding == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    return body
+
+
+def build_payloads(kind, count, min_seconds, max_seconds, sample_rates, seed, content_encoding=None):
+    """
+    Pre-encode a pool of JSON request bodies for one request kind
+    
+    Encoding happens before the test starts so the client measures the
+    server, not json.dumps.
+    """
+    rng = random.Random(seed)
+    payloads = []
+    for i in range(count):
+        duration = rng.uniform(min_seconds, max_seconds)
+        sample_rate = sample_rates[i % len(sample_rates)]
+        af = i % 2 == 1
+        samples, _ = generate_ecg(duration, sample_rate=sample_rate,
+                                  heart_rate=110 if af else 70, af=af, seed=seed + i)
+        body = json.dumps({
+            'samples': np.round(samples, 4).tolist(),
+            'sample_rate': sample_rate
+        }).encode()
+        payloads.append({
+            'kind': kind,
+            'sample_rate': sample_rate,
+            'samples': len(samples),
+            'body': encode_body(body, content_encoding),
+            'content_encoding': content_encoding
+        })
+    return payloads
+
+
+def process_tree_rss(pid):
+    """Resident memory (bytes) of a process and all its descendants (Linux /proc)"""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+    return total
+
+
+class RSSSampler(threading.Thread):
+    """Background thread sampling server RSS every `interval` seconds"""
+    
+    def __init__(self, pid, interval=1.0):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []  # (seconds since start, rss bytes)
+        self._stop_event = threading.Event()
+    
+    def run(self):
+        start = time.perf_counter()
+        while not self._stop_event.is_set():
+            self.samples.append((time.perf_counter() - start, process_tree_rss(self.pid)))
+            self._stop_event.wait(self.interval)
+    
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def send_request(session, url, payload, timeout, scheduled=None):
+    """
+    POST one payload; returns a result record
+    
+    Latency is measured from `scheduled` (perf_counter time of the
+    open-loop arrival) when given, otherwise from the send.
+    """
+    start = time.perf_counter() if scheduled is None else scheduled
+    error = None
+    status = None
+    try:
+        headers = {'Content-Type': 'application/json'}
+        if payload['content_encoding']:
+            headers['Content-Encoding'] = payload['content_encoding']
+        response = session.post(url, data=payload['body'], timeout=timeout, headers=headers)
+        status = response.status_code
+        if status != 200:
+            error = f'HTTP {status}'
+        elif response.json().get('status') != 'success':
+            error = 'status != success'
+    except requests.RequestException as e:
+        error = type(e).__name__
+    
+    return {
+        'kind': payload['kind'],
+        'sample_rate': payload['sample_rate'],
+        'samples': payload['samples'],
+        'latency': time.perf_counter() - start,
+        'status': status,
+        'error': error
+    }
+
+
+def dropped_request(payload):
+    """Result record of an open-loop arrival that could not be sent"""
+    return {
+        'kind': payload['kind'],
+        'sample_rate': payload['sample_rate'],
+        'samples': payload['samples'],
+        'latency': 0.0,
+        'status': None,
+        'error': 'dropped'
+    }
+
+
+def latency_summary(latencies):
+    if not latencies:
+        return None
+    latencies = np.asarray(latencies)
+    return {
+        'count': len(latencies),
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p95_ms': float(np.percentile(latencies, 95) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+        'max_ms': float(np.max(latencies) * 1000)
+    }
+
+
+def run_load_test(url, payloads, long_payloads, long_fraction, concurrency, rate,
+                  n_requests, duration, timeout, seed):
+    """
+    Issue requests until n_requests are sent or duration seconds elapse
+    
+    rate == 0 runs closed-loop; otherwise arrivals are Poisson at `rate`/s
+    and arrivals finding `concurrency` requests in flight are dropped.
+    """
+    rng = random.Random(seed)
+    endpoint = f"{url.rstrip('/')}/api/predict-af"
+    local = threading.local()
+    results = []
+    lock = threading.Lock()
+    slots = threading.Semaphore(concurrency)
+    
+    def worker(payload, scheduled=None):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        try:
+            result = send_request(local.session, endpoint, payload, timeout, scheduled)
+            with lock:
+                results.append(result)
+        finally:
+            slots.release()
+    
+    def next_payload():
+        if long_payloads and rng.random() < long_fraction:
+            return rng.choice(long_payloads)
+        return rng.choice(payloads)
+    
+    start = time.perf_counter()
+    next_arrival = start
+    sent = 0
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            if n_requests and sent >= n_requests:
+                break
+            if duration and time.perf_counter() - start >= duration:
+                break
+            
+            if rate > 0:
+                next_arrival += rng.expovariate(rate)
+                delay = next_arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                
+                # Open loop: an arrival never waits for a free slot
+                payload = next_payload()
+                if slots.acquire(blocking=False):
+                    executor.submit(worker, payload, next_arrival)
+                else:
+                    with lock:
+                        results.append(dropped_request(payload))
+            else:
+                # Blocks while `concurrency` requests are in flight
+                slots.acquire()
+                executor.submit(worker, next_payload())
+            sent += 1
+    
+    return results, time.perf_counter() - start
+
+
+def summarize(results, elapsed, rss_samples):
+    latencies = [r['latency'] for r in results if r['error'] is None]
+    errors = [r for r in results if r['error'] is not None]
+    dropped = sum(r['error'] == 'dropped' for r in results)
+    
+    summary = {
+        'requests': len(results),
+        'dropped': dropped,
+        'elapsed_seconds': elapsed,
+        'throughput_rps': (len(results) - dropped) / elapsed if elapsed > 0 else 0.0,
+        'samples_per_sec': sum(r['samples'] for r in results if r['error'] is None) / elapsed if elapsed > 0 else 0.0,
+        'error_rate': len(errors) / len(results) if results else 0.0,
+        'errors': {},
+        'latency': latency_summary(latencies),
+        'by_kind': {}
+    }
+    
+    for r in errors:
+        summary['errors'][r['error']] = summary['errors'].get(r['error'], 0) + 1
+    
+    for kind in sorted({r['kind'] for r in results}):
+        for sample_rate in sorted({r['sample_rate'] for r in results if r['kind'] == kind}):
+            group = [r for r in results if r['kind'] == kind and r['sample_rate'] == sample_rate]
+            stats = latency_summary([r['latency'] for r in group if r['error'] is None]) or {}
+            stats['errors'] = sum(r['error'] is not None for r in group)
+            summary['by_kind'][f'{kind}@{sample_rate}Hz'] = stats
+    
+    if rss_samples:
+        rss = np.array([value for _, value in rss_samples])
+        summary['server_rss'] = {
+            'start_mb': float(rss[0] / 2**20),
+            'peak_mb': float(rss.max() / 2**20),
+            'end_mb': float(rss[-1] / 2**20),
+            'timeline': [[round(t, 2), int(value)] for t, value in rss_samples]
+        }
+    
+    return summary
+
+
+def print_summary(summary):
+    print("\n" + "=" * 60)
+    print("LOAD TEST RESULTS")
+    print("=" * 60)
+    print(f"{'Requests':<24} {summary['requests']:>10d}")
+    if summary['dropped']:
+        print(f"{'Dropped (open-loop)':<24} {summary['dropped']:>10d}")
+    print(f"{'Elapsed (s)':<24} {summary['elapsed_seconds']:>10.1f}")
+    print(f"{'Throughput (req/s)':<24} {summary['throughput_rps']:>10.2f}")
+    print(f"{'Samples/sec':<24} {summary['samples_per_sec']:>10.0f}")
+    print(f"{'Error rate':<24} {summary['error_rate']:>10.2%}")
+    for error, count in summary['errors'].items():
+        print(f"  {error}: {count}")
+    
+    if summary['latency']:
+        print(f"\n{'Latency (ms)':<18} {'p50':>9} {'p95':>9} {'p99':>9} {'n':>6}")
+        print("-" * 55)
+        rows = [('all', summary['latency'])] + list(summary['by_kind'].items())
+        for name, stats in rows:
+            if 'p50_ms' not in stats:
+                continue
+            print(f"{name:<18} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} "
+                  f"{stats['p99_ms']:>9.1f} {stats['count']:>6d}")
+    
+    if 'server_rss' in summary:
+        rss = summary['server_rss']
+        print(f"\nServer RSS: start {rss['start_mb']:.0f} MB, "
+              f"peak {rss['peak_mb']:.0f} MB, end {rss['end_mb']:.0f} MB")
+    print("=" * 60)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the AF prediction API')
+    parser.add_argument('--url', default=DEFAULT_URL)
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='Maximum requests in flight (open-loop arrivals beyond it are dropped)')
+    parser.add_argument('--rate', type=float, default=0.0,
+                        help='Poisson arrival rate (req/s); 0 = closed-loop')
+    parser.add_argument('--requests', type=int, default=100, help='Stop after this many requests (0 = no limit)')
+    parser.add_argument('--duration', type=float, default=0.0, help='Stop after this many seconds (0 = no limit)')
+    parser.add_argument('--short-seconds', type=float, nargs=2, default=[30, 600],
+                        metavar=('MIN', 'MAX'), help='Length range of short recordings')
+    parser.add_argument('--long-hours', type=float, nargs=2, default=[2, 6],
+                        metavar=('MIN', 'MAX'), help='Length range of multi-hour recordings')
+    parser.add_argument('--long-fraction', type=float, default=0.02,
+                        help='Fraction of requests that are multi-hour recordings')
+    parser.add_argument('--sample-rates', type=int, nargs='+', default=[250, 400])
+    parser.add_argument('--pool-size', type=int, default=8, help='Distinct short payloads to generate')
+    parser.add_argument('--long-pool-size', type=int, default=2, help='Distinct multi-hour payloads to generate')
+    parser.add_argument('--content-encoding', choices=['gzip', 'deflate', 'zstd'], default=None,
+                        help='Compress request bodies')
+    parser.add_argument('--timeout', type=float, default=600.0, help='Per-request timeout (s)')
+    parser.add_argument('--server-pid', type=int, default=None, help='Server PID for RSS sampling')
+    parser.add_argument('--rss-interval', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='Results JSON (default: benchmarks/results/<timestamp>.json)')
+    args = parser.parse_args()
+    
+    if not args.requests and not args.duration:
+        parser.error('set --requests and/or --duration')
+    
+    print("=" * 60)
+    print("AF Prediction API Load Test")
+    print("=" * 60)
+    print(f"Target: {args.url}")
+    print(f"Mode: {'open-loop %.2f req/s' % args.rate if args.rate > 0 else 'closed-loop'}, "
+          f"concurrency {args.concurrency}")
+    
+    try:
+        health = requests.get(f"{args.url.rstrip('/')}/health", timeout=30).json()
+        print(f"✓ Server healthy (model loaded: {health.get('model_loaded')})")
+    except requests.RequestException as e:
+        print(f"✗ Server not reachable: {e}")
+        raise SystemExit(1)
+    
+    print("\nGenerating payloads...")
+    short_payloads = build_payloads('short', args.pool_size, *args.short_seconds,
+                                    args.sample_rates, args.seed, args.content_encoding)
+    long_payloads = []
+    if args.long_fraction > 0 and args.long_pool_size > 0:
+        long_payloads = build_payloads('long', args.long_pool_size,
+                                       args.long_hours[0] * 3600, args.long_hours[1] * 3600,
+                                       args.sample_rates, args.seed + 1000, args.content_encoding)
+    body_mb = sum(len(p['body']) for p in short_payloads + long_payloads) / 2**20
+    print(f"✓ {len(short_payloads)} short + {len(long_payloads)} long payloads ({body_mb:.0f} MB)")
+    
+    sampler = None
+    if args.server_pid:
+        sampler = RSSSampler(args.server_pid, args.rss_interval)
+        sampler.start()
+    
+    print("\nRunning...")
+    results, elapsed = run_load_test(
+        args.url, short_payloads, long_payloads, args.long_fraction,
+        args.concurrency, args.rate, args.requests, args.duration, args.timeout, args.seed
+    )
+    
+    if sampler is not None:
+        sampler.stop()
+    
+    summary = summarize(results, elapsed, sampler.samples if sampler else [])
+    summary['config'] = {k: v for k, v in vars(args).items() if k != 'output'}
+    summary['created_at'] = datetime.now().isoformat(timespec='seconds')
+    print_summary(summary)
+    
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"load_test_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f"✓ Results saved: {output}")
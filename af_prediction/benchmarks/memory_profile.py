@@ -0,0 +1,328 @@
+"""
+Peak-memory profile of the /api/predict-af flow on long recordings
+
+Runs the same steps as app.py's predict_af route on synthetic recordings
+of increasing length:
+  read_body -> json_decode -> to_array -> af_predict -> hr_preprocess
+  -> hr_statistics -> response_encode
+
+Every (length, pass) runs in a fresh process so peaks do not carry over:
+- RSS pass: peak RSS (high-water mark) after each stage, relative to
+  the RSS after imports and a warm-up request
+- tracemalloc pass: peak traced allocation inside each stage (NumPy
+  buffers and Python objects; TensorFlow's own allocator is not traced)
+
+The run fails (exit code 1) when the peak RSS growth exceeds
+--budget bytes per input sample for any length, so memory regressions
+are caught before they reach the VPS, and when a pass dies without a
+result (e.g. killed by the OOM killer) or exceeds --timeout seconds.
+
+Usage:
+    python benchmarks/memory_profile.py                          # 10m, 1h, 6h at 400 Hz
+    python benchmarks/memory_profile.py --lengths 1h 24h --budget 150
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import tracemalloc
+import multiprocessing
+from queue import Empty
+from datetime import datetime
+
+import numpy as np
+
+from synthetic_ecg import generate_ecg
+from run_benchmarks import BENCH_DIR, MODEL_SAMPLE_RATE, build_predictor, reference_preprocess
+
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+LENGTHS = {'10m': 600, '1h': 3600, '6h': 6 * 3600, '24h': 24 * 3600}
+
+# Peak RSS growth allowed per input sample (bytes)
+DEFAULT_BUDGET = 200
+
+# Longest a single profiling pass may run (seconds)
+DEFAULT_TIMEOUT = 3600
+
+STAGES = ['read_body', 'json_decode', 'to_array', 'af_predict',
+          'hr_preprocess', 'hr_statistics', 'response_encode']
+
+
+def _proc_status(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+def reset_peak_rss():
+    """
+    Start a new peak-RSS measurement; returns the current RSS in bytes
+    
+    On Linux the high-water mark (VmHWM) is reset through clear_refs;
+    ru_maxrss cannot be reset and even survives exec, so elsewhere the
+    current peak is used as the baseline instead.
+    """
+    if os.path.exists('/proc/self/clear_refs'):
+        try:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+            return _proc_status('VmRSS')
+        except OSError:
+            pass
+    return peak_rss()
+
+
+def peak_rss():
+    """Peak RSS of this process in bytes"""
+    if os.path.exists('/proc/self/status'):
+        return _proc_status('VmHWM')
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, other platforms KiB
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def run_flow(body_path, predictor, stage_hook):
+    """
+    The predict_af route, one stage at a time
+    
+    stage_hook(name) is called after each stage; intermediate results
+    are kept alive exactly as long as they are in app.py.
+    """
+    from models.hr_calculator import HeartRateCalculator
+    
+    hr_calc = HeartRateCalculator(MODEL_SAMPLE_RATE)
+    
+    with open(body_path, 'rb') as f:
+        body = f.read()
+    stage_hook('read_body')
+    
+    data = json.loads(body)
+    stage_hook('json_decode')
+    
+    sample_rate = int(data.get('sample_rate', 400))
+    samples_array = np.array(data.get('samples'), dtype=np.float32)
+    stage_hook('to_array')
+    
+    af_result = {}
+    if predictor is not None:
+        af_result = predictor.predict(samples_array, sample_rate, 0.5)
+        preprocessed = predictor.preprocess_signal(samples_array, sample_rate)
+    stage_hook('af_predict')
+    
+    if predictor is None:
+        preprocessed = reference_preprocess(samples_array, sample_rate)
+    stage_hook('hr_preprocess')
+    
+    hr_result = hr_calc.calculate_statistics(preprocessed)
+    stage_hook('hr_statistics')
+    
+    response = {
+        'status': 'success',
+        'af_detected': af_result.get('af_detected', False),
+        'af_events': af_result.get('af_events', []),
+        'summary': af_result.get('summary', {}),
+        'heart_rate': hr_result.get('heart_rate', {}),
+        'hrv_metrics': hr_result.get('hrv_metrics', {}),
+        'hr_trends': hr_result.get('trends', {}),
+        'r_peak_count': hr_result.get('r_peak_count', 0)
+    }
+    json.dumps(response)
+    stage_hook('response_encode')
+
+
+def warm_up(predictor):
+    """Run a short request so lazy TF/scipy allocations land in the baseline"""
+    samples, _ = generate_ecg(60, sample_rate=400, seed=1)
+    with tempfile.NamedTemporaryFile('wb', suffix='.json', delete=False) as f:
+        f.write(json.dumps({'samples': samples.tolist(), 'sample_rate': 400}).encode())
+    try:
+        run_flow(f.name, predictor, lambda name: None)
+    finally:
+        os.remove(f.name)
+    gc.collect()
+
+
+def profile_worker(body_path, mode, queue):
+    """Child process: one pass ('rss' or 'tracemalloc') over one recording"""
+    predictor = build_predictor()
+    warm_up(predictor)
+    stages = {}
+    
+    if mode == 'rss':
+        baseline = reset_peak_rss()
+        
+        def hook(name):
+            stages[name] = peak_rss() - baseline
+        
+        run_flow(body_path, predictor, hook)
+        queue.put({'baseline_rss': baseline, 'stages': stages,
+                   'model': predictor is not None})
+        return
+    
+    tracemalloc.start()
+    
+    def hook(name):
+        stages[name] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+    
+    tracemalloc.reset_peak()
+    run_flow(body_path, predictor, hook)
+    tracemalloc.stop()
+    queue.put({'stages': stages})
+
+
+def run_isolated(body_path, mode, timeout=DEFAULT_TIMEOUT):
+    """
+    Run one profile_worker pass in a fresh process
+    
+    Raises:
+        RuntimeError: the worker exited without a result (exception,
+            OOM kill) or was still running after `timeout` seconds
+    """
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=profile_worker, args=(body_path, mode, queue))
+    process.start()
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            try:
+                return queue.get(timeout=1.0)
+            except Empty:
+                pass
+            if process.exitcode is not None:
+                # A result put right before exiting may still be in the pipe
+                try:
+                    return queue.get(timeout=1.0)
+                except Empty:
+                    raise RuntimeError(f"{mode} pass exited with code {process.exitcode} without a result")
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{mode} pass still running after {timeout:g}s")
+    finally:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+
+
+def write_body(duration, sample_rate, seed):
+    """Encode a synthetic recording as a predict-af JSON body on disk"""
+    samples, _ = generate_ecg(duration, sample_rate=sample_rate, heart_rate=90, af=True, seed=seed)
+    n_samples = len(samples)
+    fd, path = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(json.dumps({'samples': np.round(samples, 4).tolist(), 'sample_rate': sample_rate}).encode())
+    return path, n_samples
+
+
+def profile_lengths(lengths, sample_rate, budget, use_tracemalloc=True, timeout=DEFAULT_TIMEOUT):
+    print("=" * 72)
+    print("AF Prediction Memory Profile")
+    print("=" * 72)
+    print(f"Sample rate: {sample_rate} Hz, budget: {budget} bytes/sample")
+    
+    results = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine()
+        },
+        'sample_rate': sample_rate,
+        'budget_bytes_per_sample': budget,
+        'cases': []
+    }
+    
+    for length_name in lengths:
+        body_path, n_samples = write_body(LENGTHS[length_name], sample_rate, seed=LENGTHS[length_name])
+        try:
+            start = time.perf_counter()
+            rss = run_isolated(body_path, 'rss', timeout)
+            traced = run_isolated(body_path, 'tracemalloc', timeout) if use_tracemalloc else {'stages': {}}
+            elapsed = time.perf_counter() - start
+            body_bytes = os.path.getsize(body_path)
+        except RuntimeError as e:
+            print(f"\n{length_name} @ {sample_rate} Hz: {n_samples} samples")
+            print(f"  ✗ {e}")
+            results['cases'].append({
+                'length': length_name,
+                'input_samples': n_samples,
+                'error': str(e),
+                'within_budget': False
+            })
+            continue
+        finally:
+            os.remove(body_path)
+        
+        peak = max(rss['stages'].values())
+        bytes_per_sample = peak / n_samples
+        case = {
+            'length': length_name,
+            'input_samples': n_samples,
+            'body_bytes': body_bytes,
+            'model': rss['model'],
+            'baseline_rss': rss['baseline_rss'],
+            'peak_rss_growth': peak,
+            'bytes_per_sample': bytes_per_sample,
+            'within_budget': bytes_per_sample <= budget,
+            'stages': {
+                name: {
+                    'rss_high_water': rss['stages'].get(name),
+                    'tracemalloc_peak': traced['stages'].get(name)
+                }
+                for name in STAGES
+            }
+        }
+        results['cases'].append(case)
+        
+        print(f"\n{length_name} @ {sample_rate} Hz: {n_samples} samples, "
+              f"body {body_bytes / 2**20:.0f} MB ({elapsed:.0f}s)")
+        if not rss['model']:
+            print("  (af_predict skipped: no TensorFlow)")
+        print(f"  {'Stage':<18} {'RSS high-water':>16} {'tracemalloc peak':>18}")
+        for name in STAGES:
+            stage = case['stages'][name]
+            traced_peak = stage['tracemalloc_peak']
+            traced_text = f"{traced_peak / 2**20:>15.1f} MB" if traced_peak is not None else f"{'-':>18}"
+            print(f"  {name:<18} {stage['rss_high_water'] / 2**20:>13.1f} MB {traced_text}")
+        mark = '✓' if case['within_budget'] else '✗'
+        print(f"  {mark} Peak growth {peak / 2**20:.0f} MB = {bytes_per_sample:.1f} bytes/sample")
+    
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Profile peak memory of the predict-af flow')
+    parser.add_argument('--lengths', nargs='+', choices=list(LENGTHS), default=['10m', '1h', '6h'])
+    parser.add_argument('--sample-rate', type=int, default=400)
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET,
+                        help='Maximum peak RSS growth per input sample (bytes)')
+    parser.add_argument('--no-tracemalloc', action='store_true', help='Skip the per-stage tracemalloc pass')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help='Maximum seconds per profiling pass')
+    parser.add_argument('--output', default=None, help='Results JSON (default: benchmarks/results/<timestamp>.json)')
+    args = parser.parse_args()
+    
+    results = profile_lengths(args.lengths, args.sample_rate, args.budget, not args.no_tracemalloc, args.timeout)
+    
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"memory_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✓ Results saved: {output}")
+    
+    over = [case['length'] for case in results['cases'] if not case['within_budget']]
+    if over:
+        print(f"✗ Over budget ({args.budget:.0f} bytes/sample) or failed: {', '.join(over)}")
+        sys.exit(1)
+    print("✓ All lengths within budget")
@@ -0,0 +1,101 @@
+"""
+Parallel vs single-core R-peak detection check
+
+Runs detect_qrs_parallel (overlapping segments in a process pool,
+stitched across the overlap) and the single-core QRSDetector on
+synthetic recordings, including noisy AF where the adaptive thresholds
+of neighbouring segments take longest to agree, and reports:
+- peaks only found by one of the two paths
+- wall-clock time of both paths
+
+The adaptive thresholds of neighbouring segments converge but are never
+bit-identical, so where the detector also fires on noise (sinus rhythm
+with 0.15 mV noise below) a small fraction of peaks can differ. Exit
+code 1 when a case has more than --max-mismatch (fraction of peaks)
+differing peaks.
+
+Usage:
+    python benchmarks/qrs_parallel_check.py                    # 3 h recordings, 4 workers
+    python benchmarks/qrs_parallel_check.py --hours 24 --n-jobs 8
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_ecg import generate_ecg
+from models.qrs_detector import QRSDetector, detect_qrs_parallel
+
+CASES = [
+    # (af, noise_std, heart_rate, seed)
+    (False, 0.02, 70, 0),
+    (False, 0.1, 70, 1),
+    (True, 0.05, 100, 2),
+    (True, 0.1, 90, 3),
+    (True, 0.2, 120, 4),
+    (False, 0.15, 60, 0),
+]
+
+
+def check_case(af, noise_std, heart_rate, seed, hours, sample_rate, n_jobs):
+    signal, _ = generate_ecg(hours * 3600, sample_rate=sample_rate, heart_rate=heart_rate,
+                             noise_std=noise_std, af=af, seed=seed)
+    
+    start = time.perf_counter()
+    single = QRSDetector(sample_rate).detect(signal)
+    single_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    parallel = detect_qrs_parallel(signal, sample_rate, n_jobs=n_jobs)
+    parallel_seconds = time.perf_counter() - start
+    
+    return {
+        'case': f"{'af' if af else 'sinus'} noise={noise_std} hr={heart_rate} seed={seed}",
+        'peaks': len(single),
+        'only_parallel': np.setdiff1d(parallel, single),
+        'only_single': np.setdiff1d(single, parallel),
+        'single_seconds': single_seconds,
+        'parallel_seconds': parallel_seconds
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare parallel and single-core R-peak detection')
+    parser.add_argument('--hours', type=int, default=3)
+    parser.add_argument('--sample-rate', type=int, default=250)
+    parser.add_argument('--n-jobs', type=int, default=4)
+    parser.add_argument('--max-mismatch', type=float, default=1e-3,
+                        help='Maximum fraction of differing peaks per case')
+    args = parser.parse_args()
+    
+    print("=" * 72)
+    print("Parallel vs single-core R-peak detection")
+    print("=" * 72)
+    
+    failed = False
+    for case in CASES:
+        result = check_case(*case, args.hours, args.sample_rate, args.n_jobs)
+        mismatch = len(result['only_parallel']) + len(result['only_single'])
+        ok = mismatch <= args.max_mismatch * result['peaks']
+        
+        print(f"\n{result['case']}")
+        print(f"  {'peaks':<18} {result['peaks']}")
+        print(f"  {'mismatched_peaks':<18} {mismatch} ({mismatch / result['peaks']:.1e}){'' if ok else ' ✗'}")
+        if mismatch:
+            print(f"  {'only_parallel':<18} {result['only_parallel'][:10].tolist()}")
+            print(f"  {'only_single':<18} {result['only_single'][:10].tolist()}")
+        print(f"  {'single_seconds':<18} {result['single_seconds']:.2f}")
+        print(f"  {'parallel_seconds':<18} {result['parallel_seconds']:.2f} ({args.n_jobs} workers)")
+        
+        failed = failed or not ok
+    
+    if failed:
+        print(f"\n✗ Parallel detection differs in more than {args.max_mismatch:.0e} of peaks")
+        sys.exit(1)
+    print(f"\n✓ Parallel detection matches single-core within {args.max_mismatch:.0e} of peaks")
@@ -0,0 +1,89 @@
+"""
+Signal-quality gate check
+
+Runs synthetic recordings through preprocessing and the window quality
+gate (models/signal_quality.py) and checks that:
+- readable ECG passes: sinus rhythm and AF at 60 and 110 BPM, clean and
+  moderately noisy (white noise std 0.1 mV against ~1 mV R-waves)
+- noise without ECG is rejected: white noise, random walk, 5-30 Hz
+  band-limited noise, slow motion-like oscillation
+
+Exit code 1 when a readable case passes fewer than --min-pass of its
+windows or a noise case more than --max-noise-pass.
+
+Usage:
+    python benchmarks/quality_gate_check.py
+    python benchmarks/quality_gate_check.py --rates 250 360 400 500
+"""
+
+import sys
+import argparse
+
+import numpy as np
+from scipy import signal as scipy_signal
+
+from synthetic_ecg import generate_ecg
+from run_benchmarks import MODEL_SAMPLE_RATE, reference_preprocess
+from models.signal_quality import assess_windows, rejection_counts
+
+DURATION_SECONDS = 600
+
+
+def sliding_windows(signal, window_size=2500, step=1250):
+    return np.lib.stride_tricks.sliding_window_view(signal, window_size)[::step]
+
+
+def readable_cases(sample_rate):
+    for af in (False, True):
+        for noise_std in (0.02, 0.1):
+            for heart_rate in (60, 110):
+                name = f"{'af' if af else 'sinus'} hr={heart_rate} noise={noise_std}"
+                samples, _ = generate_ecg(DURATION_SECONDS, sample_rate=sample_rate, heart_rate=heart_rate,
+                                          noise_std=noise_std, af=af, seed=heart_rate + sample_rate)
+                yield name, samples
+
+
+def noise_cases(sample_rate, seed=0):
+    rng = np.random.default_rng(seed)
+    n = DURATION_SECONDS * sample_rate
+    t = np.arange(n) / sample_rate
+    band = scipy_signal.butter(4, [5, 30], btype='band', fs=sample_rate, output='sos')
+    
+    yield 'white noise', rng.standard_normal(n)
+    yield 'random walk', np.cumsum(rng.standard_normal(n))
+    yield 'band noise 5-30 Hz', scipy_signal.sosfilt(band, rng.standard_normal(n))
+    yield 'motion 1-3 Hz', np.sin(2 * np.pi * 1.3 * t) + 0.5 * np.sin(2 * np.pi * 2.7 * t) + 0.2 * rng.standard_normal(n)
+
+
+def pass_rate(samples, sample_rate):
+    windows = sliding_windows(reference_preprocess(samples, sample_rate))
+    quality = assess_windows(windows, MODEL_SAMPLE_RATE)
+    return float(np.mean(quality['usable'])), rejection_counts(quality)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the window quality gate on readable ECG and noise')
+    parser.add_argument('--rates', nargs='+', type=int, default=[250, 400])
+    parser.add_argument('--min-pass', type=float, default=0.95)
+    parser.add_argument('--max-noise-pass', type=float, default=0.05)
+    args = parser.parse_args()
+    
+    print("=" * 72)
+    print("Signal-quality gate check")
+    print("=" * 72)
+    
+    failed = False
+    for sample_rate in args.rates:
+        print(f"\n{sample_rate} Hz")
+        for kind, cases in (('ecg', readable_cases(sample_rate)), ('noise', noise_cases(sample_rate))):
+            for name, samples in cases:
+                rate, rejected = pass_rate(samples, sample_rate)
+                ok = rate >= args.min_pass if kind == 'ecg' else rate <= args.max_noise_pass
+                reasons = ', '.join(f'{k}={v}' for k, v in rejected.items() if v)
+                print(f"  {kind:<6} {name:<28} pass={rate:.3f}{'' if ok else ' ✗'}  {reasons}")
+                failed = failed or not ok
+    
+    if failed:
+        print("\n✗ Quality gate rejects readable ECG or passes noise")
+        sys.exit(1)
+    print("\n✓ Readable ECG passes the quality gate, noise is rejected")
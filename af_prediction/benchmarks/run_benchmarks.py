@@ -0,0 +1,235 @@
+"""
+AF Prediction Benchmark Suite
+
+Times the inference pipeline stages on deterministic synthetic ECG
+(benchmarks/synthetic_ecg.py) at several recording lengths and device
+sample rates:
+- AFPredictor.preprocess_signal, create_windows, predict_windows,
+  aggregate_predictions
+- QRSDetector.detect
+- HeartRateCalculator.calculate_statistics
+
+The model stages use a randomly-initialized model from
+build_cnn_lstm_model, so no trained weights are needed (they are skipped
+if TensorFlow is not installed).
+
+Results are saved as JSON. With a baseline (benchmarks/baseline.json by
+default) every stage is compared against it and the run fails when one
+is slower than `--tolerance` times its baseline.
+
+Usage:
+    python benchmarks/run_benchmarks.py                       # 1m, 1h, 24h at 250/400 Hz
+    python benchmarks/run_benchmarks.py --lengths 1m 1h --rates 400
+    python benchmarks/run_benchmarks.py --save-baseline       # record a new baseline
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+from datetime import datetime
+
+import numpy as np
+from scipy import signal as scipy_signal
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.dirname(BENCH_DIR)
+
+# Add parent and training directories to path for imports
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, 'training'))
+
+from synthetic_ecg import generate_ecg
+from models.qrs_detector import QRSDetector
+from models.hr_calculator import HeartRateCalculator
+from utils.signal_store import resample_ratio
+
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+LENGTHS = {'1m': 60, '1h': 3600, '24h': 86400}
+SAMPLE_RATES = [250, 400]
+MODEL_SAMPLE_RATE = 250
+
+
+def time_call(func, *args, repeats=1):
+    """Best-of-N wall-clock time (seconds) and the last result"""
+    best = float('inf')
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+# Layer widths of the benchmark model: the CNN-LSTM architecture at a
+# fraction of the trained model's size (it only has to exercise the pipeline)
+TINY_MODEL = {'conv_filters': (8, 16, 32), 'lstm_units': (16, 8), 'dense_units': 16}
+
+
+def build_predictor():
+    """AFPredictor with a tiny randomly-initialized CNN-LSTM, or None without TensorFlow"""
+    try:
+        os.environ.setdefault('TF_USE_LEGACY_KERAS', '1')
+        import tensorflow as tf
+        from models.cnn_lstm_model import AFPredictor
+        from train_model import build_cnn_lstm_model
+    except ImportError as e:
+        print(f"⚠ TensorFlow stack not available ({e}); skipping model stages")
+        return None
+    
+    tf.random.set_seed(0)
+    return AFPredictor(model_path='<random-init>', model=build_cnn_lstm_model(**TINY_MODEL))
+
+
+def reference_preprocess(samples, sample_rate, dtype=np.float32):
+    """Same steps as AFPredictor.preprocess_signal, for runs without TensorFlow"""
+    signal = np.array(samples, dtype=dtype)
+    np.nan_to_num(signal, copy=False)
+    if sample_rate != MODEL_SAMPLE_RATE:
+        up, down = resample_ratio(sample_rate, MODEL_SAMPLE_RATE)
+        signal = scipy_signal.resample_poly(signal, up, down).astype(dtype, copy=False)
+    signal_max = max(signal.max(), -signal.min()) if len(signal) else 0
+    if signal_max > 0:
+        signal /= signal_max
+    return signal
+
+
+def benchmark_case(length_name, sample_rate, predictor, repeats):
+    """Time all stages for one (length, sample rate) case"""
+    duration = LENGTHS[length_name]
+    samples, _ = generate_ecg(duration, sample_rate=sample_rate, heart_rate=90,
+                              af=True, seed=duration + sample_rate)
+    timings = {}
+    
+    if predictor is not None:
+        timings['preprocess_signal'], signal = time_call(
+            predictor.preprocess_signal, samples, sample_rate, repeats=repeats)
+        timings['create_windows'], (windows, positions) = time_call(
+            predictor.create_windows, signal, repeats=repeats)
+        timings['predict_windows'], probabilities = time_call(
+            predictor.predict_windows, windows, repeats=repeats)
+        timings['aggregate_predictions'], _ = time_call(
+            predictor.aggregate_predictions, probabilities, positions, repeats=repeats)
+    else:
+        signal = reference_preprocess(samples, sample_rate)
+    
+    timings['qrs_detect'], _ = time_call(
+        QRSDetector(MODEL_SAMPLE_RATE).detect, signal, repeats=repeats)
+    timings['calculate_statistics'], _ = time_call(
+        HeartRateCalculator(MODEL_SAMPLE_RATE).calculate_statistics, signal, repeats=repeats)
+    
+    return {
+        'length': length_name,
+        'sample_rate': sample_rate,
+        'input_samples': len(samples),
+        'seconds': timings
+    }
+
+
+def case_key(case):
+    return f"{case['length']}@{case['sample_rate']}Hz"
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """List of regressions: stages slower than tolerance x baseline"""
+    baseline_cases = {case_key(c): c for c in baseline.get('cases', [])}
+    regressions = []
+    
+    print("\n" + "=" * 72)
+    print(f"Comparison with baseline ({baseline.get('created_at', 'unknown date')}), tolerance {tolerance:.2f}x")
+    print("=" * 72)
+    print(f"{'Case':<12} {'Stage':<24} {'Baseline (s)':>12} {'Now (s)':>10} {'Ratio':>7}")
+    print("-" * 72)
+    
+    for case in results['cases']:
+        reference = baseline_cases.get(case_key(case))
+        if reference is None:
+            continue
+        for stage, seconds in case['seconds'].items():
+            base_seconds = reference['seconds'].get(stage)
+            if not base_seconds:
+                continue
+            ratio = seconds / base_seconds
+            flag = ' ✗' if ratio > tolerance else ''
+            print(f"{case_key(case):<12} {stage:<24} {base_seconds:>12.4f} {seconds:>10.4f} {ratio:>6.2f}x{flag}")
+            if ratio > tolerance:
+                regressions.append({'case': case_key(case), 'stage': stage, 'ratio': ratio})
+    
+    return regressions
+
+
+def run_benchmarks(lengths, rates, repeats=3):
+    print("=" * 72)
+    print("AF Prediction Benchmark Suite")
+    print("=" * 72)
+    
+    predictor = build_predictor()
+    results = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'model': 'random-init' if predictor is not None else None
+        },
+        'cases': []
+    }
+    
+    for length_name in lengths:
+        for sample_rate in rates:
+            # Long recordings are timed once; short ones best-of-N
+            case_repeats = repeats if LENGTHS[length_name] <= 3600 else 1
+            case = benchmark_case(length_name, sample_rate, predictor, case_repeats)
+            results['cases'].append(case)
+            
+            print(f"\n{case_key(case)} ({case['input_samples']} samples)")
+            for stage, seconds in case['seconds'].items():
+                print(f"  {stage:<24} {seconds:>10.4f}s")
+    
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the AF prediction pipeline')
+    parser.add_argument('--lengths', nargs='+', choices=list(LENGTHS), default=list(LENGTHS))
+    parser.add_argument('--rates', nargs='+', type=int, default=SAMPLE_RATES)
+    parser.add_argument('--repeats', type=int, default=3, help='Best-of-N for recordings up to 1h')
+    parser.add_argument('--output', default=None, help='Results JSON (default: benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='Fail when a stage is slower than this multiple of its baseline')
+    parser.add_argument('--save-baseline', action='store_true', help='Save these results as the baseline')
+    args = parser.parse_args()
+    
+    results = run_benchmarks(args.lengths, args.rates, args.repeats)
+    
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✓ Results saved: {output}")
+    
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"✓ Baseline saved: {args.baseline}")
+        sys.exit(0)
+    
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n✗ {len(regressions)} regression(s) beyond {args.tolerance:.2f}x baseline")
+            sys.exit(1)
+        print("\n✓ No regressions")
+    else:
+        print(f"\nNo baseline at {args.baseline} (create one with --save-baseline)")
@@ -0,0 +1,99 @@
+"""
+Shared convolutional front end check
+
+Runs synthetic recordings through AFPredictor.predict_windows (each
+window through the whole model) and through SharedConvRunner (Conv1D
+front end shared across overlapping windows, models/shared_conv.py) with
+the same randomly-initialized CNN-LSTM, and reports:
+- max absolute difference of window probabilities and embeddings
+- Conv1D multiply-accumulates of both paths (analytic count)
+- wall-clock time of both paths
+
+Exit code 1 when the probabilities differ by more than --tolerance.
+Requires TensorFlow (skipped otherwise).
+
+Usage:
+    python benchmarks/shared_conv_check.py                  # 1m, 1h at 400 Hz
+    python benchmarks/shared_conv_check.py --lengths 24h --rates 250
+"""
+
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from synthetic_ecg import generate_ecg
+from run_benchmarks import LENGTHS, build_predictor
+
+
+def check_case(length_name, sample_rate, predictor, runner):
+    duration = LENGTHS[length_name]
+    samples, _ = generate_ecg(duration, sample_rate=sample_rate, heart_rate=90,
+                              af=True, seed=duration + sample_rate)
+    signal = predictor.preprocess_signal(samples, sample_rate)
+    windows, positions = predictor.create_windows(signal)
+    starts = np.array([start for start, _ in positions])
+    
+    start = time.perf_counter()
+    windowed, windowed_embeddings = predictor.predict_windows(windows, return_embeddings=True)
+    windowed_seconds = time.perf_counter() - start
+    
+    runner.conv_macs = 0
+    start = time.perf_counter()
+    shared, shared_embeddings = runner.predict(signal, starts, return_embeddings=True)
+    shared_seconds = time.perf_counter() - start
+    
+    return {
+        'case': f'{length_name}@{sample_rate}Hz',
+        'windows': len(windows),
+        'probability_max_abs_diff': float(np.max(np.abs(shared - windowed))),
+        'embedding_max_abs_diff': float(np.max(np.abs(shared_embeddings - windowed_embeddings))),
+        'conv_macs_windowed': runner.windowed_conv_macs(len(windows)),
+        'conv_macs_shared': runner.conv_macs,
+        'windowed_seconds': windowed_seconds,
+        'shared_seconds': shared_seconds
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare shared-front-end inference with predict_windows')
+    parser.add_argument('--lengths', nargs='+', choices=list(LENGTHS), default=['1m', '1h'])
+    parser.add_argument('--rates', nargs='+', type=int, default=[400])
+    parser.add_argument('--tolerance', type=float, default=1e-4)
+    args = parser.parse_args()
+    
+    print("=" * 72)
+    print("Shared convolutional front end check")
+    print("=" * 72)
+    
+    predictor = build_predictor()
+    if predictor is None:
+        sys.exit(0)
+    runner = predictor.shared_runner()
+    if runner is None:
+        print("✗ Model front end cannot be shared")
+        sys.exit(1)
+    print(f"Feature steps per window: {runner.feature_length}, edge margin: {runner.margin}")
+    
+    failed = False
+    for length_name in args.lengths:
+        for sample_rate in args.rates:
+            result = check_case(length_name, sample_rate, predictor, runner)
+            macs_ratio = result['conv_macs_shared'] / result['conv_macs_windowed']
+            ok = result['probability_max_abs_diff'] <= args.tolerance
+            
+            print(f"\n{result['case']} ({result['windows']} windows)")
+            print(f"  {'probability_max_abs_diff':<26} {result['probability_max_abs_diff']:.2e}{'' if ok else ' ✗'}")
+            print(f"  {'embedding_max_abs_diff':<26} {result['embedding_max_abs_diff']:.2e}")
+            print(f"  {'conv_gmacs_windowed':<26} {result['conv_macs_windowed'] / 1e9:.2f}")
+            print(f"  {'conv_gmacs_shared':<26} {result['conv_macs_shared'] / 1e9:.2f} ({macs_ratio:.2f}x)")
+            print(f"  {'windowed_seconds':<26} {result['windowed_seconds']:.2f}")
+            print(f"  {'shared_seconds':<26} {result['shared_seconds']:.2f}")
+            
+            failed = failed or not ok
+    
+    if failed:
+        print(f"\n✗ Shared front end differs from predict_windows by more than {args.tolerance}")
+        sys.exit(1)
+    print("\n✓ Shared front end matches predict_windows")
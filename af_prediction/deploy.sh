@@ -14,6 +14,8 @@ SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
 VENV_DIR="$SCRIPT_DIR/venv"
 TMUX_SESSION="af_prediction"
 PORT="${AF_API_PORT:-5050}"
+# flask (app.py) or asgi (asgi_app.py, async I/O with bounded CPU executor)
+SERVER="${AF_API_SERVER:-flask}"
 
 # Colors for output
 RED='\033[0;31m'
@@ -107,9 +109,15 @@ start_server() {
         return
     fi
     
+    if [ "$SERVER" = "asgi" ]; then
+        SERVER_SCRIPT="asgi_app.py"
+    else
+        SERVER_SCRIPT="app.py"
+    fi
+    
     # Start new tmux session
     tmux new-session -d -s "$TMUX_SESSION"
-    tmux send-keys -t "$TMUX_SESSION" "cd $SCRIPT_DIR && source venv/bin/activate && python app.py" Enter
+    tmux send-keys -t "$TMUX_SESSION" "cd $SCRIPT_DIR && source venv/bin/activate && python $SERVER_SCRIPT" Enter
     
     # Wait a moment and check if it started
     sleep 2
@@ -0,0 +1,606 @@
+"""
+AF Prediction API request handlers
+
+Framework-independent implementation of the API endpoints, shared by the
+Flask server (app.py) and the ASGI server (asgi_app.py). Handlers take
+the decoded JSON body / query parameters and return the response payload
+as a dict; errors are raised as ApiError with the HTTP status.
+
+Handlers are synchronous and CPU-bound (model inference, resampling,
+R-peak detection); the ASGI server runs them in an executor.
+"""
+
+import os
+import time
+
+import numpy as np
+
+from models.cnn_lstm_model import AFPredictor, MODEL_SAMPLE_RATE, WINDOW_SIZE, MODEL_TIERS, DEFAULT_MODEL_TIER
+from models.hr_calculator import HeartRateCalculator
+from models.waveform_pyramid import PyramidStore, PYRAMID_DIR
+from utils.recording_source import RecordingSource, RecordingNotFound
+from utils.signal_store import SignalStore, SIGNAL_STORE_DIR
+from utils.embedding_index import EmbeddingIndex, EMBEDDING_INDEX_DIR
+
+API_VERSION = '1.0.0'
+
+# Model tier used when a request does not choose one ('standard' or 'fast')
+MODEL_TIER = os.environ.get('AF_MODEL_TIER', DEFAULT_MODEL_TIER)
+
+# Share the convolutional front end across overlapping windows (same results)
+SHARED_CONV = os.environ.get('AF_SHARED_CONV', 'false').lower() == 'true'
+
+# Initialize models
+af_predictors = {}  # Per model tier
+hr_calculator = None
+recording_source = None
+pyramid_store = None
+signal_store = None
+embedding_indexes = {}  # Per model tier
+
+
+class ApiError(Exception):
+    """Error response: {'status': 'error', 'message': ...} with an HTTP status"""
+    
+    def __init__(self, message, status=400, payload=None):
+        super().__init__(message)
+        self.status = status
+        self.payload = payload or {'status': 'error', 'message': message}
+
+
+def get_af_predictor(tier=None):
+    """Lazy load the AF predictor of a model tier (default: AF_MODEL_TIER)"""
+    tier = tier or MODEL_TIER
+    if tier not in af_predictors:
+        af_predictors[tier] = AFPredictor(tier=tier, shared_conv=SHARED_CONV)
+    return af_predictors[tier]
+
+
+def request_model_tier(data):
+    """Model tier chosen by the request body ('model_tier'), else the server default"""
+    tier = (data or {}).get('model_tier') or MODEL_TIER
+    if tier not in MODEL_TIERS:
+        raise ApiError(f"Unknown model_tier: {tier} (choose from {', '.join(MODEL_TIERS)})")
+    return tier
+
+
+def get_hr_calculator():
+    """Lazy load HR calculator"""
+    global hr_calculator
+    if hr_calculator is None:
+        # AF_HR_WORKERS > 1 enables multi-core R-peak detection for long recordings
+        n_jobs = int(os.environ.get('AF_HR_WORKERS', 1))
+        hr_calculator = HeartRateCalculator(MODEL_SAMPLE_RATE, n_jobs=n_jobs)
+    return hr_calculator
+
+
+def get_recording_source():
+    """Lazy create the database recording source (None if AF_DATABASE_URL is unset)"""
+    global recording_source
+    if recording_source is None and os.environ.get('AF_DATABASE_URL'):
+        recording_source = RecordingSource.from_url(
+            os.environ['AF_DATABASE_URL'],
+            max_connections=int(os.environ.get('AF_DATABASE_POOL', 4))
+        )
+    return recording_source
+
+
+def get_pyramid_store():
+    """Lazy create the waveform pyramid store"""
+    global pyramid_store
+    if pyramid_store is None:
+        pyramid_store = PyramidStore(os.environ.get('AF_PYRAMID_DIR', PYRAMID_DIR))
+    return pyramid_store
+
+
+def get_signal_store():
+    """Lazy create the recording signal store"""
+    global signal_store
+    if signal_store is None:
+        signal_store = SignalStore(os.environ.get('AF_SIGNAL_STORE_DIR', SIGNAL_STORE_DIR))
+    return signal_store
+
+
+def get_embedding_index(tier=None):
+    """Lazy create the window embedding index of a model tier"""
+    tier = tier or MODEL_TIER
+    if tier not in embedding_indexes:
+        root = os.environ.get('AF_EMBEDDING_INDEX_DIR', EMBEDDING_INDEX_DIR)
+        embedding_indexes[tier] = EmbeddingIndex(os.path.join(root, tier))
+    return embedding_indexes[tier]
+
+
+def parse_sample_rate(value):
+    """
+    Sample rate from a request or the database: an int when integral,
+    non-integer rates (e.g. 128.5 Hz) kept exactly instead of truncated
+    
+    Raises:
+        ValueError, TypeError: not a positive number
+    """
+    rate = float(value)
+    if not rate > 0:
+        raise ValueError(f"Invalid sample rate: {value}")
+    return int(rate) if rate.is_integer() else rate
+
+
+def recording_pyramid_key(recording_id):
+    return f'recording_{recording_id}'
+
+
+def _load_recording(recording_id, source):
+    try:
+        return source.load_samples(recording_id)
+    except RecordingNotFound as e:
+        raise ApiError(str(e), 404)
+
+
+def _sync_signal_store(store, recording_id, source):
+    """
+    Bring a recording's signal store entry up to date with the database
+    
+    Samples the store does not have yet are appended. The entry is
+    finalized only once the recording has finished uploading, so a
+    recording that is still uploading keeps growing on later requests.
+    """
+    meta = store.meta(recording_id) if store.exists(recording_id) else None
+    if meta is not None and meta['final']:
+        return
+    
+    stored = meta['device_samples'] if meta is not None else 0
+    db_samples, finished = source.recording_state(recording_id)
+    if meta is not None and db_samples <= stored:
+        if finished:
+            # Nothing new; resample the tail that waited for more input
+            store.append(recording_id, np.empty(0, dtype=np.float32), meta['sample_rate'],
+                         final=True, start_sample=stored)
+        return
+    
+    samples_array, sample_rate = _load_recording(recording_id, source)
+    try:
+        store.append(recording_id, samples_array, sample_rate, final=finished, start_sample=0)
+    except ValueError as e:
+        raise ApiError(str(e), 409)
+
+
+def health():
+    """Health check"""
+    predictor = get_af_predictor()
+    model_loaded = predictor.model is not None
+    
+    return {
+        'status': 'healthy',
+        'model_loaded': model_loaded,
+        'model_tier': predictor.tier,
+        'model_tiers_loaded': sorted(af_predictors),
+        'model_sample_rate': MODEL_SAMPLE_RATE,
+        'version': API_VERSION
+    }
+
+
+def predict_samples(data):
+    """POST /api/predict-af: AF prediction for samples sent in the body"""
+    if not data:
+        raise ApiError('No JSON data provided')
+    
+    samples = data.get('samples')
+    
+    # Ensure numeric parameters are safely casted
+    try:
+        sample_rate = parse_sample_rate(data.get('sample_rate', 400))
+        threshold = float(data.get('threshold', 0.5))
+    except (ValueError, TypeError):
+        raise ApiError('Invalid format for sample_rate or threshold (must be numbers)')
+    
+    if samples is None:
+        raise ApiError('Missing required field: samples')
+    
+    if not isinstance(samples, list) or len(samples) == 0:
+        raise ApiError('samples must be a non-empty array')
+    
+    # Convert to numpy array
+    samples_array = np.array(samples, dtype=np.float32)
+    
+    return analyze(samples_array, sample_rate, threshold, tier=request_model_tier(data))
+
+
+def predict_recording(recording_id, data):
+    """POST /api/predict-af/recording/<id>: AF prediction for a database recording"""
+    source = get_recording_source()
+    if source is None:
+        raise ApiError('Database access not configured (set AF_DATABASE_URL)', 503)
+    data = data or {}
+    
+    # Window embeddings of whole recordings go to the similar-episode index
+    # once the upload is finished (checked before loading, so the loaded
+    # samples are complete; the index is append-only per recording)
+    embedding_recording_id = None
+    if os.environ.get('AF_EMBEDDING_INDEX', 'false').lower() == 'true' and source.recording_state(recording_id)[1]:
+        embedding_recording_id = recording_id
+    
+    samples_array, recording_rate = _load_recording(recording_id, source)
+    
+    try:
+        sample_rate = parse_sample_rate(data.get('sample_rate', recording_rate))
+        threshold = float(data.get('threshold', 0.5))
+    except (ValueError, TypeError):
+        raise ApiError('Invalid format for sample_rate or threshold (must be numbers)')
+    
+    # The 250 Hz signal is already computed here; reuse it for the viewer pyramid
+    pyramid_key = None
+    if os.environ.get('AF_PYRAMID_ON_PREDICT', 'false').lower() == 'true':
+        pyramid_key = recording_pyramid_key(recording_id)
+    
+    return analyze(samples_array, sample_rate, threshold, pyramid_key, tier=request_model_tier(data),
+                   embedding_recording_id=embedding_recording_id)
+
+
+def predict_recording_range(recording_id, data):
+    """POST /api/predict-af/recording/<id>/range: AF prediction for a time range"""
+    data = data or {}
+    
+    try:
+        start = float(data.get('start_seconds', 0))
+        end = data.get('end_seconds')
+        end = float(end) if end is not None else None
+        threshold = float(data.get('threshold', 0.5))
+    except (ValueError, TypeError):
+        raise ApiError('start_seconds, end_seconds and threshold must be numbers')
+    
+    if start < 0 or (end is not None and end <= start):
+        raise ApiError('Invalid range: need 0 <= start_seconds < end_seconds')
+    
+    store = get_signal_store()
+    source = get_recording_source()
+    if source is not None:
+        _sync_signal_store(store, recording_id, source)
+    elif not store.exists(recording_id):
+        raise ApiError(
+            f'Recording {recording_id} not in signal store and database access not configured', 404
+        )
+    
+    segment, segment_rate = store.read(recording_id, start, end)
+    
+    analyzed_range = {
+        'start_seconds': start,
+        'end_seconds': start + len(segment) / segment_rate,
+        'recording_duration_seconds': store.duration_seconds(recording_id)
+    }
+    
+    return analyze(segment, segment_rate, threshold,
+                   time_offset=start, extra={'range': analyzed_range},
+                   tier=request_model_tier(data))
+
+
+def append_signal(recording_id, data):
+    """POST /api/signal/recording/<id>: append samples to the signal store"""
+    if not data or 'samples' not in data:
+        raise ApiError('Missing samples in request body')
+    
+    try:
+        samples_array = np.asarray(data['samples'], dtype=np.float32)
+        sample_rate = parse_sample_rate(data.get('sample_rate', 400))
+    except (ValueError, TypeError):
+        raise ApiError('Invalid format for samples or sample_rate (must be numbers)')
+    
+    try:
+        meta = get_signal_store().append(
+            recording_id, samples_array, sample_rate, final=bool(data.get('final', False))
+        )
+    except ValueError as e:
+        raise ApiError(str(e), 409)
+    
+    return {
+        'status': 'success',
+        'recording': meta
+    }
+
+
+def build_pyramid(recording_id, data):
+    """POST /api/waveform/recording/<id>/pyramid: (re)build the waveform pyramid"""
+    source = get_recording_source()
+    if source is None:
+        raise ApiError('Database access not configured (set AF_DATABASE_URL)', 503)
+    data = data or {}
+    
+    samples_array, sample_rate = _load_recording(recording_id, source)
+    
+    if data.get('resample'):
+        samples_array = get_af_predictor().preprocess_signal(samples_array, sample_rate)
+        sample_rate = MODEL_SAMPLE_RATE
+    
+    meta = get_pyramid_store().save(recording_pyramid_key(recording_id), samples_array, sample_rate)
+    
+    return {
+        'status': 'success',
+        'pyramid': meta
+    }
+
+
+def waveform_tile(recording_id, args):
+    """GET /api/waveform/recording/<id>/tile: one tile of the waveform pyramid"""
+    try:
+        level = int(args.get('level', 1))
+        start = float(args.get('start', 0))
+        end = args.get('end')
+        end = float(end) if end is not None else None
+    except ValueError:
+        raise ApiError('level, start and end must be numbers')
+    
+    store = get_pyramid_store()
+    key = recording_pyramid_key(recording_id)
+    
+    if not store.exists(key):
+        source = get_recording_source()
+        if source is None:
+            raise ApiError(f'No waveform pyramid for recording {recording_id}', 404)
+        samples_array, sample_rate = _load_recording(recording_id, source)
+        store.save(key, samples_array, sample_rate)
+    
+    try:
+        tile = store.tile(key, level, start, end)
+    except ValueError as e:
+        raise ApiError(str(e))
+    
+    tile['status'] = 'success'
+    return tile
+
+
+def similar_episodes(recording_id, data):
+    """
+    POST /api/embeddings/recording/<id>/similar: episodes in other
+    recordings that look like a time range of this one
+    """
+    data = data or {}
+    
+    try:
+        start = float(data.get('start_seconds', 0))
+        end = data.get('end_seconds')
+        end = float(end) if end is not None else None
+        k = int(data.get('k', 10))
+        nprobe = int(data.get('nprobe', 16))
+    except (ValueError, TypeError):
+        raise ApiError('start_seconds, end_seconds, k and nprobe must be numbers')
+    
+    mode = data.get('mode', 'approximate')
+    if mode not in ('exact', 'approximate'):
+        raise ApiError('mode must be exact or approximate')
+    
+    index = get_embedding_index(request_model_tier(data))
+    query = index.query_vector(recording_id, start, end)
+    if query is None:
+        raise ApiError(f'No indexed windows for recording {recording_id} in this range', 404)
+    
+    search_start = time.perf_counter()
+    # Several windows per episode are merged below
+    hits = index.search(query, k=20 * k, mode=mode, nprobe=nprobe, exclude_recording_id=recording_id)
+    search_ms = (time.perf_counter() - search_start) * 1000
+    
+    return {
+        'status': 'success',
+        'query': {'recording_id': int(recording_id), 'start_seconds': start, 'end_seconds': end},
+        'mode': mode,
+        'indexed_windows': len(index),
+        'search_ms': round(search_ms, 2),
+        'episodes': merge_window_hits(hits)[:k]
+    }
+
+
+def merge_window_hits(hits):
+    """
+    Merge window hits of the same recording that overlap into episodes
+    
+    Returns:
+        Episodes sorted by best window score
+    """
+    window_seconds = WINDOW_SIZE / MODEL_SAMPLE_RATE
+    by_recording = {}
+    for hit in hits:
+        by_recording.setdefault(hit['recording_id'], []).append(hit)
+    
+    episodes = []
+    for recording_id, recording_hits in by_recording.items():
+        current = None
+        for hit in sorted(recording_hits, key=lambda h: h['start_seconds']):
+            if current is not None and hit['start_seconds'] <= current['end_seconds']:
+                current['end_seconds'] = hit['start_seconds'] + window_seconds
+                current['score'] = max(current['score'], hit['score'])
+                current['af_probability'] = max(current['af_probability'], hit['probability'])
+                current['windows'] += 1
+                continue
+            current = {
+                'recording_id': recording_id,
+                'start_seconds': hit['start_seconds'],
+                'end_seconds': hit['start_seconds'] + window_seconds,
+                'score': hit['score'],
+                'af_probability': hit['probability'],
+                'windows': 1
+            }
+            episodes.append(current)
+    
+    return sorted(episodes, key=lambda e: e['score'], reverse=True)
+
+
+def build_embedding_index(data):
+    """POST /api/embeddings/build: train the approximate (IVF-PQ) search structure"""
+    data = data or {}
+    
+    try:
+        n_lists = data.get('n_lists')
+        n_lists = int(n_lists) if n_lists is not None else None
+        n_subvectors = int(data.get('n_subvectors', 16))
+    except (ValueError, TypeError):
+        raise ApiError('n_lists and n_subvectors must be numbers')
+    
+    try:
+        summary = get_embedding_index(request_model_tier(data)).build_ivf(n_lists, n_subvectors)
+    except ValueError as e:
+        raise ApiError(str(e))
+    
+    return {
+        'status': 'success',
+        'index': summary
+    }
+
+
+def analyze(samples_array, sample_rate, threshold, pyramid_key=None, time_offset=0.0, extra=None,
+            tier=None, embedding_recording_id=None):
+    """
+    Run AF prediction and heart rate analysis
+    
+    tier selects the model ('standard' or 'fast'; default AF_MODEL_TIER).
+    With embedding_recording_id, the window embeddings (same model call)
+    are added to the embedding index unless the recording is indexed
+    (checked again under the index lock when adding).
+    With pyramid_key, the waveform pyramid is also built from the
+    preprocessed (250 Hz) signal. time_offset (seconds) is added to event
+    and trend times when the samples are a range of a longer recording;
+    extra is merged into the response.
+    
+    Returns:
+        Response payload
+    """
+    # Check minimum length (need at least 10 seconds of data)
+    min_samples = int(np.ceil(10 * sample_rate))
+    if len(samples_array) < min_samples:
+        raise ApiError(
+            f'Signal too short. Need at least 10 seconds ({min_samples} samples at {sample_rate}Hz)'
+        )
+    
+    # Get predictor and run prediction
+    try:
+        predictor = get_af_predictor(tier)
+    except OSError as e:
+        raise ApiError(f"Model tier '{tier or MODEL_TIER}' not available: {e}", 503)
+    
+    embedding_index = None
+    if embedding_recording_id is not None:
+        embedding_index = get_embedding_index(predictor.tier)
+        if embedding_index.contains(embedding_recording_id):
+            embedding_index = None
+    
+    af_result = predictor.predict(samples_array, sample_rate, threshold,
+                                  return_embeddings=embedding_index is not None)
+    
+    if af_result.get('status') == 'error':
+        raise ApiError(af_result.get('message', 'Prediction failed'), 500, payload=af_result)
+    
+    # Calculate heart rate
+    hr_calc = get_hr_calculator()
+    
+    # Resample signal for HR calculation
+    preprocessed = predictor.preprocess_signal(samples_array, sample_rate)
+    hr_result = hr_calc.calculate_statistics(preprocessed)
+    
+    if pyramid_key is not None:
+        get_pyramid_store().save(pyramid_key, preprocessed, MODEL_SAMPLE_RATE)
+    
+    embeddings = af_result.pop('window_embeddings', None)
+    embeddings_indexed = None
+    if embeddings is not None:
+        embeddings_indexed = embedding_index.add_if_absent(
+            embedding_recording_id,
+            embeddings,
+            [start / MODEL_SAMPLE_RATE + time_offset for start, _ in af_result['window_positions']],
+            [np.nan if p is None else p for p in af_result['window_probabilities']]
+        )
+    
+    # Combine results
+    response = {
+        'status': 'success',
+        'model_tier': predictor.tier,
+        'af_detected': af_result.get('af_detected', False),
+        'af_events': af_result.get('af_events', []),
+        'summary': af_result.get('summary', {}),
+        'signal_quality': af_result.get('signal_quality', {}),
+        'heart_rate': hr_result.get('heart_rate', {
+            'min_bpm': 0,
+            'avg_bpm': 0,
+            'max_bpm': 0
+        }),
+        'hrv_metrics': hr_result.get('hrv_metrics', {}),
+        'hr_trends': hr_result.get('trends', {}),
+        'r_peak_count': hr_result.get('r_peak_count', 0)
+    }
+    
+    if time_offset:
+        for event in response['af_events']:
+            event['start_seconds'] += time_offset
+            event['end_seconds'] += time_offset
+        for trend in response['hr_trends'].values():
+            trend['start_seconds'] = [t + time_offset for t in trend['start_seconds']]
+    
+    if embeddings_indexed is not None:
+        response['embeddings_indexed'] = embeddings_indexed
+    
+    response.update(extra or {})
+    
+    # Generate conclusion
+    response['conclusion'] = generate_conclusion(response)
+    
+    return response
+
+
+def generate_conclusion(result):
+    """Generate human-readable conclusion in Indonesian"""
+    summary = result.get('summary', {})
+    hr = result.get('heart_rate', {})
+    af_events = result.get('af_events', [])
+    
+    total_minutes = summary.get('total_analyzed_minutes', 0)
+    af_minutes = summary.get('af_minutes', 0)
+    af_count = summary.get('af_event_count', 0)
+    af_burden = summary.get('af_burden_percent', 0)
+    unanalyzable_minutes = summary.get('unanalyzable_minutes', 0)
+    
+    hr_min = hr.get('min_bpm', 0)
+    hr_avg = hr.get('avg_bpm', 0)
+    hr_max = hr.get('max_bpm', 0)
+    
+    lines = []
+    
+    # Recording summary
+    lines.append(f"📊 Analisis EKG: {total_minutes:.1f} menit data telah dianalisis.")
+    
+    if unanalyzable_minutes > 0:
+        lines.append(f"⚠️ {unanalyzable_minutes:.1f} menit data tidak dapat dianalisis karena kualitas sinyal buruk (elektroda lepas, saturasi, atau noise).")
+    
+    # AF findings
+    if af_count > 0:
+        lines.append(f"\n⚠️ TERDETEKSI AF: {af_count} episode Atrial Fibrillation dengan total durasi {af_minutes:.1f} menit ({af_burden:.1f}% dari rekaman yang dapat dianalisis).")
+        
+        if len(af_events) > 0:
+            lines.append("\nDetail episode AF:")
+            for i, event in enumerate(af_events[:5], 1):  # Show max 5 events
+                start = event.get('start_seconds', 0)
+                end = event.get('end_seconds', 0)
+                duration = event.get('duration_seconds', 0)
+                confidence = event.get('confidence', 0)
+                
+                # Convert to time format
+                start_min = int(start // 60)
+                start_sec = int(start % 60)
+                end_min = int(end // 60)
+                end_sec = int(end % 60)
+                
+                lines.append(f"  {i}. {start_min:02d}:{start_sec:02d} - {end_min:02d}:{end_sec:02d} (durasi: {duration:.0f} detik, confidence: {confidence:.0%})")
+            
+            if len(af_events) > 5:
+                lines.append(f"  ... dan {len(af_events) - 5} episode lainnya")
+    else:
+        lines.append("\n✅ TIDAK TERDETEKSI AF: Tidak ditemukan episode Atrial Fibrillation.")
+    
+    # Heart rate summary
+    lines.append(f"\n❤️ Denyut Jantung:")
+    lines.append(f"   • Minimum: {hr_min:.0f} BPM")
+    lines.append(f"   • Rata-rata: {hr_avg:.0f} BPM")
+    lines.append(f"   • Maksimum: {hr_max:.0f} BPM")
+    
+    # Recommendations
+    lines.append("\n📋 CATATAN:")
+    lines.append("Hasil ini adalah prediksi AI dan HARUS dikonfirmasi oleh dokter spesialis jantung.")
+    
+    if af_count > 0:
+        lines.append("Disarankan untuk konsultasi lebih lanjut dengan dokter untuk evaluasi dan tatalaksana.")
+    
+    return '\n'.join(lines)
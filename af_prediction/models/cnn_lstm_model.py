@@ -12,11 +12,17 @@ Training Dataset: MIT-BIH Atrial Fibrillation Database (PhysioNet)
 """
 
 import os
+
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from scipy import signal as scipy_signal
 import tensorflow as tf
 from tensorflow import keras
 
+from .signal_quality import assess_windows, rejection_counts, unusable_samples
+from .shared_conv import SharedConvRunner
+from utils.signal_store import resample_ratio
+
 # Model configuration
 MODEL_SAMPLE_RATE = 250  # Model was trained at 250Hz
 WINDOW_SIZE = 2500       # 10 seconds
@@ -26,6 +32,13 @@ MODEL_PATH = os.path.join(
     'af_cnn_lstm.keras'
 )
 
+# Model tiers: name of the trained model file (models/trained/<name>.h5|.keras)
+MODEL_TIERS = {
+    'standard': 'af_cnn_lstm',  # CNN-LSTM (training/train_model.py)
+    'fast': 'af_student',       # Distilled student (training/distill_model.py)
+}
+DEFAULT_MODEL_TIER = 'standard'
+
 
 class AFPredictor:
     """
@@ -35,15 +48,40 @@ class AFPredictor:
     - Automatic resampling from device sample rate to model rate
     - Sliding window with overlap for continuous prediction
     - Confidence scores per window
+    - Signal-quality gating: flat, clipped or noisy windows are not
+      sent to the model and are reported as unanalyzable time
     - AF event aggregation
+    - Model tiers: 'standard' (CNN-LSTM) or 'fast' (distilled student,
+      same input windows and output probability)
+    - Optional window embeddings (penultimate Dense layer) from the same
+      model call as the probabilities, for similar-episode search
+    - Optional shared convolutional front end (shared_conv=True): the
+      Conv1D layers run once over overlapping windows instead of once per
+      window, same probabilities up to float rounding
     """
     
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, model=None, quality_gating=True, tier=DEFAULT_MODEL_TIER,
+                 shared_conv=False):
+        if tier not in MODEL_TIERS:
+            raise ValueError(f"Unknown model tier: {tier} (choose from {', '.join(MODEL_TIERS)})")
+        self.quality_gating = quality_gating
+        self.tier = tier
+        self.shared_conv = shared_conv
+        self._embedding_model = None
+        self._shared_runner = None
+        
+        if model is not None:
+            # Pre-built model (e.g. randomly initialized for benchmarks)
+            self.model_path = model_path
+            self.model = model
+            return
+        
         if model_path is None:
             # Try to load .h5 first (more compatible), then .keras
             base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            h5_path = os.path.join(base_dir, 'models', 'trained', 'af_cnn_lstm.h5')
-            keras_path = os.path.join(base_dir, 'models', 'trained', 'af_cnn_lstm.keras')
+            model_name = MODEL_TIERS[tier]
+            h5_path = os.path.join(base_dir, 'models', 'trained', f'{model_name}.h5')
+            keras_path = os.path.join(base_dir, 'models', 'trained', f'{model_name}.keras')
             
             if os.path.exists(h5_path):
                 self.model_path = h5_path
@@ -62,31 +100,35 @@ class AFPredictor:
             print(f"[ERROR] Failed to load model: {e}")
             raise e
     
-    def preprocess_signal(self, samples, sample_rate=400):
+    def preprocess_signal(self, samples, sample_rate=400, dtype=np.float32):
         """
         Preprocess raw ECG signal
         
         Args:
             samples: List or array of ECG values
             sample_rate: Sample rate of input signal (Hz)
+            dtype: Working dtype; float32 end to end by default
             
         Returns:
-            Preprocessed signal resampled to 250Hz
+            Preprocessed signal resampled to 250Hz, in `dtype`
         """
-        signal = np.array(samples, dtype=np.float32)
+        # Private copy, cleaned and normalized in place below
+        signal = np.array(samples, dtype=dtype)
         
         # Remove NaN/Inf
-        signal = np.nan_to_num(signal, nan=0.0, posinf=0.0, neginf=0.0)
+        np.nan_to_num(signal, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
         
-        # Resample if needed (from device rate to model rate)
+        # Resample if needed (from device rate to model rate) with the
+        # polyphase filter of SignalStore, so range analysis sees the same
+        # signal; older SciPy returns float64 for float32 input
         if sample_rate != MODEL_SAMPLE_RATE:
-            num_samples = int(len(signal) * MODEL_SAMPLE_RATE / sample_rate)
-            signal = scipy_signal.resample(signal, num_samples)
+            up, down = resample_ratio(sample_rate, MODEL_SAMPLE_RATE)
+            signal = scipy_signal.resample_poly(signal, up, down).astype(dtype, copy=False)
         
         # Normalize to [-1, 1]
-        signal_max = np.max(np.abs(signal))
+        signal_max = max(signal.max(), -signal.min()) if len(signal) else 0  # No |signal| temporary
         if signal_max > 0:
-            signal = signal / signal_max
+            signal /= signal_max
         
         return signal
     
@@ -100,31 +142,71 @@ class AFPredictor:
             overlap: Overlap ratio (0.5 = 50%)
             
         Returns:
-            windows: Array of shape (n_windows, window_size, 1)
+            windows: Read-only view of shape (n_windows, window_size, 1)
             window_positions: List of (start_sample, end_sample) for each window
         """
         step_size = int(window_size * (1 - overlap))
-        windows = []
-        positions = []
+        if len(signal) < window_size:
+            return np.empty((0, window_size, 1), dtype=np.asarray(signal).dtype), []
         
-        for start in range(0, len(signal) - window_size + 1, step_size):
-            end = start + window_size
-            window = signal[start:end]
-            windows.append(window.reshape(-1, 1))
-            positions.append((start, end))
+        # Strided view: overlapping windows share memory with the signal
+        windows = sliding_window_view(signal, window_size)[::step_size]
+        positions = [(start, start + window_size) for start in range(0, len(windows) * step_size, step_size)]
         
-        return np.array(windows), positions
+        return windows[..., np.newaxis], positions
     
-    def predict_windows(self, windows):
+    def embedding_model(self):
+        """
+        Model with two outputs: AF probability and the penultimate Dense
+        layer (Dense 64 of the CNN-LSTM), sharing all weights with self.model
+        """
+        if self._embedding_model is None:
+            self._embedding_model = keras.Model(
+                inputs=self.model.inputs,
+                outputs=[self.model.outputs[0], self.penultimate_layer().output]
+            )
+        return self._embedding_model
+    
+    def penultimate_layer(self):
+        """Penultimate Dense layer, the source of window embeddings"""
+        dense = [layer for layer in self.model.layers if isinstance(layer, keras.layers.Dense)]
+        if len(dense) < 2:
+            raise ValueError("Model has no penultimate Dense layer")
+        return dense[-2]
+    
+    def shared_runner(self):
+        """
+        SharedConvRunner for this model, or None when its front end cannot
+        be shared (e.g. the strided convolutions of the student model)
+        """
+        if self._shared_runner is None:
+            try:
+                self._shared_runner = SharedConvRunner(self.model, WINDOW_SIZE)
+            except ValueError as e:
+                print(f"[INFO] Shared conv front end disabled: {e}")
+                self._shared_runner = False
+        return self._shared_runner or None
+    
+    def predict_windows(self, windows, return_embeddings=False):
         """
         Predict AF probability for each window
         
+        Args:
+            windows: (n, WINDOW_SIZE, 1) windows
+            return_embeddings: Also return the penultimate-layer embedding
+                of each window (same model call)
+        
         Returns:
-            Array of AF probabilities (0-1) for each window
+            Array of AF probabilities (0-1) for each window, or
+            (probabilities, embeddings) with return_embeddings
         """
         if self.model is None:
             raise ValueError("Model not loaded")
         
+        if return_embeddings:
+            predictions, embeddings = self.embedding_model().predict(windows, verbose=0)
+            return predictions.flatten(), embeddings
+        
         predictions = self.model.predict(windows, verbose=0)
         return predictions.flatten()
     
@@ -148,6 +230,7 @@ class AFPredictor:
         current_event = None
         
         for i, (prob, (start, end)) in enumerate(zip(probabilities, positions)):
+            # NaN (window skipped by quality gating) ends an event like a normal window
             is_af = prob >= threshold
             
             if is_af:
@@ -186,7 +269,7 @@ class AFPredictor:
         
         return af_events
     
-    def predict(self, samples, sample_rate=400, threshold=0.5):
+    def predict(self, samples, sample_rate=400, threshold=0.5, return_embeddings=False):
         """
         Main prediction function
         
@@ -194,6 +277,8 @@ class AFPredictor:
             samples: Raw ECG signal
             sample_rate: Device sample rate (Hz)
             threshold: AF probability threshold
+            return_embeddings: Add 'window_embeddings', a float32 array
+                (windows, embedding size) with NaN rows for skipped windows
             
         Returns:
             Dictionary with AF events and summary
@@ -217,8 +302,32 @@ class AFPredictor:
         # Create windows
         windows, positions = self.create_windows(signal)
         
-        # Predict
-        probabilities = self.predict_windows(windows)
+        # Signal quality: only usable windows go to the model
+        if self.quality_gating:
+            quality = assess_windows(windows, MODEL_SAMPLE_RATE)
+            usable = quality['usable']
+        else:
+            quality = None
+            usable = np.ones(len(windows), dtype=bool)
+        
+        # Predict (skipped windows keep NaN)
+        probabilities = np.full(len(windows), np.nan, dtype=np.float32)
+        embeddings = None
+        if return_embeddings:
+            embedding_size = self.penultimate_layer().units
+            embeddings = np.full((len(windows), embedding_size), np.nan, dtype=np.float32)
+        if usable.any():
+            selected = slice(None) if usable.all() else usable
+            runner = self.shared_runner() if self.shared_conv else None
+            if runner is not None:
+                starts = np.array([start for start, _ in positions])[selected]
+                output = runner.predict(signal, starts, return_embeddings=return_embeddings)
+            else:
+                output = self.predict_windows(windows[selected], return_embeddings=return_embeddings)
+            if return_embeddings:
+                probabilities[selected], embeddings[selected] = output
+            else:
+                probabilities[selected] = output
         
         # Aggregate into events
         af_events = self.aggregate_predictions(probabilities, positions, threshold)
@@ -229,7 +338,9 @@ class AFPredictor:
             (e['end_sample'] - e['start_sample']) / MODEL_SAMPLE_RATE 
             for e in af_events
         )
-        normal_seconds = total_seconds - af_seconds
+        unanalyzable_seconds = unusable_samples(positions, usable, len(signal)) / MODEL_SAMPLE_RATE
+        analyzable_seconds = total_seconds - unanalyzable_seconds
+        normal_seconds = analyzable_seconds - af_seconds
         
         # Format events
         formatted_events = []
@@ -241,7 +352,7 @@ class AFPredictor:
                 'confidence': event['confidence']
             })
         
-        return {
+        result = {
             'status': 'success',
             'af_detected': len(af_events) > 0,
             'af_events': formatted_events,
@@ -250,11 +361,22 @@ class AFPredictor:
                 'normal_rhythm_minutes': round(normal_seconds / 60, 2),
                 'af_minutes': round(af_seconds / 60, 2),
                 'af_event_count': len(af_events),
-                'af_burden_percent': round(100 * af_seconds / total_seconds, 1) if total_seconds > 0 else 0
+                'af_burden_percent': round(100 * af_seconds / analyzable_seconds, 1) if analyzable_seconds > 0 else 0,
+                'unanalyzable_minutes': round(unanalyzable_seconds / 60, 2),
+                'unanalyzable_percent': round(100 * unanalyzable_seconds / total_seconds, 1) if total_seconds > 0 else 0
+            },
+            'signal_quality': {
+                'total_windows': len(windows),
+                'analyzed_windows': int(usable.sum()),
+                'rejected': rejection_counts(quality) if quality is not None else {}
             },
-            'window_probabilities': probabilities.tolist(),
+            # None for windows skipped by quality gating
+            'window_probabilities': [None if np.isnan(p) else float(p) for p in probabilities],
             'window_positions': positions
         }
+        if embeddings is not None:
+            result['window_embeddings'] = embeddings
+        return result
 
 
 # Singleton instance
@@ -5,6 +5,7 @@ Calculates heart rate statistics from ECG R-peaks:
 - Instantaneous HR at each beat
 - Min, Average, Max HR
 - HR variability metrics (RMSSD, pNN50)
+- Per-interval HR/HRV trend series for long recordings
 
 Reference:
 Task Force of ESC and NASPE (1996). Heart rate variability: standards of 
@@ -12,18 +13,38 @@ measurement, physiological interpretation and clinical use. Circulation, 93(5).
 """
 
 import numpy as np
-from .qrs_detector import QRSDetector
+from .qrs_detector import QRSDetector, detect_qrs_parallel
 
 
 class HeartRateCalculator:
     """
     Calculate heart rate and HRV metrics from ECG
+    
+    With n_jobs != 1, R-peak detection on long signals is split into
+    overlapping segments processed in a process pool (see
+    detect_qrs_parallel); statistics are then computed from the merged
+    RR series exactly as in the single-core path.
     """
     
-    def __init__(self, sample_rate=250):
+    def __init__(self, sample_rate=250, n_jobs=1):
         self.sample_rate = sample_rate
+        self.n_jobs = n_jobs
         self.qrs_detector = QRSDetector(sample_rate)
     
+    def detect_r_peaks(self, signal):
+        """
+        Detect R-peaks, in parallel for long signals when n_jobs != 1
+        
+        Args:
+            signal: Raw ECG signal
+            
+        Returns:
+            r_peaks: Array of R-peak sample indices
+        """
+        if self.n_jobs == 1:
+            return self.qrs_detector.detect(signal)
+        return detect_qrs_parallel(signal, self.sample_rate, n_jobs=self.n_jobs)
+    
     def calculate_rr_intervals(self, r_peaks):
         """
         Calculate RR intervals in milliseconds
@@ -69,18 +90,90 @@ class HeartRateCalculator:
         
         return hr_values
     
-    def calculate_statistics(self, signal):
+    def calculate_trends(self, r_peaks, rr_intervals, signal_length, interval_seconds=60):
+        """
+        Per-interval HR/HRV trend series
+        
+        Each RR interval is assigned to the interval containing its ending
+        beat; all statistics are segmented reductions (bincount /
+        reduceat) over the RR array, so the cost is O(n) in beats.
+        
+        Args:
+            r_peaks: Array of R-peak sample indices (sorted)
+            rr_intervals: RR intervals in milliseconds (len(r_peaks) - 1)
+            signal_length: Length of the analyzed signal in samples
+            interval_seconds: Trend bin width in seconds
+            
+        Returns:
+            Dictionary of equal-length series, one entry per interval.
+            Intervals without enough beats have null statistics.
+        """
+        interval_samples = interval_seconds * self.sample_rate
+        n_bins = max(1, int(np.ceil(signal_length / interval_samples)))
+        
+        valid = rr_intervals > 0
+        rr = rr_intervals[valid]
+        bins = (np.asarray(r_peaks[1:])[valid] // interval_samples).astype(np.int64)
+        hr = np.clip(60000 / rr, 30, 250)
+        
+        # Counts, sums and sums of squares per bin
+        count = np.bincount(bins, minlength=n_bins)
+        hr_sum = np.bincount(bins, weights=hr, minlength=n_bins)
+        rr_sum = np.bincount(bins, weights=rr, minlength=n_bins)
+        rr_sq_sum = np.bincount(bins, weights=rr ** 2, minlength=n_bins)
+        
+        # Min/max over contiguous runs of the (sorted) bin ids
+        hr_min = np.full(n_bins, np.nan)
+        hr_max = np.full(n_bins, np.nan)
+        if len(bins) > 0:
+            run_starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+            run_bins = bins[run_starts]
+            hr_min[run_bins] = np.minimum.reduceat(hr, run_starts)
+            hr_max[run_bins] = np.maximum.reduceat(hr, run_starts)
+        
+        # Successive differences only count when both intervals share a bin
+        rr_diff = np.diff(rr)
+        same_bin = bins[1:] == bins[:-1]
+        diff_bins = bins[1:][same_bin]
+        diff_count = np.bincount(diff_bins, minlength=n_bins)
+        diff_sq_sum = np.bincount(diff_bins, weights=rr_diff[same_bin] ** 2, minlength=n_bins)
+        nn50 = np.bincount(diff_bins, weights=np.abs(rr_diff[same_bin]) > 50, minlength=n_bins)
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            hr_mean = hr_sum / count
+            rr_mean = rr_sum / count
+            sdnn = np.sqrt(np.maximum(rr_sq_sum / count - rr_mean ** 2, 0))
+            rmssd = np.sqrt(diff_sq_sum / diff_count)
+            pnn50 = 100 * nn50 / diff_count
+        
+        def series(values, decimals):
+            return [None if np.isnan(v) else round(float(v), decimals) for v in values]
+        
+        return {
+            'interval_seconds': interval_seconds,
+            'start_seconds': (np.arange(n_bins) * interval_seconds).tolist(),
+            'beat_count': count.tolist(),
+            'mean_bpm': series(hr_mean, 1),
+            'min_bpm': series(hr_min, 1),
+            'max_bpm': series(hr_max, 1),
+            'sdnn_ms': series(sdnn, 2),
+            'rmssd_ms': series(rmssd, 2),
+            'pnn50_percent': series(pnn50, 2)
+        }
+    
+    def calculate_statistics(self, signal, trend_intervals=(60, 300)):
         """
         Calculate comprehensive HR statistics
         
         Args:
             signal: Raw ECG signal
+            trend_intervals: Bin widths (seconds) for the HR/HRV trend series
             
         Returns:
             Dictionary with HR statistics
         """
         # Detect R-peaks
-        r_peaks = self.qrs_detector.detect(signal)
+        r_peaks = self.detect_r_peaks(signal)
         
         if len(r_peaks) < 2:
             return {
@@ -139,11 +232,15 @@ class HeartRateCalculator:
                 'sdnn_ms': round(sdnn, 2),
                 'rmssd_ms': round(rmssd, 2),
                 'pnn50_percent': round(pnn50, 2)
+            },
+            'trends': {
+                f'{interval}s': self.calculate_trends(r_peaks, rr_intervals, len(signal), interval)
+                for interval in trend_intervals
             }
         }
 
 
-def calculate_heart_rate(signal, sample_rate=250):
+def calculate_heart_rate(signal, sample_rate=250, n_jobs=1):
     """Convenience function for HR calculation"""
-    calculator = HeartRateCalculator(sample_rate)
+    calculator = HeartRateCalculator(sample_rate, n_jobs=n_jobs)
     return calculator.calculate_statistics(signal)
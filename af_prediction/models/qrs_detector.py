@@ -13,12 +13,69 @@ Algorithm Steps:
 3. Squaring
 4. Moving window integration
 5. Adaptive thresholding
+
+QRSDetector processes a whole recording offline (zero-phase filtering),
+detect_qrs_parallel splits long recordings across processes, and
+StreamingQRSDetector runs the same steps causally over incoming chunks.
+
+QRSDetector keeps float32 input in float32 through every stage (other
+input is processed as float64), and the derivative, squaring and
+integration stages reuse two signal-sized buffers. Only the integrator's
+running sum is float64, accumulated block by block.
 """
 
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing import shared_memory
+
 import numpy as np
 from scipy import signal as scipy_signal
 
 
+# 5-point derivative kernel in np.convolve order:
+# y[n] = (x[n+2] + 2x[n+1] - 2x[n-1] - x[n-2]) / 8
+DERIVATIVE_KERNEL = np.array([1, 2, 0, -2, -1], dtype=np.float64) / 8
+
+# Samples per block of the float64 running sum in moving_window_integration
+INTEGRATION_BLOCK = 1 << 16
+
+
+def as_float_signal(signal):
+    """float32/float64 arrays as they are (no copy), anything else as float64"""
+    signal = np.asarray(signal)
+    if signal.dtype in (np.float32, np.float64):
+        return signal
+    return signal.astype(np.float64)
+
+
+@lru_cache(maxsize=32)
+def design_bandpass_sos(sample_rate, lowcut=5, highcut=15, order=2):
+    """
+    Design (and cache) the Butterworth band-pass in SOS form
+
+    Coefficients only depend on the sample rate and band edges, so they are
+    designed once per configuration instead of on every detect() call.
+    """
+    nyquist = sample_rate / 2
+    sos = scipy_signal.butter(order, [lowcut / nyquist, highcut / nyquist],
+                              btype='band', output='sos')
+    return sos
+
+
+def find_local_maxima(signal):
+    """
+    Indices of strict local maxima (x[i-1] < x[i] > x[i+1])
+
+    Vectorized replacement for a per-sample comparison loop.
+    """
+    if len(signal) < 3:
+        return np.array([], dtype=np.int64)
+    center = signal[1:-1]
+    is_max = (center > signal[:-2]) & (center > signal[2:])
+    return np.flatnonzero(is_max) + 1
+
+
 class QRSDetector:
     """
     Pan-Tompkins QRS Detection
@@ -39,50 +96,101 @@ class QRSDetector:
         The QRS complex has energy mainly in 5-15 Hz range.
         This filter removes baseline wander and high-frequency noise.
         """
-        nyquist = self.sample_rate / 2
-        low = lowcut / nyquist
-        high = highcut / nyquist
-        
-        # Butterworth band-pass filter
-        b, a = scipy_signal.butter(2, [low, high], btype='band')
-        filtered = scipy_signal.filtfilt(b, a, signal)
+        # Butterworth band-pass filter (zero-phase, SOS for numerical stability);
+        # coefficients in the signal's dtype so float32 stays float32
+        sos = design_bandpass_sos(self.sample_rate, lowcut, highcut)
+        filtered = scipy_signal.sosfiltfilt(sos.astype(signal.dtype, copy=False), signal)
         
         return filtered
     
-    def derivative_filter(self, signal):
+    def derivative_filter(self, signal, out=None):
         """
         5-point derivative filter to emphasize slope
         
         Highlights rapid changes in the signal (QRS upstroke/downstroke)
+        
+        Args:
+            signal: Band-passed signal
+            out: Optional preallocated output (same length and dtype)
         """
-        # 5-point derivative: H(z) = (1/8T)(-z^-2 - 2z^-1 + 2z + z^2)
-        derivative = np.zeros_like(signal)
-        for i in range(2, len(signal) - 2):
-            derivative[i] = (-signal[i-2] - 2*signal[i-1] + 2*signal[i+1] + signal[i+2]) / 8
+        # 5-point derivative: H(z) = (1/8T)(-z^-2 - 2z^-1 + 2z + z^2),
+        # accumulated in place; the 2 edge samples on each side stay 0
+        derivative = np.empty_like(signal) if out is None else out
+        derivative[:2] = 0
+        derivative[-2:] = 0
+        if len(signal) > 4:
+            core = derivative[2:-2]
+            np.subtract(signal[3:-1], signal[1:-3], out=core)
+            core *= 2
+            core += signal[4:]
+            core -= signal[:-4]
+            core /= 8
+        else:
+            derivative[:] = 0
         
         return derivative
     
-    def squaring(self, signal):
+    def squaring(self, signal, out=None):
         """
         Square the signal to amplify QRS and make all positive
         """
-        return signal ** 2
+        return np.square(signal, out=out)
     
-    def moving_window_integration(self, signal, window_ms=150):
+    def moving_window_integration(self, signal, window_ms=150, out=None):
         """
         Moving window integration for QRS duration
         
         Window of ~150ms corresponds to typical QRS width
+        
+        Args:
+            signal: Squared derivative
+            out: Optional preallocated output (same length and dtype;
+                may not be `signal` itself)
         """
         window_size = int(window_ms * self.sample_rate / 1000)
-        integrated = np.convolve(signal, np.ones(window_size) / window_size, mode='same')
+        n = len(signal)
+        integrated = np.empty_like(signal) if out is None else out
+        
+        # Running sum via cumulative sums: O(n) regardless of window size.
+        # Window alignment matches np.convolve(..., mode='same'): sample i
+        # averages [i - left, i + right), zero-padded at both ends, i.e.
+        # integrated[i] = P[i + width] - P[i] with P[j] = sum(signal[:j - left])
+        # (clipped to the signal). P is float64 and built block by block,
+        # so the only float64 buffer is one block long.
+        left = window_size // 2
+        right = (window_size - 1) // 2 + 1
+        width = left + right
+        
+        partial = np.empty(INTEGRATION_BLOCK + width + 1, dtype=np.float64)
+        carry = 0.0  # P[start]
+        for start in range(0, n, INTEGRATION_BLOCK):
+            stop = min(start + INTEGRATION_BLOCK, n)
+            span = stop - start + width
+            
+            # partial[k] = P[start + k]: carry plus increments signal[j - left]
+            block = partial[:span + 1]
+            block[0] = carry
+            block[1:] = 0
+            first = max(start - left, 0)
+            last = min(start + span - left, n)
+            if last > first:
+                block[1 + first - (start - left):1 + last - (start - left)] = signal[first:last]
+            np.cumsum(block, out=block)
+            
+            np.subtract(block[width:width + stop - start], block[:stop - start],
+                        out=integrated[start:stop], casting='same_kind')
+            carry = block[stop - start]
+        
+        integrated /= window_size
         return integrated
     
     def find_peaks(self, integrated_signal, original_signal, refractory_ms=200):
         """
         Adaptive thresholding to find R-peaks
         
-        Uses dual thresholds and learning from signal/noise peaks
+        Uses dual thresholds and learning from signal/noise peaks.
+        Candidate peaks are found with vectorized comparisons; only the
+        threshold state machine runs in Python, over candidates only.
         """
         peaks = []
         refractory_samples = int(refractory_ms * self.sample_rate / 1000)
@@ -94,21 +202,16 @@ class QRSDetector:
         threshold2 = 0.5 * threshold1
         
         # Find local maxima
-        local_max_indices = []
-        for i in range(1, len(integrated_signal) - 1):
-            if integrated_signal[i] > integrated_signal[i-1] and \
-               integrated_signal[i] > integrated_signal[i+1]:
-                local_max_indices.append(i)
+        local_max_indices = find_local_maxima(integrated_signal)
+        local_max_values = integrated_signal[local_max_indices]
         
         last_peak_idx = -refractory_samples
         
-        for idx in local_max_indices:
+        for idx, peak_val in zip(local_max_indices.tolist(), local_max_values.tolist()):
             # Refractory period check
             if idx - last_peak_idx < refractory_samples:
                 continue
             
-            peak_val = integrated_signal[idx]
-            
             if peak_val > threshold1:
                 # This is a QRS complex
                 peaks.append(idx)
@@ -174,8 +277,8 @@ class QRSDetector:
         Returns:
             r_peaks: Array of R-peak sample indices
         """
-        # Ensure numpy array
-        signal = np.array(signal, dtype=np.float64)
+        # Ensure numpy array (float32 input is processed in float32)
+        signal = as_float_signal(signal)
         
         # Step 1: Band-pass filter
         filtered = self.bandpass_filter(signal)
@@ -183,11 +286,11 @@ class QRSDetector:
         # Step 2: Derivative
         derivative = self.derivative_filter(filtered)
         
-        # Step 3: Squaring
-        squared = self.squaring(derivative)
+        # Step 3: Squaring (in place)
+        squared = self.squaring(derivative, out=derivative)
         
-        # Step 4: Moving window integration
-        integrated = self.moving_window_integration(squared)
+        # Step 4: Moving window integration, into the no longer needed filtered buffer
+        integrated = self.moving_window_integration(squared, out=filtered)
         
         # Step 5: Adaptive thresholding
         peaks = self.find_peaks(integrated, signal)
@@ -198,6 +301,363 @@ class QRSDetector:
         return r_peaks
 
 
+def _detect_segment(shm_name, length, dtype, sample_rate, start, end):
+    """
+    Process-pool worker: detect R-peaks in signal[start:end] of a shared
+    memory buffer (absolute sample indices)
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        signal = np.ndarray((length,), dtype=dtype, buffer=shm.buf)
+        peaks = QRSDetector(sample_rate).detect(signal[start:end])
+    finally:
+        shm.close()
+    
+    return peaks.astype(np.int64) + start
+
+
+def _handover_peak(earlier, later, window_start, window_end, min_common=4):
+    """
+    Peak at which the later of two overlapping segments takes over
+    
+    Both peak lists are compared inside [window_start, window_end). When
+    they end in a common run of at least `min_common` peaks, the later
+    segment's thresholds make the same decisions as the earlier one's;
+    the handover is the first peak of that run. None if they do not agree.
+    """
+    a = earlier[(earlier >= window_start) & (earlier < window_end)]
+    b = later[(later >= window_start) & (later < window_end)]
+    common = 0
+    while common < min(len(a), len(b)) and a[len(a) - 1 - common] == b[len(b) - 1 - common]:
+        common += 1
+    return int(b[len(b) - common]) if common >= min_common else None
+
+
+def detect_qrs_parallel(signal, sample_rate=250, n_jobs=None,
+                        segment_seconds=600, overlap_seconds=30, refractory_ms=200):
+    """
+    Multi-core QRS detection for long recordings
+    
+    The signal is placed in shared memory once and split into segments
+    that each own a core range, extended by `overlap_seconds` on both
+    sides so filter edge effects and threshold learning settle. Workers
+    run QRSDetector.detect on their whole extended segment.
+    
+    Stitching reconciles each pair of neighbouring segments inside the
+    middle of their overlap (half the overlap away from either segment
+    edge): the earlier segment's peaks are kept up to the first peak from
+    which both segments detect the same peaks, the later segment's peaks
+    from there on. The earlier segment carries the longer threshold
+    history, so this follows the single-core detector. The adaptive
+    thresholds of two segments converge but never become bit-identical,
+    so on very noisy signals (where the detector also fires on noise) a
+    small fraction of peaks can differ from single-core: ~2e-4 of peaks
+    on synthetic sinus rhythm with 0.15 mV noise, none on the AF and
+    moderate-noise recordings of benchmarks/qrs_parallel_check.py. Where
+    the segments never agree, the peaks are split at the core boundary,
+    dropping a pair closer than the refractory period.
+    
+    Args:
+        signal: Raw ECG signal
+        sample_rate: Sample rate (Hz)
+        n_jobs: Worker processes (default: all CPUs)
+        segment_seconds: Core length of each segment
+        overlap_seconds: Context added on each side of a core
+        
+    Returns:
+        r_peaks: Array of R-peak sample indices
+    """
+    signal = as_float_signal(signal)
+    n_jobs = n_jobs or os.cpu_count() or 1
+    segment = int(segment_seconds * sample_rate)
+    overlap = int(overlap_seconds * sample_rate)
+    
+    # Not worth a process pool for short signals
+    if n_jobs == 1 or len(signal) <= 2 * segment:
+        return QRSDetector(sample_rate).detect(signal)
+    
+    cores = [(s, min(s + segment, len(signal))) for s in range(0, len(signal), segment)]
+    
+    shm = shared_memory.SharedMemory(create=True, size=signal.nbytes)
+    try:
+        shared = np.ndarray(signal.shape, dtype=signal.dtype, buffer=shm.buf)
+        shared[:] = signal
+        
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(cores))) as pool:
+            futures = [
+                pool.submit(_detect_segment, shm.name, len(signal), signal.dtype.str, sample_rate,
+                            max(0, core_start - overlap), min(len(signal), core_end + overlap))
+                for core_start, core_end in cores
+            ]
+            segment_peaks = [future.result() for future in futures]
+        del shared
+    finally:
+        shm.close()
+        shm.unlink()
+    
+    refractory_samples = int(refractory_ms * sample_rate / 1000)
+    stitched = segment_peaks[0]
+    for (boundary, _), peaks in zip(cores[1:], segment_peaks[1:]):
+        handover = _handover_peak(stitched, peaks, boundary - overlap // 2, boundary + overlap // 2)
+        if handover is None:
+            # No agreement: split at the core boundary, dropping the later
+            # peak of a pair within the refractory period (same beat)
+            earlier, later = stitched[stitched < boundary], peaks[peaks >= boundary]
+            if len(earlier) > 0 and len(later) > 0 and later[0] - earlier[-1] < refractory_samples:
+                later = later[1:]
+        else:
+            earlier, later = stitched[stitched < handover], peaks[peaks >= handover]
+        stitched = np.concatenate([earlier, later])
+    
+    return stitched
+
+
+class RingBuffer:
+    """
+    Fixed-capacity ring buffer addressed by absolute sample index
+
+    Keeps the most recent `capacity` samples of an unbounded stream.
+    """
+    
+    def __init__(self, capacity, dtype=np.float64):
+        self.capacity = int(capacity)
+        self.buffer = np.zeros(self.capacity, dtype=dtype)
+        self.total = 0  # Samples written since start of stream
+    
+    @property
+    def oldest(self):
+        """Absolute index of the oldest sample still held"""
+        return max(0, self.total - self.capacity)
+    
+    def extend(self, values):
+        n_new = len(values)
+        values = values[-self.capacity:]
+        start = (self.total + n_new - len(values)) % self.capacity
+        first = min(len(values), self.capacity - start)
+        self.buffer[start:start + first] = values[:first]
+        self.buffer[:len(values) - first] = values[first:]
+        self.total += n_new
+    
+    def get(self, start, end):
+        """Samples [start, end) in absolute indices, clipped to what is held"""
+        start = max(start, self.oldest)
+        end = min(end, self.total)
+        if end <= start:
+            return np.array([], dtype=self.buffer.dtype)
+        return self.buffer[np.arange(start, end) % self.capacity]
+
+
+class StreamingQRSDetector:
+    """
+    Real-time Pan-Tompkins QRS detection over signal chunks
+    
+    Unlike QRSDetector.detect (zero-phase filtering, whole-signal
+    thresholds), every stage here is causal and carries its state across
+    calls to process():
+    - Band-pass and derivative filters keep their filter state (zi)
+    - Integrator, searchback and refine windows read from ring buffers
+    - SPKI/NPKI and the dual thresholds persist between chunks
+    
+    R-peaks are emitted at most `max_delay_samples` after they occur, so
+    live HR never requires reprocessing the recording history.
+    """
+    
+    def __init__(self, sample_rate=250, refractory_ms=200, search_window_ms=50,
+                 window_ms=150, learning_seconds=2, searchback_seconds=2):
+        self.sample_rate = sample_rate
+        self.refractory_samples = int(refractory_ms * sample_rate / 1000)
+        self.search_window = int(search_window_ms * sample_rate / 1000)
+        self.window_size = int(window_ms * sample_rate / 1000)
+        self.learning_samples = int(learning_seconds * sample_rate)
+        self.searchback_samples = int(searchback_seconds * sample_rate)
+        
+        # Chunks are processed in blocks so the ring buffers always cover
+        # the searchback and refine spans, whatever the caller's chunk size
+        self.block_size = max(1, self.searchback_samples // 2)
+        
+        self.sos = design_bandpass_sos(sample_rate)
+        
+        # Causal pipeline delay, used to map integrated peaks back onto the
+        # raw signal for refinement. The band-pass (group delay around
+        # 10 Hz) and derivative delay is fixed; the trailing integrator
+        # peaks anywhere up to one window after the QRS, so the refine
+        # window spans that whole range.
+        b, a = scipy_signal.sos2tf(self.sos)
+        _, bandpass_delay = scipy_signal.group_delay((b, a), w=[10], fs=sample_rate)
+        self.filter_delay = int(round(bandpass_delay[0] + 2))
+        self.pipeline_delay = self.filter_delay + self.window_size - 1
+        
+        # Worst case: a searchback peak confirmed by a candidate one
+        # searchback span later, at the end of a block
+        self.max_delay_samples = self.searchback_samples + self.block_size + self.search_window
+        
+        self.reset()
+    
+    def reset(self):
+        """Forget all stream state"""
+        self._bandpass_zi = None
+        self._derivative_zi = np.zeros(len(DERIVATIVE_KERNEL) - 1)
+        self._squared_tail = np.zeros(self.window_size - 1)
+        
+        integrated_capacity = self.searchback_samples + self.learning_samples + self.block_size
+        self._integrated = RingBuffer(integrated_capacity)
+        self._raw = RingBuffer(integrated_capacity + self.pipeline_delay + 2 * self.search_window)
+        
+        # Adaptive threshold state (None until the learning phase ends)
+        self.spki = None
+        self.npki = None
+        self.threshold1 = None
+        self.threshold2 = None
+        self._learning_candidates = []
+        self._last_peak_idx = -self.refractory_samples
+        self._last_qrs_idx = None
+        
+        self._pending = []  # Integrated-domain peaks awaiting refinement
+        self.r_peaks = []   # Most recent emitted R-peaks (for live HR)
+    
+    @property
+    def samples_seen(self):
+        return self._raw.total
+    
+    def _filter_block(self, block):
+        """Causal band-pass, derivative, squaring and integration"""
+        if self._bandpass_zi is None:
+            # Start in steady state for the first sample to avoid a step transient
+            self._bandpass_zi = scipy_signal.sosfilt_zi(self.sos) * block[0]
+        filtered, self._bandpass_zi = scipy_signal.sosfilt(self.sos, block, zi=self._bandpass_zi)
+        
+        # Causal 5-point derivative (2-sample delay)
+        derivative, self._derivative_zi = scipy_signal.lfilter(
+            DERIVATIVE_KERNEL, [1.0], filtered, zi=self._derivative_zi
+        )
+        squared = derivative ** 2
+        
+        # Trailing moving window integration, continued from the previous block
+        extended = np.concatenate([self._squared_tail, squared])
+        cumsum = np.concatenate([[0.0], np.cumsum(extended)])
+        integrated = (cumsum[self.window_size:] - cumsum[:-self.window_size]) / self.window_size
+        self._squared_tail = extended[len(extended) - (self.window_size - 1):]
+        
+        return integrated
+    
+    def _update_thresholds(self):
+        self.threshold1 = self.npki + 0.25 * (self.spki - self.npki)
+        self.threshold2 = 0.5 * self.threshold1
+    
+    def _classify(self, idx, peak_val):
+        """Adaptive threshold state machine for one candidate peak"""
+        if idx - self._last_peak_idx < self.refractory_samples:
+            return
+        
+        if peak_val > self.threshold1:
+            # This is a QRS complex
+            self._pending.append(idx)
+            self._last_peak_idx = idx
+            self._last_qrs_idx = idx
+            self.spki = 0.125 * peak_val + 0.875 * self.spki
+        elif peak_val > self.threshold2:
+            # Search back (bounded) for a QRS missed since the last one
+            if self._last_qrs_idx is not None:
+                search_start = max(self._last_qrs_idx + self.refractory_samples,
+                                   idx - self.searchback_samples,
+                                   self._integrated.oldest)
+                if search_start < idx:
+                    searchback = self._integrated.get(search_start, idx)
+                    if len(searchback) > 0 and np.max(searchback) > self.threshold2:
+                        sb_offset = int(np.argmax(searchback))
+                        sb_idx = sb_offset + search_start
+                        if sb_idx - self._last_peak_idx >= self.refractory_samples:
+                            self._pending.append(sb_idx)
+                            self._last_qrs_idx = sb_idx
+                            self.spki = 0.25 * searchback[sb_offset] + 0.75 * self.spki
+            
+            self.npki = 0.125 * peak_val + 0.875 * self.npki
+        else:
+            # This is noise
+            self.npki = 0.125 * peak_val + 0.875 * self.npki
+        
+        self._update_thresholds()
+    
+    def _refine_ready(self):
+        """Refine pending peaks whose raw search window has fully arrived"""
+        emitted = []
+        remaining = []
+        for peak in sorted(self._pending):
+            start = max(0, peak - self.pipeline_delay - self.search_window, self._raw.oldest)
+            end = peak - self.filter_delay + self.search_window
+            if end > self._raw.total:
+                remaining.append(peak)
+                continue
+            
+            window = self._raw.get(start, end)
+            if len(window) == 0:
+                continue
+            refined = start + int(np.argmax(np.abs(window)))
+            if self.r_peaks and refined <= self.r_peaks[-1]:
+                continue
+            emitted.append(refined)
+            self.r_peaks.append(refined)
+        
+        self._pending = remaining
+        del self.r_peaks[:-32]
+        return emitted
+    
+    def _process_block(self, block):
+        offset = self._raw.total
+        integrated = self._filter_block(block)
+        
+        # Local maxima, including the two samples carried from the previous block
+        carry = self._integrated.get(offset - 2, offset)
+        extended = np.concatenate([carry, integrated])
+        local_max = find_local_maxima(extended)
+        candidates = zip((local_max + offset - len(carry)).tolist(), extended[local_max].tolist())
+        
+        self._raw.extend(block)
+        self._integrated.extend(integrated)
+        
+        if self.spki is None:
+            # Learning phase: initialize thresholds from the first seconds, as in find_peaks
+            self._learning_candidates.extend(candidates)
+            if self._integrated.total < self.learning_samples:
+                return []
+            learning = self._integrated.get(0, self.learning_samples)
+            self.spki = np.max(learning) * 0.25
+            self.npki = np.mean(learning) * 0.5
+            self._update_thresholds()
+            candidates = self._learning_candidates
+            self._learning_candidates = []
+        
+        for idx, peak_val in candidates:
+            self._classify(idx, peak_val)
+        
+        return self._refine_ready()
+    
+    def process(self, chunk):
+        """
+        Feed the next chunk of raw ECG samples
+        
+        Args:
+            chunk: Consecutive raw ECG samples (any length)
+            
+        Returns:
+            Array of newly confirmed R-peak indices (absolute sample
+            positions since the start of the stream)
+        """
+        chunk = np.asarray(chunk, dtype=np.float64)
+        emitted = []
+        for start in range(0, len(chunk), self.block_size):
+            emitted.extend(self._process_block(chunk[start:start + self.block_size]))
+        return np.array(emitted, dtype=np.int64)
+    
+    def current_heart_rate(self, n_beats=8):
+        """Live heart rate (BPM) from the most recent R-peaks, or None"""
+        recent = self.r_peaks[-(n_beats + 1):]
+        if len(recent) < 2:
+            return None
+        mean_rr = np.mean(np.diff(recent)) / self.sample_rate
+        return float(60 / mean_rr)
+
+
 def detect_qrs(signal, sample_rate=250):
     """Convenience function for QRS detection"""
     detector = QRSDetector(sample_rate)
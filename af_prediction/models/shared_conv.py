@@ -0,0 +1,219 @@
+"""
+Shared convolutional front end for overlapping windows
+
+With 50% window overlap every sample is seen by two windows, so the
+windowed CNN-LSTM computes its Conv1D/BatchNorm/MaxPool front end twice
+for most of the signal. SharedConvRunner splits the model into:
+- front end: the leading stride-1 'same' Conv1D, BatchNormalization,
+  activation and non-overlapping pooling layers
+- head: the remaining layers (LSTM, Dense)
+It runs the front end once over a signal segment covering a group of
+consecutive windows, cuts each window's feature sequence out of the
+segment features and runs the head on those slices.
+
+Pooling phases: a window needs pooling aligned to its own start. With a
+1250-sample step and a total pooling stride of 8, windows do not all
+share one pooling grid, so at each pooling layer the sequence is pooled
+at every phase some window needs. Layers before a pooling layer run
+once; for the CNN-LSTM, conv 1 and conv 2 are computed once per sample
+instead of twice, while conv 3 runs on two pooling phases (as many
+positions as in the windowed model).
+
+Window edges: the windowed model zero-pads each window ('same' padding),
+while the segment features near a window edge see the neighbouring
+samples. The first and last `margin` features of each window are
+recomputed from short edge segments of the window, so results match the
+windowed model up to float rounding.
+"""
+
+import numpy as np
+from tensorflow import keras
+
+POOL_LAYERS = (keras.layers.MaxPooling1D, keras.layers.AveragePooling1D)
+FRONT_LAYERS = (
+    keras.layers.Conv1D, keras.layers.BatchNormalization,
+    keras.layers.Activation, keras.layers.ReLU
+) + POOL_LAYERS
+
+# Windows per shared segment (bounds the memory of the feature maps)
+GROUP_WINDOWS = 64
+
+
+def split_model(model):
+    """
+    Split a Sequential model into (front layers, head layers)
+    
+    Raises:
+        ValueError: the front end cannot be shared across windows
+            (strided, dilated or 'valid' convolutions, overlapping or
+            padded pooling, or no convolutional front end)
+    """
+    front = []
+    for layer in model.layers:
+        if not isinstance(layer, FRONT_LAYERS):
+            break
+        front.append(layer)
+    
+    if not any(isinstance(layer, keras.layers.Conv1D) for layer in front):
+        raise ValueError("no convolutional front end")
+    for layer in front:
+        if isinstance(layer, keras.layers.Conv1D):
+            if tuple(layer.strides) != (1,) or tuple(layer.dilation_rate) != (1,) or layer.padding != 'same':
+                raise ValueError(f"{layer.name}: only stride-1, undilated 'same' convolutions can be shared")
+        elif isinstance(layer, POOL_LAYERS):
+            if tuple(layer.pool_size) != tuple(layer.strides) or layer.padding != 'valid':
+                raise ValueError(f"{layer.name}: only non-overlapping 'valid' pooling can be shared")
+    
+    return front, model.layers[len(front):]
+
+
+class SharedConvRunner:
+    """Window predictions with the convolutional front end shared across overlapping windows"""
+    
+    def __init__(self, model, window_size, group_windows=GROUP_WINDOWS):
+        self.front, self.head = split_model(model)
+        self.window_size = window_size
+        self.group_windows = group_windows
+        
+        self.stride = int(np.prod([layer.strides[0] for layer in self.front if isinstance(layer, POOL_LAYERS)]))
+        self.feature_length = self._feature_length(window_size)
+        self.margin = self._edge_margin()
+        if self.feature_length < 4 * self.margin:
+            raise ValueError("window too short for a shared front end")
+        
+        dense = [layer for layer in self.head if isinstance(layer, keras.layers.Dense)]
+        self.penultimate = dense[-2] if len(dense) >= 2 else None
+        
+        # Multiply-accumulates of the Conv1D layers computed so far
+        self.conv_macs = 0
+    
+    def _feature_length(self, length):
+        for layer in self.front:
+            if isinstance(layer, POOL_LAYERS):
+                length //= layer.strides[0]
+        return length
+    
+    def _edge_margin(self):
+        """Features at each window edge that depend on the window's zero padding"""
+        affected = 0
+        for layer in self.front:
+            if isinstance(layer, keras.layers.Conv1D):
+                affected += layer.kernel_size[0] // 2
+            elif isinstance(layer, POOL_LAYERS):
+                affected = -(-affected // layer.strides[0])
+        return max(affected, 1)
+    
+    def windowed_conv_macs(self, n_windows):
+        """Conv1D multiply-accumulates of the windowed model for n_windows"""
+        macs = 0
+        length = self.window_size
+        for layer in self.front:
+            if isinstance(layer, keras.layers.Conv1D):
+                macs += length * layer.kernel_size[0] * int(layer.kernel.shape[1]) * layer.filters
+            elif isinstance(layer, POOL_LAYERS):
+                length //= layer.strides[0]
+        return n_windows * macs
+    
+    def _front(self, x, starts):
+        """
+        Front end over x (batch, length, channels), pooled at the phases
+        needed by windows starting at `starts`
+        
+        Returns:
+            (sequences by phase key, phase key per window, window start
+            per window in its feature sequence)
+        """
+        sequences = {(): x}
+        keys = [()] * len(starts)
+        starts = np.asarray(starts, dtype=np.int64)
+        
+        for layer in self.front:
+            if isinstance(layer, POOL_LAYERS):
+                stride = layer.strides[0]
+                phases = starts % stride
+                keys = [key + (int(phase),) for key, phase in zip(keys, phases)]
+                sequences = {
+                    key: np.asarray(layer(sequences[key[:-1]][:, key[-1]:], training=False))
+                    for key in set(keys)
+                }
+                starts = (starts - phases) // stride
+            else:
+                if isinstance(layer, keras.layers.Conv1D):
+                    positions = sum(seq.shape[0] * seq.shape[1] for seq in sequences.values())
+                    self.conv_macs += positions * layer.kernel_size[0] * int(layer.kernel.shape[1]) * layer.filters
+                sequences = {key: np.asarray(layer(seq, training=False)) for key, seq in sequences.items()}
+        
+        return sequences, keys, starts
+    
+    def _edge_features(self, segments):
+        """Front-end features of a batch of equal-length edge segments"""
+        sequences, _, _ = self._front(segments[:, :, None], np.zeros(len(segments), dtype=np.int64))
+        return next(iter(sequences.values()))
+    
+    def _head(self, features, return_embeddings):
+        x = features
+        embeddings = None
+        for layer in self.head:
+            x = np.asarray(layer(x, training=False))
+            if layer is self.penultimate:
+                embeddings = x
+        return x.reshape(len(features), -1)[:, 0], embeddings
+    
+    def _groups(self, starts):
+        """(first, last) index ranges of overlapping consecutive windows"""
+        first = 0
+        for i in range(1, len(starts) + 1):
+            if (i == len(starts) or i - first >= self.group_windows
+                    or starts[i] >= starts[i - 1] + self.window_size):
+                yield first, i
+                first = i
+    
+    def predict(self, signal, starts, return_embeddings=False):
+        """
+        Predict the windows signal[start:start + window_size]
+        
+        Args:
+            signal: Preprocessed signal (model rate)
+            starts: Window start samples, ascending
+            return_embeddings: Also return the penultimate Dense output
+        
+        Returns:
+            AF probabilities, or (probabilities, embeddings)
+        """
+        if return_embeddings and self.penultimate is None:
+            raise ValueError("Model has no penultimate Dense layer")
+        
+        signal = np.asarray(signal, dtype=np.float32)
+        starts = np.asarray(starts, dtype=np.int64)
+        size, length, margin, stride = self.window_size, self.feature_length, self.margin, self.stride
+        right_offset = (length - 2 * margin) * stride
+        
+        probabilities = np.empty(len(starts), dtype=np.float32)
+        embeddings = None
+        
+        for first, last in self._groups(starts):
+            group = starts[first:last]
+            segment = signal[group[0]:group[-1] + size]
+            sequences, keys, feature_starts = self._front(segment[None, :, None], group - group[0])
+            features = np.stack([
+                sequences[key][0, start:start + length] for key, start in zip(keys, feature_starts)
+            ])
+            
+            # Window edges as in the windowed model (zero padding at the window ends)
+            features[:, :margin] = self._edge_features(
+                np.stack([signal[s:s + 2 * margin * stride] for s in group])
+            )[:, :margin]
+            features[:, length - margin:] = self._edge_features(
+                np.stack([signal[s + right_offset:s + size] for s in group])
+            )[:, margin:2 * margin]
+            
+            group_probabilities, group_embeddings = self._head(features, return_embeddings)
+            probabilities[first:last] = group_probabilities
+            if return_embeddings:
+                if embeddings is None:
+                    embeddings = np.empty((len(starts), group_embeddings.shape[1]), dtype=np.float32)
+                embeddings[first:last] = group_embeddings
+        
+        if return_embeddings:
+            return probabilities, embeddings
+        return probabilities
@@ -0,0 +1,171 @@
+"""
+Per-window ECG signal quality index (SQI)
+
+Mobile recordings contain lead-off flat lines, amplifier saturation,
+muscle noise and motion artifacts. Running the AF model on such windows
+wastes model calls and can produce false AF events, so each window is
+scored first and windows failing any check are excluded from inference.
+
+Checks (all vectorized over a (n_windows, window_size) array, e.g. the
+strided window view from AFPredictor.create_windows):
+- flatline: fraction of consecutive samples that do not change
+- amplitude: peak-to-peak amplitude relative to the recording's median
+  window; lead-off segments are near zero even when resampling ripple
+  keeps them from being exactly flat
+- clipping: fraction of samples pinned at the window's min/max
+- hf_noise: share of signal power above 40 Hz (EMG / electrical noise)
+- kurtosis: kurtosis of the window band-passed to the QRS band
+  (5-15 Hz); QRS complexes make a readable ECG very peaked in that band,
+  noise and motion artifacts are close to Gaussian (3). The band-pass
+  removes baseline wander, and unlike a first difference it does not
+  amplify white noise until the QRS peaks drown in it.
+"""
+
+import numpy as np
+
+# Windows are assessed in blocks to bound float64 temporaries
+BLOCK_WINDOWS = 256
+
+QUALITY_THRESHOLDS = {
+    'flatline_fraction': 0.25,   # max
+    'amplitude_ratio': 0.10,     # min
+    'clipping_fraction': 0.10,   # max
+    'hf_noise_ratio': 0.30,      # max
+    'kurtosis': 4.0,             # min
+}
+
+HF_CUTOFF_HZ = 40.0
+LF_CUTOFF_HZ = 0.5
+QRS_BAND_HZ = (5.0, 15.0)
+
+
+def _assess_block(block, sample_rate):
+    x = np.asarray(block, dtype=np.float64)
+    value_range = np.ptp(x, axis=1)
+    diff = np.diff(x, axis=1)
+    
+    # Flat line: no change relative to the window's own range
+    flat_tol = 1e-4 * np.maximum(value_range, 1e-12)
+    flatline = np.mean(np.abs(diff) <= flat_tol[:, None], axis=1)
+    
+    # Clipping: samples within 1% of the window's extremes
+    clip_tol = (0.01 * value_range)[:, None]
+    clipping = np.mean(
+        (x >= x.max(axis=1, keepdims=True) - clip_tol) | (x <= x.min(axis=1, keepdims=True) + clip_tol),
+        axis=1
+    )
+    
+    # High-frequency noise: power above 40 Hz over power above 0.5 Hz
+    centered = x - x.mean(axis=1, keepdims=True)
+    spectrum = np.fft.rfft(centered, axis=1)
+    power = spectrum.real * spectrum.real + spectrum.imag * spectrum.imag
+    freqs = np.fft.rfftfreq(x.shape[1], 1 / sample_rate)
+    band_power = power[:, freqs >= LF_CUTOFF_HZ].sum(axis=1)
+    hf_noise = power[:, freqs >= HF_CUTOFF_HZ].sum(axis=1) / np.maximum(band_power, 1e-30)
+    
+    # Kurtosis of the QRS band (5-15 Hz). The FFT filter is circular, so
+    # the line joining the window's end points is removed first; otherwise
+    # the jump from the last to the first sample becomes a spike
+    ramp = np.linspace(0.0, 1.0, x.shape[1])
+    continuous = x - x[:, :1] - (x[:, -1:] - x[:, :1]) * ramp
+    spectrum = np.fft.rfft(continuous, axis=1)
+    spectrum[:, (freqs < QRS_BAND_HZ[0]) | (freqs > QRS_BAND_HZ[1])] = 0
+    d = np.fft.irfft(spectrum, n=x.shape[1], axis=1)
+    d *= d
+    variance = np.mean(d, axis=1)
+    d *= d
+    kurtosis = np.mean(d, axis=1) / np.maximum(variance * variance, 1e-30)
+    
+    return value_range, flatline, clipping, hf_noise, kurtosis
+
+
+def assess_windows(windows, sample_rate=250, thresholds=None):
+    """
+    Signal quality of each window
+    
+    Args:
+        windows: (n_windows, window_size) or (n_windows, window_size, 1) array
+        sample_rate: Sample rate (Hz)
+        thresholds: Overrides for QUALITY_THRESHOLDS
+    
+    Returns:
+        dict with per-window arrays 'flatline_fraction', 'amplitude_ratio',
+        'clipping_fraction', 'hf_noise_ratio', 'kurtosis' and the boolean
+        mask 'usable'
+    """
+    limits = dict(QUALITY_THRESHOLDS, **(thresholds or {}))
+    if windows.ndim == 3:
+        windows = windows[..., 0]
+    
+    n_windows = len(windows)
+    value_range = np.empty(n_windows)
+    flatline = np.empty(n_windows)
+    clipping = np.empty(n_windows)
+    hf_noise = np.empty(n_windows)
+    kurtosis = np.empty(n_windows)
+    
+    for start in range(0, n_windows, BLOCK_WINDOWS):
+        end = start + BLOCK_WINDOWS
+        (value_range[start:end], flatline[start:end], clipping[start:end],
+         hf_noise[start:end], kurtosis[start:end]) = _assess_block(windows[start:end], sample_rate)
+    
+    typical_range = np.median(value_range) if n_windows else 0.0
+    amplitude = value_range / typical_range if typical_range > 0 else np.zeros(n_windows)
+    
+    usable = (
+        (flatline <= limits['flatline_fraction'])
+        & (amplitude >= limits['amplitude_ratio'])
+        & (clipping <= limits['clipping_fraction'])
+        & (hf_noise <= limits['hf_noise_ratio'])
+        & (kurtosis >= limits['kurtosis'])
+    )
+    
+    return {
+        'flatline_fraction': flatline,
+        'amplitude_ratio': amplitude,
+        'clipping_fraction': clipping,
+        'hf_noise_ratio': hf_noise,
+        'kurtosis': kurtosis,
+        'usable': usable
+    }
+
+
+def rejection_counts(quality, thresholds=None):
+    """Number of windows failing each check (a window can fail several)"""
+    limits = dict(QUALITY_THRESHOLDS, **(thresholds or {}))
+    return {
+        'flatline': int(np.sum(quality['flatline_fraction'] > limits['flatline_fraction'])),
+        'low_amplitude': int(np.sum(quality['amplitude_ratio'] < limits['amplitude_ratio'])),
+        'clipping': int(np.sum(quality['clipping_fraction'] > limits['clipping_fraction'])),
+        'hf_noise': int(np.sum(quality['hf_noise_ratio'] > limits['hf_noise_ratio'])),
+        'low_kurtosis': int(np.sum(quality['kurtosis'] < limits['kurtosis'])),
+    }
+
+
+def unusable_samples(positions, usable, signal_length):
+    """
+    Number of samples covered only by unusable windows
+    
+    Samples covered by at least one usable window count as analyzed, so
+    with overlapping windows a bad window only removes the time no good
+    neighbour covers.
+    """
+    positions = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+    usable = np.asarray(usable, dtype=bool)
+    if len(positions) == 0:
+        return 0
+    
+    # Window edges fall on a coarse grid (the step size for regular windows)
+    unit = int(np.gcd.reduce(positions.ravel()))
+    unit = unit if unit > 0 else 1
+    cells = positions // unit
+    n_cells = -(-signal_length // unit)
+    
+    def covered(mask):
+        edges = np.zeros(n_cells + 1, dtype=np.int64)
+        np.add.at(edges, cells[mask, 0], 1)
+        np.add.at(edges, cells[mask, 1], -1)
+        return np.cumsum(edges[:-1]) > 0
+    
+    only_bad = covered(np.ones(len(positions), dtype=bool)) & ~covered(usable)
+    return int(np.sum(only_bad)) * unit
@@ -0,0 +1,219 @@
+"""
+Multi-resolution min/max waveform pyramid for ECG viewers
+
+Rendering hours of ECG does not need every sample: at any zoom level a
+viewer only needs the min and max of the samples under each pixel.
+The pyramid stores the signal at 1x and min/max envelopes at coarser
+decimation factors (8x, 64x, 512x by default), each level built from the
+previous one with a vectorized reduceat. Values are quantized to int16
+with a per-recording offset/scale, so a level costs 2 bytes (1x) or
+4 bytes (min+max) per bucket, and each level is a separate .npy file
+that is memory-mapped when serving tiles.
+
+Usage:
+    store = PyramidStore()
+    store.save('recording_42', signal, sample_rate=250)
+    tile = store.tile('recording_42', level=64, start_seconds=0, end_seconds=600)
+"""
+
+import os
+import json
+import time
+import shutil
+
+import numpy as np
+
+from utils.file_lock import file_lock
+
+PYRAMID_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'pyramids')
+
+DEFAULT_FACTORS = (1, 8, 64, 512)
+MAX_TILE_BUCKETS = 8192  # Larger requests should use a coarser level
+INT16_MAX = 32767
+
+
+def quantization(signal):
+    """(offset, scale) mapping the signal range onto int16"""
+    if len(signal) == 0:
+        return 0.0, 1.0
+    lo = float(np.min(signal))
+    hi = float(np.max(signal))
+    offset = (hi + lo) / 2
+    scale = (hi - lo) / (2 * INT16_MAX) if hi > lo else 1.0
+    return offset, scale
+
+
+def build_levels(signal, factors=DEFAULT_FACTORS):
+    """
+    Min/max envelopes at each decimation factor
+    
+    Each level is reduced from the previous one, so the total work is
+    about one pass over the signal.
+    
+    Args:
+        signal: 1-D signal
+        factors: Increasing decimation factors, each dividing the next
+    
+    Returns:
+        dict factor -> (mins, maxs); for factor 1 both are the signal
+    """
+    factors = sorted(factors)
+    levels = {}
+    mins = maxs = np.asarray(signal)
+    current = 1
+    
+    for factor in factors:
+        if factor % current:
+            raise ValueError(f"Factor {factor} is not a multiple of {current}")
+        step = factor // current
+        if step > 1:
+            # reduceat also covers the partial bucket at the end
+            starts = np.arange(0, len(mins), step)
+            mins = np.minimum.reduceat(mins, starts)
+            maxs = np.maximum.reduceat(maxs, starts)
+        levels[factor] = (mins, maxs)
+        current = factor
+    
+    return levels
+
+
+class PyramidStore:
+    """
+    On-disk pyramids, one directory per key:
+        <key>/meta.json, <key>/level_1.npy (n,), <key>/level_<f>.npy (n/f, 2)
+    
+    <key> is a symlink to a versioned directory (<key>.v<version>); save()
+    writes a new version and swaps the link atomically, so <key> always
+    names a complete pyramid. Saves of one key hold its file lock
+    (.<key>.lock), so concurrent builds cannot orphan a version.
+    """
+    
+    def __init__(self, root=PYRAMID_DIR):
+        self.root = root
+    
+    def _path(self, key):
+        if not key or os.sep in key or key.startswith('.'):
+            raise ValueError(f"Invalid pyramid key: {key!r}")
+        return os.path.join(self.root, key)
+    
+    def exists(self, key):
+        return os.path.exists(os.path.join(self._path(key), 'meta.json'))
+    
+    def save(self, key, signal, sample_rate, factors=DEFAULT_FACTORS):
+        """
+        Build and store the pyramid of a signal (replaces an existing one)
+        
+        Returns:
+            Pyramid metadata
+        """
+        path = self._path(key)
+        os.makedirs(self.root, exist_ok=True)
+        with file_lock(os.path.join(self.root, f'.{key}.lock')):
+            return self._save(path, signal, sample_rate, factors)
+    
+    def _save(self, path, signal, sample_rate, factors):
+        """save() body; the caller holds the key's file lock"""
+        signal = np.asarray(signal, dtype=np.float32)
+        offset, scale = quantization(signal)
+        levels = build_levels(signal, factors)
+        
+        version_path = f'{path}.v{time.time_ns()}-{os.getpid()}'
+        os.makedirs(version_path)
+        
+        for factor, (mins, maxs) in levels.items():
+            if factor == 1:
+                data = np.round((mins - offset) / scale)
+            else:
+                data = np.round((np.stack([mins, maxs], axis=1) - offset) / scale)
+            np.save(os.path.join(version_path, f'level_{factor}.npy'),
+                    np.clip(data, -INT16_MAX, INT16_MAX).astype(np.int16))
+        
+        meta = {
+            'sample_rate': float(sample_rate),
+            'length': int(len(signal)),
+            'duration_seconds': len(signal) / sample_rate,
+            'levels': sorted(levels),
+            'offset': offset,
+            'scale': scale
+        }
+        with open(os.path.join(version_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        
+        # Swap the link in one rename so <key> never goes missing
+        link_path = f'{path}.link{os.getpid()}'
+        os.symlink(os.path.basename(version_path), link_path)
+        if os.path.isdir(path) and not os.path.islink(path):
+            # Pyramid saved before versioned directories: swap once in two steps
+            old_path = f'{path}.old{os.getpid()}'
+            os.replace(path, old_path)
+            os.replace(link_path, path)
+        else:
+            old_path = os.path.join(self.root, os.readlink(path)) if os.path.islink(path) else None
+            os.replace(link_path, path)
+        if old_path is not None:
+            shutil.rmtree(old_path, ignore_errors=True)
+        
+        return meta
+    
+    def load_meta(self, key):
+        with open(os.path.join(self._path(key), 'meta.json')) as f:
+            return json.load(f)
+    
+    def _version(self, key):
+        """Directory of the current version of a pyramid"""
+        return os.path.realpath(self._path(key))
+    
+    def tile(self, key, level, start_seconds=0.0, end_seconds=None):
+        """
+        Read the buckets of one level covering [start_seconds, end_seconds)
+        
+        Returns:
+            dict with the bucket range and quantized values; the signal
+            value is value * scale + offset. Level 1 returns 'values',
+            coarser levels 'min' and 'max'.
+        """
+        try:
+            return self._tile(self._version(key), level, start_seconds, end_seconds)
+        except FileNotFoundError:
+            if not self.exists(key):
+                raise
+            # The version was replaced (and removed) between reads; read the new one
+            return self._tile(self._version(key), level, start_seconds, end_seconds)
+    
+    def _tile(self, directory, level, start_seconds, end_seconds):
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        if level not in meta['levels']:
+            raise ValueError(f"Level {level} not available (levels: {meta['levels']})")
+        
+        sample_rate = meta['sample_rate']
+        if end_seconds is None:
+            end_seconds = meta['duration_seconds']
+        if end_seconds <= start_seconds:
+            raise ValueError("end must be greater than start")
+        
+        data = np.load(os.path.join(directory, f'level_{level}.npy'), mmap_mode='r')
+        first = max(int(np.floor(start_seconds * sample_rate / level)), 0)
+        last = min(int(np.ceil(end_seconds * sample_rate / level)), len(data))
+        
+        if last - first > MAX_TILE_BUCKETS:
+            raise ValueError(
+                f"Tile spans {last - first} buckets (max {MAX_TILE_BUCKETS}); use a coarser level"
+            )
+        
+        tile = {
+            'level': level,
+            'sample_rate': sample_rate,
+            'bucket_seconds': level / sample_rate,
+            'start_seconds': first * level / sample_rate,
+            'end_seconds': min(last * level, meta['length']) / sample_rate,
+            'offset': meta['offset'],
+            'scale': meta['scale']
+        }
+        chunk = np.asarray(data[first:last])
+        if level == 1:
+            tile['values'] = chunk.tolist()
+        else:
+            tile['min'] = chunk[:, 0].tolist()
+            tile['max'] = chunk[:, 1].tolist()
+        return tile
@@ -0,0 +1,469 @@
+"""
+Patient-wise cross-validation of the CNN-LSTM
+
+preprocess.py splits windows randomly, so overlapping windows of the same
+patient end up in both train and test and the test metrics are
+optimistic. This runner splits by record instead (every MIT-BIH AF record
+is a different patient):
+- k folds of records (StratifiedGroupKFold: each fold gets records with
+  and without AF); a fold's test records are never seen in training
+- validation records (for early stopping) are held out of each fold's
+  training records
+
+Folds are trained and evaluated in parallel worker processes. Each worker
+pins its TensorFlow/OpenMP thread counts (and, on Linux, a disjoint set of
+CPU cores) before TensorFlow is imported, so folds do not oversubscribe
+the machine.
+
+Input is the cached output of preprocess.py (data/processed: signals plus
+window index); nothing is re-decoded. Finished folds are saved in
+models/trained/cv/ and skipped when the runner is started again with the
+same number of folds and seed.
+
+Metrics are aggregated as:
+- mean of per-fold metrics with a t-distribution 95% confidence interval
+- pooled metrics over all test records with a record-level bootstrap
+  95% confidence interval (records are resampled, not windows)
+
+Usage:
+    python training/cross_validate.py                    # 5 folds, all cores
+    python training/cross_validate.py --folds 10 --parallel 5 --threads 2
+"""
+
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import pickle
+
+import numpy as np
+from scipy import stats
+from sklearn.model_selection import StratifiedGroupKFold
+
+# Paths (TensorFlow is only imported inside the workers, after thread pinning)
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'processed')
+CV_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'models', 'trained', 'cv')
+
+# Metrics aggregated across folds / bootstrap samples
+METRICS = ['accuracy', 'precision', 'recall', 'specificity', 'f1_score', 'auc_roc']
+
+CONFIDENCE = 0.95
+
+
+def load_full_index(data_dir=DATA_DIR):
+    """All windows of the preprocessed dataset (union of the split indexes)"""
+    index = np.concatenate([
+        np.load(os.path.join(data_dir, f'index_{split}.npy')) for split in ('train', 'val', 'test')
+    ])
+    return np.sort(index, order=['record', 'offset'])
+
+
+def make_folds(index, n_folds=5, seed=42):
+    """
+    Record-level folds
+    
+    Returns:
+        List of {'train': [...], 'val': [...], 'test': [...]} record ids
+    """
+    groups = index['record']
+    labels = index['label']
+    folds = []
+    
+    outer = StratifiedGroupKFold(n_splits=n_folds, shuffle=True, random_state=seed)
+    for train_val_pos, test_pos in outer.split(np.zeros(len(index)), labels, groups):
+        # One inner fold of the remaining records becomes the validation set
+        inner = StratifiedGroupKFold(n_splits=max(n_folds - 1, 2), shuffle=True, random_state=seed)
+        train_pos, val_pos = next(inner.split(
+            np.zeros(len(train_val_pos)), labels[train_val_pos], groups[train_val_pos]
+        ))
+        
+        folds.append({
+            'train': sorted(np.unique(groups[train_val_pos][train_pos]).tolist()),
+            'val': sorted(np.unique(groups[train_val_pos][val_pos]).tolist()),
+            'test': sorted(np.unique(groups[test_pos]).tolist())
+        })
+    
+    return folds
+
+
+def pin_threads(threads, core_queue=None):
+    """
+    Worker initializer: fix thread counts (and CPU cores) before TensorFlow starts
+    
+    Args:
+        threads: Intra-op / OpenMP threads for this worker
+        core_queue: Queue of CPU core sets, one taken per worker (optional)
+    """
+    for name in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS'):
+        os.environ[name] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    os.environ['TF_USE_LEGACY_KERAS'] = '1'
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    
+    if core_queue is not None and hasattr(os, 'sched_setaffinity'):
+        cores = core_queue.get()
+        if cores:
+            os.sched_setaffinity(0, cores)
+    
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def fold_path(output_dir, fold_id, n_folds, seed):
+    return os.path.join(output_dir, f'k{n_folds}_seed{seed}_fold{fold_id}.npz')
+
+
+def run_fold(fold_id, fold, config):
+    """
+    Train on a fold's training records and evaluate on its test records
+    
+    Returns:
+        Fold result: per-record confusion matrices and score histograms of
+        the test records, plus training info
+    """
+    from tensorflow import keras
+    from tensorflow.keras import callbacks
+    from window_dataset import WindowDataset
+    from train_model import build_cnn_lstm_model, WindowSequence, ThroughputLogger, create_class_weights
+    from evaluate import StreamingMetrics
+    
+    keras.utils.set_random_seed(config['seed'] + fold_id)
+    start = time.perf_counter()
+    
+    index = load_full_index(config['data_dir'])
+    datasets = {
+        split: WindowDataset(split, config['data_dir'], index=index[np.isin(index['record'], fold[split])])
+        for split in ('train', 'val', 'test')
+    }
+    
+    model = build_cnn_lstm_model()
+    model.compile(
+        optimizer=keras.optimizers.Adam(learning_rate=0.001),
+        loss='binary_crossentropy',
+        metrics=['accuracy', keras.metrics.AUC(name='auc')]
+    )
+    
+    history = model.fit(
+        WindowSequence(datasets['train'], batch_size=config['batch_size'], shuffle=True, seed=config['seed']),
+        validation_data=WindowSequence(datasets['val'], batch_size=config['batch_size']),
+        epochs=config['epochs'],
+        class_weight=create_class_weights(datasets['train'].labels),
+        callbacks=[
+            ThroughputLogger(len(datasets['train'])),
+            callbacks.EarlyStopping(
+                monitor='val_auc',
+                patience=config['patience'],
+                mode='max',
+                restore_best_weights=True,
+                verbose=0
+            ),
+            callbacks.ReduceLROnPlateau(
+                monitor='val_loss',
+                factor=0.5,
+                patience=max(config['patience'] // 2, 1),
+                min_lr=1e-6,
+                verbose=0
+            )
+        ],
+        verbose=2
+    )
+    
+    # Per-record metrics, so the bootstrap can resample patients
+    test_set = datasets['test']
+    records = np.array(fold['test'], dtype=np.int64)
+    confusion = np.zeros((len(records), 2, 2), dtype=np.int64)
+    score_hist = None
+    
+    for i, record in enumerate(records):
+        metrics = StreamingMetrics()
+        positions = np.flatnonzero(test_set.index['record'] == record)
+        for batch_start in range(0, len(positions), config['eval_batch_size']):
+            X, y = test_set.get_windows(positions[batch_start:batch_start + config['eval_batch_size']])
+            metrics.update(y, model.predict_on_batch(X))
+        
+        if score_hist is None:
+            score_hist = np.zeros((len(records),) + metrics.score_hist.shape, dtype=np.int64)
+        confusion[i] = metrics.confusion
+        score_hist[i] = metrics.score_hist
+    
+    result = {
+        'fold': fold_id,
+        'records': records,
+        'confusion': confusion,
+        'score_hist': score_hist,
+        'epochs': len(history.history['loss']),
+        'train_windows': len(datasets['train']),
+        'test_windows': len(test_set),
+        'seconds': time.perf_counter() - start
+    }
+    
+    if config['save_models']:
+        model.save(os.path.join(config['output_dir'], f"k{config['folds']}_seed{config['seed']}_fold{fold_id}.keras"))
+    
+    # Atomic write: an interrupted fold is simply re-run
+    path = fold_path(config['output_dir'], fold_id, config['folds'], config['seed'])
+    tmp_path = f'{path}.tmp{os.getpid()}.npz'
+    np.savez(tmp_path, **{key: np.asarray(value) for key, value in result.items()})
+    os.replace(tmp_path, path)
+    
+    return result
+
+
+def load_fold(output_dir, fold_id, n_folds, seed):
+    path = fold_path(output_dir, fold_id, n_folds, seed)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return {key: data[key].item() if data[key].ndim == 0 else data[key] for key in data.files}
+
+
+def summarize(confusion, score_hist):
+    """Metrics from summed confusion matrices and score histograms"""
+    from evaluate import StreamingMetrics
+    
+    metrics = StreamingMetrics(bins=score_hist.shape[-1])
+    metrics.confusion = confusion
+    metrics.score_hist = score_hist
+    summary = metrics.summary()
+    return {name: summary[name] for name in METRICS}
+
+
+def fold_confidence_intervals(fold_metrics, confidence=CONFIDENCE):
+    """Mean, std and t-distribution confidence interval over folds"""
+    result = {}
+    for name in METRICS:
+        values = np.array([m[name] for m in fold_metrics])
+        mean = float(np.mean(values))
+        std = float(np.std(values, ddof=1)) if len(values) > 1 else 0.0
+        half_width = stats.t.ppf((1 + confidence) / 2, len(values) - 1) * std / np.sqrt(len(values)) if len(values) > 1 else 0.0
+        result[name] = {
+            'mean': mean,
+            'std': std,
+            'ci_low': mean - float(half_width),
+            'ci_high': mean + float(half_width)
+        }
+    return result
+
+
+def bootstrap_confidence_intervals(confusion, score_hist, n_boot=2000, confidence=CONFIDENCE, seed=42):
+    """
+    Pooled metrics with a record-level bootstrap confidence interval
+    
+    Args:
+        confusion: (records, 2, 2) per-record confusion matrices
+        score_hist: (records, 2, bins) per-record score histograms
+    """
+    rng = np.random.default_rng(seed)
+    n_records = len(confusion)
+    pooled = summarize(confusion.sum(axis=0), score_hist.sum(axis=0))
+    
+    flat_hist = score_hist.reshape(n_records, -1)
+    samples = {name: np.empty(n_boot) for name in METRICS}
+    for b in range(n_boot):
+        # Each record's count in the resample
+        weights = np.bincount(rng.integers(0, n_records, n_records), minlength=n_records)
+        metrics = summarize(
+            np.tensordot(weights, confusion, axes=1),
+            (weights @ flat_hist).reshape(score_hist.shape[1:])
+        )
+        for name in METRICS:
+            samples[name][b] = metrics[name]
+    
+    tail = (1 - confidence) / 2 * 100
+    return {
+        name: {
+            'value': pooled[name],
+            'ci_low': float(np.percentile(samples[name], tail)),
+            'ci_high': float(np.percentile(samples[name], 100 - tail))
+        }
+        for name in METRICS
+    }
+
+
+def core_sets(parallel, threads):
+    """Disjoint CPU core sets, one per worker (empty if there are too few cores)"""
+    if not hasattr(os, 'sched_getaffinity'):
+        return [()] * parallel
+    cores = sorted(os.sched_getaffinity(0))
+    if len(cores) < parallel * threads:
+        return [()] * parallel
+    return [tuple(cores[i * threads:(i + 1) * threads]) for i in range(parallel)]
+
+
+def cross_validate(n_folds=5, parallel=None, threads=None, epochs=50, patience=10, batch_size=32,
+                   eval_batch_size=256, seed=42, n_boot=2000, save_models=False, data_dir=DATA_DIR,
+                   output_dir=CV_DIR):
+    """
+    Run patient-wise k-fold cross-validation
+    
+    Args:
+        n_folds: Number of record-level folds
+        parallel: Folds trained at the same time (default: as many as fit the cores)
+        threads: Threads per fold (default: cores / parallel)
+        epochs: Maximum epochs per fold (early stopping on validation AUC)
+        patience: Early stopping patience
+        batch_size: Training batch size
+        eval_batch_size: Prediction batch size on the test records
+        seed: Fold assignment and training seed
+        n_boot: Bootstrap samples for the pooled confidence intervals
+        save_models: Keep each fold's model in output_dir
+        data_dir: Preprocessed data (preprocess.py output)
+        output_dir: Fold results, models and the results JSON
+    
+    Returns:
+        Results dict (also saved as <output_dir>/cv_results_k<k>_seed<seed>.json)
+    """
+    print("=" * 60)
+    print("Patient-wise Cross-Validation (CNN-LSTM)")
+    print("=" * 60)
+    
+    if not os.path.exists(os.path.join(data_dir, 'index_train.npy')):
+        print("Data not found! Please run preprocess.py first.")
+        return None
+    
+    with open(os.path.join(data_dir, 'metadata.pkl'), 'rb') as f:
+        record_names = pickle.load(f)['records']
+    
+    index = load_full_index(data_dir)
+    folds = make_folds(index, n_folds, seed)
+    
+    cpu_count = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    parallel = min(parallel or cpu_count, n_folds)
+    threads = threads or max(cpu_count // parallel, 1)
+    
+    print(f"Records: {len(record_names)}, windows: {len(index)}")
+    print(f"Folds: {n_folds}, parallel: {parallel}, threads per fold: {threads}")
+    for fold_id, fold in enumerate(folds):
+        test_names = [record_names[r] for r in fold['test']]
+        print(f"  Fold {fold_id}: train {len(fold['train'])}, val {len(fold['val'])}, "
+              f"test {len(fold['test'])} records ({', '.join(test_names)})")
+    
+    os.makedirs(output_dir, exist_ok=True)
+    config = {
+        'folds': n_folds,
+        'seed': seed,
+        'epochs': epochs,
+        'patience': patience,
+        'batch_size': batch_size,
+        'eval_batch_size': eval_batch_size,
+        'save_models': save_models,
+        'data_dir': data_dir,
+        'output_dir': output_dir
+    }
+    
+    results = {}
+    pending = []
+    for fold_id, fold in enumerate(folds):
+        cached = load_fold(output_dir, fold_id, n_folds, seed)
+        if cached is not None and cached['records'].tolist() == fold['test']:
+            print(f"  Fold {fold_id}: cached result")
+            results[fold_id] = cached
+        else:
+            pending.append(fold_id)
+    
+    start = time.perf_counter()
+    if pending:
+        context = multiprocessing.get_context('spawn')
+        core_queue = context.Queue()
+        for cores in core_sets(parallel, threads):
+            core_queue.put(cores)
+        
+        print(f"\nTraining {len(pending)} fold(s)...")
+        with ProcessPoolExecutor(max_workers=min(parallel, len(pending)), mp_context=context,
+                                 initializer=pin_threads, initargs=(threads, core_queue)) as pool:
+            futures = {pool.submit(run_fold, fold_id, folds[fold_id], config): fold_id for fold_id in pending}
+            for future in as_completed(futures):
+                result = future.result()
+                results[result['fold']] = result
+                print(f"  ✓ Fold {result['fold']}: {result['epochs']} epochs, "
+                      f"{result['test_windows']} test windows, {result['seconds'] / 60:.1f} min")
+    wall_clock = time.perf_counter() - start
+    
+    ordered = [results[fold_id] for fold_id in range(n_folds)]
+    fold_metrics = [
+        summarize(r['confusion'].sum(axis=0), r['score_hist'].sum(axis=0)) for r in ordered
+    ]
+    confusion = np.concatenate([r['confusion'] for r in ordered])
+    score_hist = np.concatenate([r['score_hist'] for r in ordered])
+    
+    summary = {
+        'folds': fold_confidence_intervals(fold_metrics),
+        'pooled': bootstrap_confidence_intervals(confusion, score_hist, n_boot, seed=seed)
+    }
+    
+    print("\n" + "=" * 60)
+    print("CROSS-VALIDATION RESULTS")
+    print("=" * 60)
+    print(f"\n{'Metric':<14} {'Fold mean [95% CI]':>26} {'Pooled [95% bootstrap CI]':>30}")
+    print("-" * 72)
+    for name in METRICS:
+        f, p = summary['folds'][name], summary['pooled'][name]
+        print(f"{name:<14} {f['mean']:>8.4f} [{f['ci_low']:.4f}, {f['ci_high']:.4f}]"
+              f" {p['value']:>11.4f} [{p['ci_low']:.4f}, {p['ci_high']:.4f}]")
+    
+    training_seconds = sum(float(results[fold_id]['seconds']) for fold_id in pending)
+    if pending:
+        print(f"\nWall clock: {wall_clock / 60:.1f} min "
+              f"(sum of fold times {training_seconds / 60:.1f} min, "
+              f"{training_seconds / wall_clock:.1f}x parallel speedup)")
+    
+    output = {
+        'config': dict(config, parallel=parallel, threads=threads),
+        'folds': [
+            {
+                'fold': fold_id,
+                'train_records': [record_names[r] for r in folds[fold_id]['train']],
+                'val_records': [record_names[r] for r in folds[fold_id]['val']],
+                'test_records': [record_names[r] for r in folds[fold_id]['test']],
+                'epochs': int(ordered[fold_id]['epochs']),
+                'test_windows': int(ordered[fold_id]['test_windows']),
+                'seconds': float(ordered[fold_id]['seconds']),
+                'metrics': fold_metrics[fold_id]
+            }
+            for fold_id in range(n_folds)
+        ],
+        'summary': summary,
+        'confidence': CONFIDENCE,
+        'wall_clock_seconds': wall_clock
+    }
+    
+    results_path = os.path.join(output_dir, f'cv_results_k{n_folds}_seed{seed}.json')
+    with open(results_path, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"\n✓ Results saved: {results_path}")
+    print("=" * 60)
+    
+    return output
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Patient-wise cross-validation of the CNN-LSTM')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--parallel', type=int, default=None,
+                        help='Folds trained at the same time (default: min(folds, cores))')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='Threads per fold (default: cores / parallel)')
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--patience', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--bootstrap', type=int, default=2000, help='Bootstrap samples')
+    parser.add_argument('--save-models', action='store_true', help='Keep each fold model')
+    parser.add_argument('--output-dir', default=CV_DIR, help='Default: models/trained/cv')
+    args = parser.parse_args()
+    
+    cross_validate(
+        n_folds=args.folds,
+        parallel=args.parallel,
+        threads=args.threads,
+        epochs=args.epochs,
+        patience=args.patience,
+        batch_size=args.batch_size,
+        seed=args.seed,
+        n_boot=args.bootstrap,
+        save_models=args.save_models,
+        output_dir=args.output_dir
+    )
@@ -0,0 +1,303 @@
+"""
+Distill the CNN-LSTM into a lightweight student model
+
+The two stacked LSTMs of the CNN-LSTM run over a 312-step sequence and
+dominate CPU inference time. The student replaces them with:
+- conv: a deeper stack of strided Conv1D layers (receptive field ~2 s,
+  i.e. a few RR intervals) followed by global average pooling
+- gru: the strided Conv1D front end down to ~78 steps and one small GRU
+
+The student is trained on the teacher's soft probabilities over the
+AFDB training windows (knowledge distillation): the loss combines the
+binary cross-entropy against the temperature-softened teacher output
+(weight alpha, scaled by T^2) and against the hard window labels
+(weight 1 - alpha). Teacher probabilities are computed once per split and
+cached next to the models, keyed on the teacher model file and the
+split's window index.
+
+The result is saved as models/trained/af_student.keras, served by
+AFPredictor(tier='fast'). Compare it with the teacher using:
+    python training/evaluate.py --model models/trained/af_student.keras \\
+        --teacher models/trained/af_cnn_lstm.keras
+
+Usage:
+    python training/distill_model.py
+    python training/distill_model.py --architecture gru --temperature 3 --alpha 0.5
+"""
+
+import os
+import json
+import hashlib
+import argparse
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers, models, callbacks
+
+from window_dataset import WindowDataset
+from train_model import (
+    DATA_DIR, MODEL_DIR, WINDOW_SIZE, NUM_FEATURES, WindowSequence, ThroughputLogger
+)
+
+TEACHER_PATH = os.path.join(MODEL_DIR, 'af_cnn_lstm.keras')
+STUDENT_PATH = os.path.join(MODEL_DIR, 'af_student.keras')
+
+# Clip probabilities before converting them to logits
+PROBABILITY_EPSILON = 1e-6
+
+
+def build_student_model(input_shape=(WINDOW_SIZE, NUM_FEATURES), architecture='conv'):
+    """
+    Build the student model
+    
+    Args:
+        input_shape: (window_size, features)
+        architecture: 'conv' (strided Conv1D + global pooling) or
+            'gru' (strided Conv1D + one GRU)
+    """
+    front_end = [
+        # Each block halves the sequence: 2500 -> 1250 -> 625 -> 313 -> 157 -> 79
+        layers.Conv1D(16, kernel_size=7, strides=2, activation='relu',
+                      padding='same', input_shape=input_shape),
+        layers.BatchNormalization(),
+        layers.Conv1D(32, kernel_size=5, strides=2, activation='relu', padding='same'),
+        layers.BatchNormalization(),
+        layers.Conv1D(32, kernel_size=5, strides=2, activation='relu', padding='same'),
+        layers.BatchNormalization(),
+        layers.Conv1D(48, kernel_size=5, strides=2, activation='relu', padding='same'),
+        layers.BatchNormalization(),
+        layers.Conv1D(64, kernel_size=5, strides=2, activation='relu', padding='same'),
+        layers.BatchNormalization(),
+    ]
+    
+    if architecture == 'conv':
+        # Two more strided blocks (79 -> 40 -> 20) widen the receptive field
+        # to ~2 s, enough to see the irregularity of consecutive RR intervals
+        temporal = [
+            layers.Conv1D(64, kernel_size=5, strides=2, activation='relu', padding='same'),
+            layers.BatchNormalization(),
+            layers.Conv1D(64, kernel_size=5, strides=2, activation='relu', padding='same'),
+            layers.BatchNormalization(),
+            layers.GlobalAveragePooling1D(),
+        ]
+    elif architecture == 'gru':
+        temporal = [layers.GRU(32)]
+    else:
+        raise ValueError(f"Unknown student architecture: {architecture}")
+    
+    return models.Sequential(front_end + temporal + [
+        layers.Dense(32, activation='relu'),
+        layers.Dropout(0.3),
+        layers.Dense(1, activation='sigmoid', dtype='float32')  # Binary: 0=Normal, 1=AF
+    ])
+
+
+def soften(probabilities, temperature):
+    """Teacher probabilities at temperature T: sigmoid(logit(p) / T)"""
+    p = np.clip(probabilities, PROBABILITY_EPSILON, 1 - PROBABILITY_EPSILON)
+    logits = np.log(p) - np.log1p(-p)
+    return (1 / (1 + np.exp(-logits / temperature))).astype(np.float32)
+
+
+def distillation_loss(alpha=0.7, temperature=2.0):
+    """
+    Loss on targets of shape (n, 2): [hard label, softened teacher probability]
+    
+    alpha * T^2 * BCE(teacher_T, student_T) + (1 - alpha) * BCE(label, student)
+    """
+    def loss(y_true, y_pred):
+        hard = y_true[:, 0:1]
+        soft = y_true[:, 1:2]
+        
+        p = tf.clip_by_value(y_pred, PROBABILITY_EPSILON, 1 - PROBABILITY_EPSILON)
+        student_soft = tf.sigmoid((tf.math.log(p) - tf.math.log1p(-p)) / temperature)
+        
+        soft_loss = keras.losses.binary_crossentropy(soft, student_soft)
+        hard_loss = keras.losses.binary_crossentropy(hard, y_pred)
+        return alpha * temperature ** 2 * soft_loss + (1 - alpha) * hard_loss
+    
+    return loss
+
+
+def hard_label_metric(metric_class, name):
+    """Metric on the hard-label column of the (n, 2) distillation targets"""
+    class HardLabelMetric(metric_class):
+        def update_state(self, y_true, y_pred, sample_weight=None):
+            return super().update_state(y_true[:, 0:1], y_pred, sample_weight)
+    
+    return HardLabelMetric(name=name)
+
+
+def teacher_cache_key(teacher_path, dataset):
+    """
+    Cache key of a split's teacher probabilities: the teacher file (path,
+    size, mtime) and a hash of the split's window index, so a different
+    or retrained teacher and a regenerated split both invalidate it
+    """
+    stat = os.stat(teacher_path)
+    key = {
+        'teacher': os.path.abspath(teacher_path),
+        'teacher_size': stat.st_size,
+        'teacher_mtime_ns': stat.st_mtime_ns,
+        'index_sha1': hashlib.sha1(np.ascontiguousarray(dataset.index).tobytes()).hexdigest()
+    }
+    return json.dumps(key, sort_keys=True)
+
+
+def teacher_probabilities(teacher, teacher_path, dataset, batch_size=256, refresh=False):
+    """
+    Teacher AF probability for every window of a split (cached on disk)
+    
+    The cache is used only when its key (teacher_cache_key) matches.
+    """
+    cache_path = os.path.join(MODEL_DIR, f'teacher_probabilities_{dataset.split}.npz')
+    key = teacher_cache_key(teacher_path, dataset)
+    if not refresh and os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            if str(cached['key']) == key and len(cached['probabilities']) == len(dataset):
+                print(f"  {dataset.split}: cached teacher probabilities ({cache_path})")
+                return cached['probabilities']
+    
+    print(f"  {dataset.split}: running teacher on {len(dataset)} windows...")
+    probabilities = np.empty(len(dataset), dtype=np.float32)
+    position = 0
+    for X, _ in dataset.iter_batches(batch_size):
+        probabilities[position:position + len(X)] = np.asarray(teacher.predict_on_batch(X)).ravel()
+        position += len(X)
+    
+    np.savez(cache_path, probabilities=probabilities, key=np.array(key))
+    return probabilities
+
+
+class DistillationSequence(WindowSequence):
+    """WindowSequence yielding (X, [hard label, soft teacher target]) batches"""
+    
+    def __init__(self, dataset, soft_targets, batch_size=32, shuffle=False, seed=42):
+        super().__init__(dataset, batch_size=batch_size, shuffle=shuffle, seed=seed)
+        self.soft_targets = soft_targets
+    
+    def __getitem__(self, batch_idx):
+        positions = self.order[batch_idx * self.batch_size:(batch_idx + 1) * self.batch_size]
+        X, y = self.dataset.get_windows(positions)
+        targets = np.stack([y.astype(np.float32), self.soft_targets[positions]], axis=1)
+        return X, targets
+
+
+def distill_model(teacher_path=TEACHER_PATH, output_path=STUDENT_PATH, architecture='conv',
+                  temperature=2.0, alpha=0.7, epochs=30, batch_size=64, refresh_teacher=False):
+    """
+    Train the student on the teacher's soft probabilities
+    
+    Args:
+        teacher_path: Trained CNN-LSTM model
+        output_path: Where to save the best student (by validation AUC)
+        architecture: Student architecture ('conv' or 'gru')
+        temperature: Distillation temperature T
+        alpha: Weight of the soft (teacher) loss
+        epochs: Maximum epochs (early stopping on validation AUC)
+        batch_size: Training batch size
+        refresh_teacher: Recompute cached teacher probabilities
+    """
+    print("=" * 60)
+    print("Distilling CNN-LSTM into a lightweight student")
+    print("=" * 60)
+    
+    if not os.path.exists(os.path.join(DATA_DIR, 'index_train.npy')):
+        print("Data not found! Please run preprocess.py first.")
+        return None, None
+    if not os.path.exists(teacher_path):
+        print(f"Teacher model not found: {teacher_path} (run train_model.py first)")
+        return None, None
+    
+    train_set = WindowDataset('train', DATA_DIR)
+    val_set = WindowDataset('val', DATA_DIR)
+    print(f"Training samples: {len(train_set)}")
+    print(f"Validation samples: {len(val_set)}")
+    
+    print(f"\nTeacher: {teacher_path}")
+    teacher = keras.models.load_model(teacher_path, compile=False)
+    train_soft = soften(teacher_probabilities(teacher, teacher_path, train_set, refresh=refresh_teacher), temperature)
+    val_soft = soften(teacher_probabilities(teacher, teacher_path, val_set, refresh=refresh_teacher), temperature)
+    del teacher
+    
+    print(f"\nBuilding student ({architecture}), T={temperature}, alpha={alpha}")
+    student = build_student_model(architecture=architecture)
+    student.compile(
+        optimizer=keras.optimizers.Adam(learning_rate=0.001),
+        loss=distillation_loss(alpha, temperature),
+        metrics=[
+            hard_label_metric(keras.metrics.BinaryAccuracy, 'accuracy'),
+            hard_label_metric(keras.metrics.AUC, 'auc')
+        ]
+    )
+    student.summary()
+    
+    train_data = DistillationSequence(train_set, train_soft, batch_size=batch_size, shuffle=True)
+    val_data = DistillationSequence(val_set, val_soft, batch_size=batch_size)
+    
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    callback_list = [
+        ThroughputLogger(len(train_set)),
+        callbacks.ModelCheckpoint(
+            output_path,
+            monitor='val_auc',
+            mode='max',
+            save_best_only=True,
+            verbose=1
+        ),
+        callbacks.EarlyStopping(
+            monitor='val_auc',
+            patience=8,
+            mode='max',
+            restore_best_weights=True,
+            verbose=1
+        ),
+        callbacks.ReduceLROnPlateau(
+            monitor='val_loss',
+            factor=0.5,
+            patience=4,
+            min_lr=1e-6,
+            verbose=1
+        )
+    ]
+    
+    history = student.fit(
+        train_data,
+        validation_data=val_data,
+        epochs=epochs,
+        callbacks=callback_list,
+        verbose=1
+    )
+    
+    print(f"\n✓ Student saved: {output_path}")
+    print(f"  Parameters: {student.count_params():,}")
+    print("\nCompare with the teacher:")
+    print(f"  python training/evaluate.py --model {output_path} --teacher {teacher_path}")
+    
+    return student, history
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Distill the CNN-LSTM into a lightweight student')
+    parser.add_argument('--teacher', default=TEACHER_PATH, help='Teacher model file')
+    parser.add_argument('--output', default=STUDENT_PATH, help='Student model file')
+    parser.add_argument('--architecture', choices=['conv', 'gru'], default='conv')
+    parser.add_argument('--temperature', type=float, default=2.0)
+    parser.add_argument('--alpha', type=float, default=0.7,
+                        help='Weight of the teacher (soft) loss; 1 - alpha for the labels')
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--refresh-teacher', action='store_true',
+                        help='Recompute cached teacher probabilities')
+    args = parser.parse_args()
+    
+    distill_model(
+        teacher_path=args.teacher,
+        output_path=args.output,
+        architecture=args.architecture,
+        temperature=args.temperature,
+        alpha=args.alpha,
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        refresh_teacher=args.refresh_teacher
+    )
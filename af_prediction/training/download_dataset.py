@@ -9,12 +9,24 @@ Details:
 - 2 channels per recording
 - Includes rhythm annotations (AFIB, AFL, N, J)
 
+Files are fetched concurrently over HTTP, partial files are resumed with
+Range requests, and every file is checked against the SHA-256 manifest
+(SHA256SUMS.txt) published next to the data. The base URL can point at a
+local mirror:
+
+    python training/download_dataset.py --base-url http://mirror.local/afdb/1.0.0
+
 Reference:
 Goldberger, A., et al. (2000). PhysioBank, PhysioToolkit, and PhysioNet.
 Circulation, 101(23), e215-e220.
 """
 
 import os
+import argparse
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
 import wfdb
 
 # MIT-BIH AF Database records
@@ -27,54 +39,195 @@ AFDB_RECORDS = [
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'mitbih_af')
 
+DEFAULT_BASE_URL = os.environ.get('AFDB_BASE_URL', 'https://physionet.org/files/afdb/1.0.0')
+MANIFEST_NAME = 'SHA256SUMS.txt'
+RECORD_EXTENSIONS = ('hea', 'dat', 'atr')
+CHUNK_SIZE = 1 << 20
+
+# Bytes per sample (per channel) for the WFDB storage formats we may meet
+FORMAT_BYTES_PER_SAMPLE = {'8': 1, '16': 2, '24': 3, '32': 4, '61': 2, '80': 1, '160': 2, '212': 1.5}
+
+
+def verify_record(record_name):
+    """
+    Verify a downloaded record from its header, without decoding signals
+    
+    Checks that the header parses, that the signal file has the size the
+    header implies and that annotations are readable.
+    
+    Returns:
+        Dictionary with record info
+    """
+    record_path = os.path.join(DATA_DIR, record_name)
+    header = wfdb.rdheader(record_path)
+    
+    # Signals stored interleaved in one .dat file per record
+    bytes_per_sample = FORMAT_BYTES_PER_SAMPLE.get(str(header.fmt[0]))
+    dat_path = os.path.join(DATA_DIR, header.file_name[0])
+    dat_size = os.path.getsize(dat_path)
+    if bytes_per_sample is not None:
+        expected = int(header.sig_len * header.n_sig * bytes_per_sample)
+        if dat_size < expected:
+            raise ValueError(f"{header.file_name[0]} is truncated ({dat_size} of {expected} bytes)")
+    
+    ann = wfdb.rdann(record_path, 'atr')
+    
+    return {
+        'name': record_name,
+        'samples': header.sig_len,
+        'channels': header.n_sig,
+        'fs': header.fs,
+        'duration_hours': header.sig_len / header.fs / 3600,
+        'annotations': len(ann.sample)
+    }
+
+
+def load_manifest(base_url, manifest_path=None):
+    """
+    Load the SHA-256 manifest ({filename: sha256})
+    
+    Read from manifest_path if given, otherwise fetched from the base URL.
+    """
+    if manifest_path:
+        with open(manifest_path) as f:
+            text = f.read()
+    else:
+        response = requests.get(f"{base_url}/{MANIFEST_NAME}", timeout=30)
+        response.raise_for_status()
+        text = response.text
+    
+    manifest = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) == 2:
+            checksum, filename = parts
+            manifest[filename.lstrip('*')] = checksum.lower()
+    return manifest
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
 
-def download_afdb():
-    """Download MIT-BIH AF Database using wfdb"""
+def download_file(filename, base_url, expected_sha256=None, retries=3):
+    """
+    Download one file, resuming a partial .part file if present
+    
+    A complete file that already matches the manifest is not fetched again.
+    
+    Returns:
+        'cached' or 'downloaded'
+    """
+    path = os.path.join(DATA_DIR, filename)
+    part_path = path + '.part'
+    
+    if os.path.exists(path) and (expected_sha256 is None or sha256_file(path) == expected_sha256):
+        return 'cached'
+    
+    for attempt in range(1, retries + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        
+        try:
+            with requests.get(f"{base_url}/{filename}", headers=headers, stream=True, timeout=60) as response:
+                if response.status_code == 416:
+                    # Range not satisfiable: the partial file is already complete
+                    pass
+                else:
+                    response.raise_for_status()
+                    # 206 continues the partial file; 200 means the server ignored Range
+                    mode = 'ab' if response.status_code == 206 else 'wb'
+                    with open(part_path, mode) as f:
+                        for block in response.iter_content(CHUNK_SIZE):
+                            f.write(block)
+        except requests.RequestException:
+            if attempt == retries:
+                raise
+            continue
+        
+        if expected_sha256 is None or sha256_file(part_path) == expected_sha256:
+            os.replace(part_path, path)
+            return 'downloaded'
+        
+        # Corrupt download: start over
+        os.remove(part_path)
+    
+    raise ValueError(f"{filename}: checksum mismatch after {retries} attempts")
+
+
+def download_afdb(base_url=DEFAULT_BASE_URL, workers=4, manifest_path=None, records=AFDB_RECORDS):
+    """
+    Download MIT-BIH AF Database concurrently with checksum verification
+    
+    Args:
+        base_url: Directory URL holding the record files and SHA256SUMS.txt
+        workers: Concurrent downloads
+        manifest_path: Local manifest file (default: fetched from base_url)
+        records: Record names to download
+    """
     print("=" * 60)
     print("Downloading MIT-BIH Atrial Fibrillation Database")
-    print("Source: PhysioNet (https://physionet.org/content/afdb/1.0.0/)")
+    print(f"Source: {base_url}")
     print("=" * 60)
     
     # Create data directory
     os.makedirs(DATA_DIR, exist_ok=True)
     
     print(f"\nDownload location: {DATA_DIR}")
-    print(f"Total records to download: {len(AFDB_RECORDS)}")
+    print(f"Total records to download: {len(records)} ({workers} concurrent downloads)")
     print("-" * 60)
     
-    downloaded = 0
-    failed = []
+    manifest = load_manifest(base_url, manifest_path)
     
-    for record_name in AFDB_RECORDS:
+    files = {
+        f"{record_name}.{ext}": record_name
+        for record_name in records
+        for ext in RECORD_EXTENSIONS
+    }
+    missing_checksums = [f for f in files if f not in manifest]
+    if missing_checksums:
+        print(f"⚠ No manifest checksum for: {missing_checksums}")
+    
+    failed = set()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(download_file, filename, base_url, manifest.get(filename)): filename
+            for filename in files
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            filename = futures[future]
+            try:
+                status = future.result()
+                print(f"[{done}/{len(files)}] ✓ {filename} ({status})")
+            except Exception as e:
+                print(f"[{done}/{len(files)}] ✗ {filename}: {str(e)}")
+                failed.add(files[filename])
+    
+    # Verify records (header only, signals are not decoded)
+    print("-" * 60)
+    downloaded = 0
+    for record_name in records:
+        if record_name in failed:
+            continue
         try:
-            print(f"\n[{downloaded + 1}/{len(AFDB_RECORDS)}] Downloading record: {record_name}")
-            
-            # Download record (signal + annotations)
-            wfdb.dl_database(
-                'afdb',
-                DATA_DIR,
-                records=[record_name]
-            )
-            
-            # Verify download
-            record_path = os.path.join(DATA_DIR, record_name)
-            record = wfdb.rdrecord(record_path)
-            ann = wfdb.rdann(record_path, 'atr')
-            
-            print(f"   ✓ Signal: {record.sig_len} samples, {record.n_sig} channels")
-            print(f"   ✓ Sample rate: {record.fs} Hz")
-            print(f"   ✓ Duration: {record.sig_len / record.fs / 3600:.2f} hours")
-            print(f"   ✓ Annotations: {len(ann.sample)} rhythm markers")
-            
+            info = verify_record(record_name)
+            print(f"   ✓ {record_name}: {info['samples']} samples, {info['channels']} channels, "
+                  f"{info['fs']} Hz, {info['duration_hours']:.2f} hours, "
+                  f"{info['annotations']} annotations")
             downloaded += 1
-            
         except Exception as e:
-            print(f"   ✗ Failed: {str(e)}")
-            failed.append(record_name)
+            print(f"   ✗ {record_name}: {str(e)}")
+            failed.add(record_name)
+    
+    failed = sorted(failed)
     
     print("\n" + "=" * 60)
     print(f"Download complete!")
-    print(f"Successfully downloaded: {downloaded}/{len(AFDB_RECORDS)} records")
+    print(f"Successfully downloaded: {downloaded}/{len(records)} records")
     
     if failed:
         print(f"Failed records: {failed}")
@@ -91,16 +244,8 @@ def verify_download():
     missing = []
     
     for record_name in AFDB_RECORDS:
-        record_path = os.path.join(DATA_DIR, record_name)
         try:
-            record = wfdb.rdrecord(record_path)
-            ann = wfdb.rdann(record_path, 'atr')
-            available.append({
-                'name': record_name,
-                'samples': record.sig_len,
-                'duration_hours': record.sig_len / record.fs / 3600,
-                'annotations': len(ann.sample)
-            })
+            available.append(verify_record(record_name))
         except Exception:
             missing.append(record_name)
     
@@ -115,8 +260,17 @@ def verify_download():
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Download MIT-BIH AF Database')
+    parser.add_argument('--base-url', default=DEFAULT_BASE_URL,
+                        help='Base URL of the record files (default: PhysioNet, or $AFDB_BASE_URL)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Concurrent downloads (default: 4)')
+    parser.add_argument('--manifest', default=None,
+                        help='Local SHA-256 manifest (default: SHA256SUMS.txt from the base URL)')
+    args = parser.parse_args()
+    
     # Download dataset
-    download_afdb()
+    download_afdb(args.base_url.rstrip('/'), args.workers, args.manifest)
     
     # Verify
     verify_download()
@@ -6,80 +6,228 @@ Generates comprehensive metrics including:
 - Confusion Matrix
 - ROC Curve and AUC
 - Per-class metrics
+- Inference throughput (windows/sec) and per-batch latency percentiles
+- Optionally (--teacher), the same metrics and throughput for a teacher
+  model on the same batches, with decision agreement and speedup; used to
+  compare the distilled student (distill_model.py) with the CNN-LSTM
+
+The test set is streamed from the memory-mapped window dataset in batches
+and metrics are accumulated incrementally, so memory use does not grow
+with the size of the test set. Results are saved as a compact JSON file.
 """
 
 import os
+import json
+import time
+import argparse
+import platform
 import numpy as np
-import pickle
-from sklearn.metrics import (
-    accuracy_score, precision_score, recall_score, f1_score,
-    confusion_matrix, classification_report, roc_auc_score, roc_curve
-)
 import tensorflow as tf
 from tensorflow import keras
 
+from window_dataset import WindowDataset
+
 # Paths
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'processed')
 MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'models', 'trained')
 
+# Score histogram resolution for the streaming ROC/AUC
+ROC_BINS = 10000
 
-def load_model():
+
+class StreamingMetrics:
+    """
+    Binary classification metrics accumulated batch by batch
+    
+    Keeps the confusion matrix at the decision threshold and per-class
+    score histograms; ROC and AUC are computed from the histograms, so no
+    per-window predictions are retained.
+    """
+    
+    def __init__(self, threshold=0.5, bins=ROC_BINS):
+        self.threshold = threshold
+        self.bins = bins
+        self.confusion = np.zeros((2, 2), dtype=np.int64)  # [actual][predicted]
+        self.score_hist = np.zeros((2, bins), dtype=np.int64)  # [actual][score bin]
+    
+    def update(self, y_true, y_proba):
+        y_true = np.asarray(y_true, dtype=np.int64).ravel()
+        y_proba = np.asarray(y_proba, dtype=np.float64).ravel()
+        y_pred = (y_proba > self.threshold).astype(np.int64)
+        
+        self.confusion += np.bincount(2 * y_true + y_pred, minlength=4).reshape(2, 2)
+        
+        score_bins = np.minimum((y_proba * self.bins).astype(np.int64), self.bins - 1)
+        for label in (0, 1):
+            self.score_hist[label] += np.bincount(score_bins[y_true == label], minlength=self.bins)
+    
+    def roc_curve(self):
+        """(fpr, tpr, thresholds) from the highest threshold down"""
+        neg = np.cumsum(self.score_hist[0][::-1])
+        pos = np.cumsum(self.score_hist[1][::-1])
+        fpr = np.concatenate([[0.0], neg / max(neg[-1], 1)])
+        tpr = np.concatenate([[0.0], pos / max(pos[-1], 1)])
+        thresholds = np.concatenate([[1.0], np.arange(self.bins - 1, -1, -1) / self.bins])
+        return fpr, tpr, thresholds
+    
+    def auc(self):
+        fpr, tpr, _ = self.roc_curve()
+        # Trapezoidal area under the ROC curve
+        return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+    
+    def summary(self):
+        (tn, fp), (fn, tp) = self.confusion
+        total = tn + fp + fn + tp
+        
+        def ratio(num, den):
+            return float(num / den) if den > 0 else 0.0
+        
+        precision = ratio(tp, tp + fp)
+        recall = ratio(tp, tp + fn)  # Sensitivity
+        specificity = ratio(tn, tn + fp)
+        npv = ratio(tn, tn + fn)
+        
+        return {
+            'samples': int(total),
+            'accuracy': ratio(tp + tn, total),
+            'precision': precision,
+            'recall': recall,
+            'specificity': specificity,
+            'f1_score': ratio(2 * precision * recall, precision + recall),
+            'auc_roc': self.auc(),
+            'confusion_matrix': self.confusion.tolist(),
+            'per_class': {
+                'Normal': {
+                    'precision': npv,
+                    'recall': specificity,
+                    'f1_score': ratio(2 * npv * specificity, npv + specificity),
+                    'support': int(tn + fp)
+                },
+                'AF': {
+                    'precision': precision,
+                    'recall': recall,
+                    'f1_score': ratio(2 * precision * recall, precision + recall),
+                    'support': int(fn + tp)
+                }
+            }
+        }
+
+
+def load_model(model_path=None):
     """Load trained model"""
-    model_path = os.path.join(MODEL_DIR, 'af_cnn_lstm.keras')
-    return keras.models.load_model(model_path)
+    if model_path is None:
+        model_path = os.path.join(MODEL_DIR, 'af_cnn_lstm.keras')
+    return keras.models.load_model(model_path, compile=False)
 
 
-def evaluate_model():
-    """Evaluate model with comprehensive metrics"""
+def benchmark_summary(batch_latencies, batch_sizes):
+    """Throughput and latency percentiles from per-batch timings (zeros without batches)"""
+    latencies = np.asarray(batch_latencies, dtype=np.float64)
+    total_time = float(np.sum(latencies))
+    
+    if len(latencies) == 0:
+        return {
+            'batches': 0,
+            'windows_per_sec': 0.0,
+            'latency_ms': {'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+        }
+    
+    return {
+        'batches': len(latencies),
+        'windows_per_sec': float(np.sum(batch_sizes) / total_time) if total_time > 0 else 0.0,
+        'latency_ms': {
+            'p50': float(np.percentile(latencies, 50) * 1000),
+            'p95': float(np.percentile(latencies, 95) * 1000),
+            'p99': float(np.percentile(latencies, 99) * 1000),
+            'max': float(np.max(latencies) * 1000)
+        }
+    }
+
+
+def evaluate_model(model_path=None, batch_size=256, results_path=None, teacher_path=None):
+    """
+    Evaluate model with comprehensive metrics
+    
+    Args:
+        model_path: Model to evaluate (default: af_cnn_lstm.keras)
+        batch_size: Prediction batch size
+        results_path: Results JSON
+        teacher_path: Optional teacher model compared on the same batches
+    """
     print("=" * 60)
     print("Evaluating CNN-LSTM AF Detection Model")
     print("=" * 60)
     
-    # Load test data
+    # Test windows are streamed from memory-mapped signals
     print("\nLoading test data...")
-    X_test = np.load(os.path.join(DATA_DIR, 'X_test.npy'))
-    y_test = np.load(os.path.join(DATA_DIR, 'y_test.npy'))
-    print(f"Test samples: {len(X_test)}")
-    print(f"AF ratio: {np.mean(y_test):.2%}")
+    test_set = WindowDataset('test', DATA_DIR)
+    print(f"Test samples: {len(test_set)}")
+    print(f"AF ratio: {np.mean(test_set.labels):.2%}")
     
     # Load model
     print("\nLoading model...")
-    model = load_model()
+    model_path = model_path or os.path.join(MODEL_DIR, 'af_cnn_lstm.keras')
+    model = load_model(model_path)
+    teacher = load_model(teacher_path) if teacher_path else None
+    
+    # Predict batch by batch, timing each batch
+    print(f"\nRunning predictions (batch size {batch_size})...")
+    metrics = StreamingMetrics()
+    teacher_metrics = StreamingMetrics()
+    batch_latencies = []
+    teacher_latencies = []
+    batch_sizes = []
+    agreements = 0
+    
+    for batch_idx, (X, y) in enumerate(test_set.iter_batches(batch_size)):
+        start = time.perf_counter()
+        y_pred_proba = model.predict_on_batch(X)
+        elapsed = time.perf_counter() - start
+        
+        metrics.update(y, y_pred_proba)
+        
+        if teacher is not None:
+            start = time.perf_counter()
+            teacher_proba = teacher.predict_on_batch(X)
+            teacher_elapsed = time.perf_counter() - start
+            
+            teacher_metrics.update(y, teacher_proba)
+            agreements += int(np.sum(
+                (np.ravel(y_pred_proba) > metrics.threshold) == (np.ravel(teacher_proba) > teacher_metrics.threshold)
+            ))
+        
+        # First batch includes graph tracing; keep it out of the timings
+        if batch_idx > 0 or len(test_set) <= batch_size:
+            batch_latencies.append(elapsed)
+            batch_sizes.append(len(X))
+            if teacher is not None:
+                teacher_latencies.append(teacher_elapsed)
     
-    # Predict
-    print("\nRunning predictions...")
-    y_pred_proba = model.predict(X_test, verbose=0)
-    y_pred = (y_pred_proba > 0.5).astype(int).flatten()
+    results = metrics.summary()
+    speed = benchmark_summary(batch_latencies, batch_sizes)
     
     # Calculate metrics
     print("\n" + "=" * 60)
     print("EVALUATION RESULTS")
     print("=" * 60)
     
-    # Basic metrics
-    accuracy = accuracy_score(y_test, y_pred)
-    precision = precision_score(y_test, y_pred)
-    recall = recall_score(y_test, y_pred)  # Sensitivity
-    f1 = f1_score(y_test, y_pred)
-    auc = roc_auc_score(y_test, y_pred_proba)
-    
-    # Specificity (recall for class 0)
-    tn, fp, fn, tp = confusion_matrix(y_test, y_pred).ravel()
-    specificity = tn / (tn + fp) if (tn + fp) > 0 else 0
+    accuracy = results['accuracy']
+    recall = results['recall']
+    specificity = results['specificity']
     
     print(f"\n{'Metric':<20} {'Value':>10}")
     print("-" * 32)
     print(f"{'Accuracy':<20} {accuracy:>10.4f}")
-    print(f"{'Precision':<20} {precision:>10.4f}")
+    print(f"{'Precision':<20} {results['precision']:>10.4f}")
     print(f"{'Recall (Sensitivity)':<20} {recall:>10.4f}")
     print(f"{'Specificity':<20} {specificity:>10.4f}")
-    print(f"{'F1-Score':<20} {f1:>10.4f}")
-    print(f"{'AUC-ROC':<20} {auc:>10.4f}")
+    print(f"{'F1-Score':<20} {results['f1_score']:>10.4f}")
+    print(f"{'AUC-ROC':<20} {results['auc_roc']:>10.4f}")
     
     # Confusion Matrix
     print("\nConfusion Matrix:")
     print("-" * 32)
-    cm = confusion_matrix(y_test, y_pred)
+    cm = results['confusion_matrix']
     print(f"                Predicted")
     print(f"                Normal   AF")
     print(f"Actual Normal    {cm[0][0]:5d}  {cm[0][1]:5d}")
@@ -88,25 +236,63 @@ def evaluate_model():
     # Classification Report
     print("\nClassification Report:")
     print("-" * 32)
-    print(classification_report(y_test, y_pred, target_names=['Normal', 'AF']))
-    
-    # Save results
-    results = {
-        'accuracy': accuracy,
-        'precision': precision,
-        'recall': recall,
-        'specificity': specificity,
-        'f1_score': f1,
-        'auc_roc': auc,
-        'confusion_matrix': cm,
-        'y_test': y_test,
-        'y_pred': y_pred,
-        'y_pred_proba': y_pred_proba
+    print(f"{'':<10} {'precision':>10} {'recall':>8} {'f1-score':>9} {'support':>8}")
+    for name, row in results['per_class'].items():
+        print(f"{name:<10} {row['precision']:>10.2f} {row['recall']:>8.2f} "
+              f"{row['f1_score']:>9.2f} {row['support']:>8d}")
+    
+    # Inference speed
+    print("\nInference Speed:")
+    print("-" * 32)
+    print(f"{'Windows/sec':<20} {speed['windows_per_sec']:>10.1f}")
+    print(f"{'Batch p50 (ms)':<20} {speed['latency_ms']['p50']:>10.1f}")
+    print(f"{'Batch p95 (ms)':<20} {speed['latency_ms']['p95']:>10.1f}")
+    print(f"{'Batch p99 (ms)':<20} {speed['latency_ms']['p99']:>10.1f}")
+    
+    if teacher is not None:
+        teacher_results = teacher_metrics.summary()
+        teacher_speed = benchmark_summary(teacher_latencies, batch_sizes)
+        speedup = speed['windows_per_sec'] / teacher_speed['windows_per_sec'] if teacher_speed['windows_per_sec'] > 0 else 0.0
+        
+        print("\nTeacher Comparison:")
+        print("-" * 44)
+        print(f"{'':<20} {'Model':>10} {'Teacher':>12}")
+        for label, key in (('Accuracy', 'accuracy'), ('Recall', 'recall'),
+                           ('Specificity', 'specificity'), ('AUC-ROC', 'auc_roc')):
+            print(f"{label:<20} {results[key]:>10.4f} {teacher_results[key]:>12.4f}")
+        print(f"{'Windows/sec':<20} {speed['windows_per_sec']:>10.1f} {teacher_speed['windows_per_sec']:>12.1f}")
+        print(f"{'Batch p50 (ms)':<20} {speed['latency_ms']['p50']:>10.1f} {teacher_speed['latency_ms']['p50']:>12.1f}")
+        print(f"{'Agreement':<20} {agreements / max(len(test_set), 1):>10.4f}")
+        print(f"{'Speedup':<20} {speedup:>9.2f}x")
+        
+        results['teacher'] = {
+            'model_path': teacher_path,
+            'metrics': {key: value for key, value in teacher_results.items() if key != 'per_class'},
+            'speed': teacher_speed,
+            'agreement': agreements / max(len(test_set), 1),
+            'speedup': speedup
+        }
+    
+    # Save results (compact JSON: metrics, ROC points and speed, no per-window arrays)
+    fpr, tpr, thresholds = metrics.roc_curve()
+    roc_points = np.unique(np.linspace(0, len(fpr) - 1, 201).astype(int))
+    results['roc_curve'] = {
+        'fpr': np.round(fpr[roc_points], 5).tolist(),
+        'tpr': np.round(tpr[roc_points], 5).tolist(),
+        'thresholds': np.round(thresholds[roc_points], 5).tolist()
     }
+    results['speed'] = dict(speed, **{
+        'backend': 'keras',
+        'batch_size': batch_size,
+        'tensorflow_version': tf.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor()
+    })
+    results['model_path'] = model_path
     
-    results_path = os.path.join(MODEL_DIR, 'evaluation_results.pkl')
-    with open(results_path, 'wb') as f:
-        pickle.dump(results, f)
+    results_path = results_path or os.path.join(MODEL_DIR, 'evaluation_results.json')
+    with open(results_path, 'w') as f:
+        json.dump(results, f, indent=2)
     print(f"\n✓ Results saved: {results_path}")
     
     # Summary
@@ -117,7 +303,7 @@ def evaluate_model():
     if accuracy >= 0.90 and recall >= 0.85 and specificity >= 0.90:
         print("✓ Model meets all target thresholds!")
         print("  - Accuracy ≥ 90%: ✓")
-        print("  - Sensitivity ≥ 85%: ✓") 
+        print("  - Sensitivity ≥ 85%: ✓")
         print("  - Specificity ≥ 90%: ✓")
     else:
         print("⚠ Model needs improvement:")
@@ -131,4 +317,14 @@ def evaluate_model():
 
 
 if __name__ == '__main__':
-    evaluate_model()
+    parser = argparse.ArgumentParser(description='Evaluate AF detection model')
+    parser.add_argument('--model', default=None,
+                        help='Model file (default: models/trained/af_cnn_lstm.keras)')
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--output', default=None,
+                        help='Results JSON (default: models/trained/evaluation_results.json)')
+    parser.add_argument('--teacher', default=None,
+                        help='Teacher model to compare against (e.g. models/trained/af_cnn_lstm.keras)')
+    args = parser.parse_args()
+    
+    evaluate_model(args.model, args.batch_size, args.output, args.teacher)
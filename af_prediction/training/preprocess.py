@@ -7,7 +7,14 @@ Steps:
 3. Normalize signal to [-1, 1]
 4. Create 10-second windows (2500 samples @ 250Hz)
 5. Label each window based on rhythm annotations
-6. Save as numpy arrays for training
+6. Save continuous per-record signals plus a compact window index
+
+Output (data/processed):
+- signals/<record>.npy: normalized channel-0 signal (float32 or float16),
+  loaded memory-mapped at training time
+- index_{train,val,test}.npy: one (record, offset, label) entry per window;
+  windows are cut on the fly by training/window_dataset.py, so the 50%
+  overlap is never stored twice
 
 Labels:
 - 0: Normal / Non-AF rhythm
@@ -15,11 +22,17 @@ Labels:
 """
 
 import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import wfdb
 from scipy import signal as scipy_signal
 import pickle
 
+from record_cache import load_record_cached
+
 # Configuration
 WINDOW_SIZE_SECONDS = 10
 SAMPLE_RATE = 250  # MIT-BIH AF Database sample rate
@@ -30,13 +43,24 @@ STEP_SIZE = int(WINDOW_SIZE * (1 - OVERLAP))  # 1250 samples
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'mitbih_af')
 OUTPUT_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'processed')
 
+# Window index entry: record id (position in metadata['records']), start sample, label
+INDEX_DTYPE = np.dtype([('record', '<i4'), ('offset', '<i8'), ('label', 'i1')])
+
 # AF-related rhythm codes in annotations
 AF_RHYTHMS = {'AFIB', 'AFL'}  # Atrial Fibrillation and Flutter
 NORMAL_RHYTHMS = {'N', 'J', 'SBR', 'SVTA'}  # Normal, Junctional, others
 
 
-def load_record(record_name):
-    """Load a single record with signal and annotations"""
+def load_record(record_name, use_cache=True, cache_format='npz'):
+    """
+    Load a single record with signal and annotations
+    
+    With use_cache, decoded records come from data/cache (see
+    record_cache.py) and wfdb only parses a record on a cache miss.
+    """
+    if use_cache:
+        return load_record_cached(record_name, DATA_DIR, fmt=cache_format)
+    
     record_path = os.path.join(DATA_DIR, record_name)
     
     # Read signal
@@ -65,181 +89,236 @@ def extract_single_channel(record, channel=0):
 
 
 def create_rhythm_labels(ann, signal_length, fs):
-    """Create per-sample rhythm labels from annotations"""
-    # Initialize all samples as unknown (will filter later)
-    labels = np.zeros(signal_length, dtype=np.int8)
+    """
+    Create per-sample rhythm labels from annotations
     
-    # Get rhythm annotations
+    Labels are built in one vectorized pass from the rhythm change-points:
+    each rhythm's label code is repeated up to the next change-point.
+    """
+    # Get rhythm annotations (change-points)
     rhythm_indices = []
-    rhythm_types = []
+    rhythm_codes = []
     
     for i, aux in enumerate(ann.aux_note):
         if aux and aux.strip():
             rhythm = aux.strip().replace('(', '').replace(')', '')
             rhythm_indices.append(ann.sample[i])
-            rhythm_types.append(rhythm)
+            
+            if rhythm in AF_RHYTHMS:
+                rhythm_codes.append(1)   # AF
+            elif rhythm in NORMAL_RHYTHMS:
+                rhythm_codes.append(0)   # Normal
+            else:
+                rhythm_codes.append(-1)  # Unknown/Other (will be excluded)
     
     # If no rhythm annotations, skip
     if not rhythm_indices:
         return None
     
-    # Assign labels based on rhythm segments
-    for i in range(len(rhythm_indices)):
-        start_idx = rhythm_indices[i]
-        end_idx = rhythm_indices[i + 1] if i + 1 < len(rhythm_indices) else signal_length
-        rhythm = rhythm_types[i]
-        
-        if rhythm in AF_RHYTHMS:
-            labels[start_idx:end_idx] = 1  # AF
-        elif rhythm in NORMAL_RHYTHMS:
-            labels[start_idx:end_idx] = 0  # Normal
-        else:
-            labels[start_idx:end_idx] = -1  # Unknown/Other (will be excluded)
+    # Samples before the first rhythm annotation stay 0
+    labels = np.zeros(signal_length, dtype=np.int8)
+    
+    change_points = np.clip(np.asarray(rhythm_indices, dtype=np.int64), 0, signal_length)
+    segment_lengths = np.diff(np.append(change_points, signal_length))
+    labels[change_points[0]:] = np.repeat(np.asarray(rhythm_codes, dtype=np.int8), segment_lengths)
     
     return labels
 
 
+def select_windows(labels, window_size=WINDOW_SIZE, step_size=STEP_SIZE):
+    """
+    Choose labelled windows from per-sample rhythm labels
+    
+    The unknown-label and AF-ratio tests use prefix sums, so each window
+    is checked in O(1).
+    
+    Returns:
+        starts: Start sample of each kept window
+        window_labels: 1 (AF) or 0 (Normal) per kept window
+    """
+    if len(labels) < window_size:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    
+    starts = np.arange((len(labels) - window_size) // step_size + 1) * step_size
+    ends = starts + window_size
+    
+    # Per-window label counts from prefix sums
+    unknown_cumsum = np.concatenate([[0], np.cumsum(labels == -1)])
+    af_cumsum = np.concatenate([[0], np.cumsum(labels == 1)])
+    unknown_count = unknown_cumsum[ends] - unknown_cumsum[starts]
+    af_ratio = (af_cumsum[ends] - af_cumsum[starts]) / window_size
+    
+    # Skip windows with unknown labels (-1) and mixed windows;
+    # >80% AF = AF, <20% AF = Normal
+    is_af = af_ratio > 0.8
+    keep = (unknown_count == 0) & (is_af | (af_ratio < 0.2))
+    
+    return starts[keep], is_af[keep].astype(np.int64)
+
+
 def create_windows(signal, labels, window_size=WINDOW_SIZE, step_size=STEP_SIZE):
-    """Create overlapping windows from signal with labels"""
-    windows = []
-    window_labels = []
+    """
+    Create overlapping windows from signal with labels
+    
+    Windows are cut from a strided view of the signal (see select_windows).
+    """
+    starts, window_labels = select_windows(labels, window_size, step_size)
+    if len(starts) == 0:
+        return np.empty((0, window_size), dtype=signal.dtype), window_labels
+    
+    # (n_windows, window_size) view, no copy until the kept windows are taken
+    windows = sliding_window_view(signal, window_size)[::step_size]
+    return windows[starts // step_size], window_labels
+
+
+def process_record(record_name, output_dir, signal_dtype='float32', use_cache=True, cache_format='npz'):
+    """
+    Load, normalize and label one record (process-pool worker)
     
-    n_windows = (len(signal) - window_size) // step_size + 1
+    The continuous signal goes to signals/<record>.npy and the window
+    offsets/labels to records/<record>.npz, so workers never share output.
+    Returns per-record stats.
+    """
+    result = {'record': record_name, 'status': 'skipped', 'af_windows': 0, 'normal_windows': 0}
     
-    for i in range(n_windows):
-        start = i * step_size
-        end = start + window_size
+    try:
+        # Load record
+        record, ann = load_record(record_name, use_cache, cache_format)
+        result['hours'] = record.sig_len / record.fs / 3600
+        
+        # Extract single channel
+        signal = extract_single_channel(record, channel=0)
         
-        # Get window signal
-        window = signal[start:end]
+        # Create rhythm labels
+        labels = create_rhythm_labels(ann, len(signal), record.fs)
+        if labels is None:
+            result['message'] = 'No rhythm annotations'
+            return result
         
-        # Get window labels (use majority voting)
-        window_label_segment = labels[start:end]
+        # Select windows (offsets only, nothing is copied)
+        starts, window_labels = select_windows(labels)
+        if len(starts) == 0:
+            result['message'] = 'No valid windows'
+            return result
         
-        # Skip windows with unknown labels (-1)
-        if np.any(window_label_segment == -1):
-            continue
+        np.save(os.path.join(output_dir, 'signals', f'{record_name}.npy'),
+                signal.astype(signal_dtype))
+        np.savez(os.path.join(output_dir, 'records', f'{record_name}.npz'),
+                 offsets=starts, labels=window_labels)
         
-        # Determine label by majority (>80% AF = AF, else Normal)
-        af_ratio = np.mean(window_label_segment == 1)
-        if af_ratio > 0.8:
-            final_label = 1  # AF
-        elif af_ratio < 0.2:
-            final_label = 0  # Normal
-        else:
-            continue  # Skip mixed windows
+        result['status'] = 'success'
+        result['af_windows'] = int(np.sum(window_labels == 1))
+        result['normal_windows'] = int(np.sum(window_labels == 0))
         
-        windows.append(window)
-        window_labels.append(final_label)
+    except Exception as e:
+        result['status'] = 'error'
+        result['message'] = str(e)
     
-    return np.array(windows), np.array(window_labels)
+    return result
 
 
-def preprocess_all_records():
+def merge_record_outputs(output_dir, record_names):
+    """Merge per-record window indexes in record-name order (deterministic)"""
+    parts = []
+    
+    for record_id, record_name in enumerate(record_names):
+        with np.load(os.path.join(output_dir, 'records', f'{record_name}.npz')) as data:
+            part = np.empty(len(data['offsets']), dtype=INDEX_DTYPE)
+            part['record'] = record_id
+            part['offset'] = data['offsets']
+            part['label'] = data['labels']
+            parts.append(part)
+    
+    return np.concatenate(parts)
+
+
+def preprocess_all_records(workers=None, signal_dtype='float32', use_cache=True, cache_format='npz'):
     """Preprocess all records and create training dataset"""
     print("=" * 60)
     print("Preprocessing MIT-BIH AF Database")
     print("=" * 60)
     
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    os.makedirs(os.path.join(OUTPUT_DIR, 'records'), exist_ok=True)
+    os.makedirs(os.path.join(OUTPUT_DIR, 'signals'), exist_ok=True)
     
-    all_windows = []
-    all_labels = []
     stats = {'total_records': 0, 'af_windows': 0, 'normal_windows': 0}
     
-    # Get list of available records
-    record_files = [f.replace('.hea', '') for f in os.listdir(DATA_DIR) if f.endswith('.hea')]
-    print(f"Found {len(record_files)} records")
+    # Get list of available records (sorted so output never depends on listing order)
+    record_files = sorted(f.replace('.hea', '') for f in os.listdir(DATA_DIR) if f.endswith('.hea'))
+    workers = workers or os.cpu_count() or 1
+    print(f"Found {len(record_files)} records, processing with {workers} worker(s)")
     
-    for record_name in record_files:
-        try:
-            print(f"\nProcessing: {record_name}")
-            
-            # Load record
-            record, ann = load_record(record_name)
-            print(f"  Signal length: {record.sig_len} samples ({record.sig_len / record.fs / 3600:.2f} hours)")
-            
-            # Extract single channel
-            signal = extract_single_channel(record, channel=0)
-            print(f"  Extracted channel 0, normalized to [-1, 1]")
-            
-            # Create rhythm labels
-            labels = create_rhythm_labels(ann, len(signal), record.fs)
-            if labels is None:
-                print(f"  ⚠ No rhythm annotations, skipping")
-                continue
-            
-            # Create windows
-            windows, window_labels = create_windows(signal, labels)
-            print(f"  Created {len(windows)} windows")
-            
-            if len(windows) == 0:
-                print(f"  ⚠ No valid windows, skipping")
-                continue
-            
-            # Count AF vs Normal
-            n_af = np.sum(window_labels == 1)
-            n_normal = np.sum(window_labels == 0)
-            print(f"  AF windows: {n_af}, Normal windows: {n_normal}")
-            
-            all_windows.append(windows)
-            all_labels.append(window_labels)
-            
-            stats['total_records'] += 1
-            stats['af_windows'] += n_af
-            stats['normal_windows'] += n_normal
+    processed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(process_record, name, OUTPUT_DIR, signal_dtype, use_cache, cache_format)
+            for name in record_files
+        ]
+        
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            prefix = f"[{done}/{len(record_files)}] {result['record']}"
             
-        except Exception as e:
-            print(f"  ✗ Error: {str(e)}")
+            if result['status'] == 'success':
+                print(f"{prefix}: {result['hours']:.2f} hours, "
+                      f"AF windows: {result['af_windows']}, Normal windows: {result['normal_windows']}")
+                processed.append(result['record'])
+                stats['total_records'] += 1
+                stats['af_windows'] += result['af_windows']
+                stats['normal_windows'] += result['normal_windows']
+            elif result['status'] == 'skipped':
+                print(f"{prefix}: ⚠ {result['message']}, skipping")
+            else:
+                print(f"{prefix}: ✗ Error: {result['message']}")
+    
+    if not processed:
+        print("\n✗ No records could be processed")
+        return None
     
     # Combine all data
     print("\n" + "=" * 60)
-    print("Combining data...")
-    
-    X = np.vstack(all_windows)
-    y = np.concatenate(all_labels)
+    print("Combining window index...")
     
-    print(f"Total windows: {len(X)}")
-    print(f"  AF: {stats['af_windows']} ({100 * stats['af_windows'] / len(X):.1f}%)")
-    print(f"  Normal: {stats['normal_windows']} ({100 * stats['normal_windows'] / len(X):.1f}%)")
+    processed.sort()
+    index = merge_record_outputs(OUTPUT_DIR, processed)
     
-    # Reshape for CNN-LSTM: (samples, timesteps, features)
-    X = X.reshape(-1, WINDOW_SIZE, 1)
+    print(f"Total windows: {len(index)}")
+    print(f"  AF: {stats['af_windows']} ({100 * stats['af_windows'] / len(index):.1f}%)")
+    print(f"  Normal: {stats['normal_windows']} ({100 * stats['normal_windows'] / len(index):.1f}%)")
     
     # Split into train/val/test (80/10/10)
     from sklearn.model_selection import train_test_split
     
-    X_train, X_temp, y_train, y_temp = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
+    index_train, index_temp = train_test_split(
+        index, test_size=0.2, random_state=42, stratify=index['label']
     )
-    X_val, X_test, y_val, y_test = train_test_split(
-        X_temp, y_temp, test_size=0.5, random_state=42, stratify=y_temp
+    index_val, index_test = train_test_split(
+        index_temp, test_size=0.5, random_state=42, stratify=index_temp['label']
     )
     
     print(f"\nData split:")
-    print(f"  Train: {len(X_train)} samples")
-    print(f"  Val:   {len(X_val)} samples")
-    print(f"  Test:  {len(X_test)} samples")
+    print(f"  Train: {len(index_train)} samples")
+    print(f"  Val:   {len(index_val)} samples")
+    print(f"  Test:  {len(index_test)} samples")
     
-    # Save processed data
+    # Save window index (signals were written by the workers)
     print(f"\nSaving to {OUTPUT_DIR}...")
     
-    np.save(os.path.join(OUTPUT_DIR, 'X_train.npy'), X_train)
-    np.save(os.path.join(OUTPUT_DIR, 'y_train.npy'), y_train)
-    np.save(os.path.join(OUTPUT_DIR, 'X_val.npy'), X_val)
-    np.save(os.path.join(OUTPUT_DIR, 'y_val.npy'), y_val)
-    np.save(os.path.join(OUTPUT_DIR, 'X_test.npy'), X_test)
-    np.save(os.path.join(OUTPUT_DIR, 'y_test.npy'), y_test)
+    np.save(os.path.join(OUTPUT_DIR, 'index_train.npy'), index_train)
+    np.save(os.path.join(OUTPUT_DIR, 'index_val.npy'), index_val)
+    np.save(os.path.join(OUTPUT_DIR, 'index_test.npy'), index_test)
     
     # Save metadata
     metadata = {
         'window_size': WINDOW_SIZE,
         'sample_rate': SAMPLE_RATE,
         'overlap': OVERLAP,
+        'records': processed,
+        'signal_dtype': signal_dtype,
         'stats': stats,
-        'train_size': len(X_train),
-        'val_size': len(X_val),
-        'test_size': len(X_test)
+        'train_size': len(index_train),
+        'val_size': len(index_val),
+        'test_size': len(index_test)
     }
     
     with open(os.path.join(OUTPUT_DIR, 'metadata.pkl'), 'wb') as f:
@@ -248,8 +327,24 @@ def preprocess_all_records():
     print("\n✓ Preprocessing complete!")
     print("=" * 60)
     
-    return X_train, y_train, X_val, y_val, X_test, y_test
+    return index_train, index_val, index_test
 
 
 if __name__ == '__main__':
-    preprocess_all_records()
+    parser = argparse.ArgumentParser(description='Preprocess MIT-BIH AF Database')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes (default: all CPUs)')
+    parser.add_argument('--dtype', choices=['float32', 'float16'], default='float32',
+                        help='Storage dtype of the continuous signals (default: float32)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always decode records with wfdb (skip data/cache)')
+    parser.add_argument('--cache-format', choices=['npz', 'npy'], default='npz',
+                        help='Decoded-record cache format: compressed npz or memory-mappable npy')
+    args = parser.parse_args()
+    
+    preprocess_all_records(
+        workers=args.workers,
+        signal_dtype=args.dtype,
+        use_cache=not args.no_cache,
+        cache_format=args.cache_format
+    )
@@ -0,0 +1,169 @@
+"""
+Decoded-record cache for WFDB sources
+
+Parsing WFDB format-212 signals is the slowest part of loading an AFDB
+record. The first load of a record decodes it with wfdb and stores the
+channel signals, sample rate and annotation arrays under data/cache,
+keyed by a checksum of the record's source files (.hea, .dat, .atr), so
+later runs skip the WFDB parser and a changed source is never served
+stale.
+
+Formats:
+- 'npz': one compressed file per record (smallest on disk)
+- 'npy': uncompressed directory per record; the signal is memory-mapped
+  on load
+
+Usage:
+    record, ann = load_record_cached('04015')
+    record.p_signal[:, 0], record.fs, ann.sample, ann.aux_note
+"""
+
+import os
+import glob
+import shutil
+import hashlib
+
+import numpy as np
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'mitbih_af')
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'cache')
+
+SOURCE_EXTENSIONS = ('hea', 'dat', 'atr')
+
+# Part of the cache key; bump when the stored arrays change (2: float64 p_signal)
+CACHE_VERSION = 2
+
+
+class CachedRecord:
+    """Subset of wfdb.Record used by the training pipeline"""
+
+    def __init__(self, record_name, p_signal, fs, sig_name):
+        self.record_name = record_name
+        self.p_signal = p_signal
+        self.fs = fs
+        self.sig_name = sig_name
+        self.sig_len, self.n_sig = p_signal.shape
+
+
+class CachedAnnotation:
+    """Subset of wfdb.Annotation used by the training pipeline"""
+
+    def __init__(self, sample, symbol, aux_note):
+        self.sample = sample
+        self.symbol = symbol
+        self.aux_note = aux_note
+
+
+def source_checksum(record_name, data_dir=DATA_DIR):
+    """SHA-256 over CACHE_VERSION and the record's source files (first 16 hex chars)"""
+    digest = hashlib.sha256(f'v{CACHE_VERSION}'.encode())
+    for ext in SOURCE_EXTENSIONS:
+        path = os.path.join(data_dir, f'{record_name}.{ext}')
+        if not os.path.exists(path):
+            continue
+        digest.update(ext.encode())
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def _decode(record_name, data_dir):
+    """Decode a record and its annotations with wfdb"""
+    import wfdb
+
+    record_path = os.path.join(data_dir, record_name)
+    record = wfdb.rdrecord(record_path)
+    ann = wfdb.rdann(record_path, 'atr')
+
+    arrays = {
+        # float64 as returned by wfdb, so cached and uncached loads match
+        'p_signal': np.asarray(record.p_signal, dtype=np.float64),
+        'fs': np.array(record.fs),
+        'sig_name': np.array(record.sig_name),
+        'ann_sample': np.asarray(ann.sample, dtype=np.int64),
+        'ann_symbol': np.array(ann.symbol),
+        'ann_aux_note': np.array(ann.aux_note),
+    }
+    return arrays
+
+
+def _from_arrays(record_name, arrays):
+    record = CachedRecord(
+        record_name,
+        arrays['p_signal'],
+        float(arrays['fs']),
+        arrays['sig_name'].tolist()
+    )
+    ann = CachedAnnotation(
+        arrays['ann_sample'],
+        arrays['ann_symbol'].tolist(),
+        arrays['ann_aux_note'].tolist()
+    )
+    return record, ann
+
+
+def _remove_stale(record_name, cache_dir, keep):
+    """Delete cache entries of this record made from older source files"""
+    for path in glob.glob(os.path.join(cache_dir, f'{record_name}.*')):
+        if os.path.basename(path).split('.')[1] == keep:
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+
+
+def _write(arrays, path, fmt):
+    """Write a cache entry atomically (safe with parallel workers)"""
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    if fmt == 'npz':
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+    else:
+        os.makedirs(tmp_path)
+        for name, value in arrays.items():
+            np.save(os.path.join(tmp_path, f'{name}.npy'), value)
+    os.replace(tmp_path, path)
+
+
+def _read(path, fmt):
+    if fmt == 'npz':
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+    return {
+        os.path.splitext(name)[0]: np.load(
+            os.path.join(path, name), mmap_mode='r' if name == 'p_signal.npy' else None
+        )
+        for name in os.listdir(path)
+    }
+
+
+def load_record_cached(record_name, data_dir=DATA_DIR, cache_dir=CACHE_DIR, fmt='npz'):
+    """
+    Load a record and its annotations, decoding with wfdb only on a cache miss
+
+    Args:
+        record_name: Record name (e.g. '04015')
+        data_dir: Directory with the WFDB source files
+        cache_dir: Cache directory
+        fmt: 'npz' (compressed) or 'npy' (memory-mapped signal)
+
+    Returns:
+        (record, ann) with the attributes of wfdb.Record / wfdb.Annotation
+        used by preprocess.py
+    """
+    if fmt not in ('npz', 'npy'):
+        raise ValueError(f"Unknown cache format: {fmt}")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    key = source_checksum(record_name, data_dir)
+    path = os.path.join(cache_dir, f'{record_name}.{key}.{fmt}')
+
+    if os.path.exists(path):
+        return _from_arrays(record_name, _read(path, fmt))
+
+    arrays = _decode(record_name, data_dir)
+    _remove_stale(record_name, cache_dir, keep=key)
+    _write(arrays, path, fmt)
+    return _from_arrays(record_name, arrays)
@@ -13,12 +13,16 @@ References:
 """
 
 import os
+import time
+import argparse
 import numpy as np
 import tensorflow as tf
 from tensorflow import keras
 from tensorflow.keras import layers, models, callbacks
 import pickle
 
+from window_dataset import WindowDataset
+
 # Paths
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'processed')
 MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'models', 'trained')
@@ -28,10 +32,15 @@ WINDOW_SIZE = 2500  # 10 seconds @ 250Hz
 NUM_FEATURES = 1    # Single channel
 
 
-def build_cnn_lstm_model(input_shape=(WINDOW_SIZE, NUM_FEATURES)):
+def build_cnn_lstm_model(input_shape=(WINDOW_SIZE, NUM_FEATURES), conv_filters=(32, 64, 128),
+                         lstm_units=(64, 32), dense_units=64):
     """
     Build CNN-LSTM hybrid model for AF detection
     
+    The layer widths default to the trained model; smaller ones give the
+    same architecture at a fraction of the cost (e.g. the randomly
+    initialized model of benchmarks/run_benchmarks.py).
+    
     Architecture Design Rationale:
     - Conv1D layers: Extract local morphological features (QRS, P-wave patterns)
     - BatchNormalization: Stabilize training, improve convergence
@@ -49,37 +58,135 @@ def build_cnn_lstm_model(input_shape=(WINDOW_SIZE, NUM_FEATURES)):
     model = models.Sequential([
         # === CNN Feature Extraction ===
         # First Conv Block - Capture basic waveform features
-        layers.Conv1D(32, kernel_size=5, activation='relu', 
+        layers.Conv1D(conv_filters[0], kernel_size=5, activation='relu', 
                       padding='same', input_shape=input_shape),
         layers.BatchNormalization(),
         layers.MaxPooling1D(pool_size=2),
         
         # Second Conv Block - Higher-level pattern recognition
-        layers.Conv1D(64, kernel_size=5, activation='relu', padding='same'),
+        layers.Conv1D(conv_filters[1], kernel_size=5, activation='relu', padding='same'),
         layers.BatchNormalization(),
         layers.MaxPooling1D(pool_size=2),
         
         # Third Conv Block - Complex feature combinations
-        layers.Conv1D(128, kernel_size=3, activation='relu', padding='same'),
+        layers.Conv1D(conv_filters[2], kernel_size=3, activation='relu', padding='same'),
         layers.BatchNormalization(),
         layers.MaxPooling1D(pool_size=2),
         
         # === LSTM Temporal Analysis ===
         # First LSTM - Process sequence and keep temporal info
-        layers.LSTM(64, return_sequences=True),
+        layers.LSTM(lstm_units[0], return_sequences=True),
         
         # Second LSTM - Final temporal encoding
-        layers.LSTM(32),
+        layers.LSTM(lstm_units[1]),
         
         # === Classification Head ===
-        layers.Dense(64, activation='relu'),
+        layers.Dense(dense_units, activation='relu'),
         layers.Dropout(0.5),
-        layers.Dense(1, activation='sigmoid')  # Binary: 0=Normal, 1=AF
+        # float32 output keeps the sigmoid stable under mixed precision
+        layers.Dense(1, activation='sigmoid', dtype='float32')  # Binary: 0=Normal, 1=AF
     ])
     
     return model
 
 
+class WindowSequence(keras.utils.Sequence):
+    """Keras batch source that cuts windows on the fly from a WindowDataset"""
+    
+    def __init__(self, dataset, batch_size=32, shuffle=False, seed=42):
+        super().__init__()
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+        self.order = np.arange(len(dataset))
+        if self.shuffle:
+            self.rng.shuffle(self.order)
+    
+    def __len__(self):
+        return int(np.ceil(len(self.dataset) / self.batch_size))
+    
+    def __getitem__(self, batch_idx):
+        positions = self.order[batch_idx * self.batch_size:(batch_idx + 1) * self.batch_size]
+        return self.dataset.get_windows(positions)
+    
+    def on_epoch_end(self):
+        if self.shuffle:
+            self.rng.shuffle(self.order)
+
+
+def make_tf_dataset(dataset, batch_size=32, shuffle=False, shuffle_buffer=10000, seed=42):
+    """
+    tf.data input pipeline over a WindowDataset
+    
+    Shuffles window positions with a bounded buffer, batches them, cuts the
+    windows from the memory-mapped signals in parallel map calls and
+    prefetches with autotune, so loading overlaps with training.
+    """
+    positions = tf.data.Dataset.range(len(dataset))
+    if shuffle:
+        positions = positions.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    
+    def load_batch(batch_positions):
+        X, y = tf.numpy_function(
+            dataset.get_windows, [batch_positions], [tf.float32, tf.int64]
+        )
+        X.set_shape([None, dataset.window_size, NUM_FEATURES])
+        y.set_shape([None])
+        return X, y
+    
+    return (
+        positions
+        .batch(batch_size)
+        .map(load_batch, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+        .prefetch(tf.data.AUTOTUNE)
+    )
+
+
+def cpu_supports_bfloat16():
+    """True if the CPU has native bfloat16 instructions (AVX512-BF16 / AMX)"""
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+
+class ThroughputLogger(callbacks.Callback):
+    """
+    Log training samples/sec per epoch (also stored in the history)
+    
+    Timed from the start of the epoch's first training batch to the end of
+    its last, so validation at the end of the epoch is not counted.
+    """
+    
+    def __init__(self, n_samples):
+        super().__init__()
+        self.n_samples = n_samples
+        self.train_start = None
+        self.train_end = None
+    
+    def on_epoch_begin(self, epoch, logs=None):
+        self.train_start = None
+    
+    def on_train_batch_begin(self, batch, logs=None):
+        if self.train_start is None:
+            self.train_start = time.perf_counter()
+    
+    def on_train_batch_end(self, batch, logs=None):
+        self.train_end = time.perf_counter()
+    
+    def on_epoch_end(self, epoch, logs=None):
+        if self.train_start is None:
+            return
+        elapsed = self.train_end - self.train_start
+        samples_per_sec = self.n_samples / elapsed if elapsed > 0 else 0.0
+        print(f"\nEpoch {epoch + 1}: {samples_per_sec:.1f} samples/sec ({elapsed:.1f}s)")
+        if logs is not None:
+            logs['samples_per_sec'] = samples_per_sec
+
+
 def create_class_weights(y_train):
     """Calculate class weights for imbalanced dataset"""
     n_samples = len(y_train)
@@ -93,12 +200,29 @@ def create_class_weights(y_train):
     return {0: weight_normal, 1: weight_af}
 
 
-def train_model():
-    """Train the CNN-LSTM model with Resume Support"""
+def train_model(pipeline='sequence', batch_size=32, shuffle_buffer=10000, bfloat16=False):
+    """
+    Train the CNN-LSTM model with Resume Support
+    
+    Args:
+        pipeline: 'sequence' (keras Sequence) or 'tfdata' (tf.data with
+            parallel loading and prefetch)
+        batch_size: Training batch size
+        shuffle_buffer: tf.data shuffle buffer size (bounds memory)
+        bfloat16: Use mixed_bfloat16 precision if the CPU supports it
+    """
     print("=" * 60)
     print("Training CNN-LSTM AF Detection Model")
     print("=" * 60)
     
+    if bfloat16:
+        if cpu_supports_bfloat16():
+            # Must be set before the model is built
+            keras.mixed_precision.set_global_policy('mixed_bfloat16')
+            print("Mixed precision: mixed_bfloat16")
+        else:
+            print("Warning: CPU has no native bfloat16 support, training in float32")
+    
     # Create model directory
     os.makedirs(MODEL_DIR, exist_ok=True)
     
@@ -108,17 +232,17 @@ def train_model():
     
     # Load preprocessed data
     print("\nLoading preprocessed data...")
-    if not os.path.exists(os.path.join(DATA_DIR, 'X_train.npy')):
+    if not os.path.exists(os.path.join(DATA_DIR, 'index_train.npy')):
         print("Data not found! Please run preprocess.py first.")
         return None, None
 
-    X_train = np.load(os.path.join(DATA_DIR, 'X_train.npy'))
-    y_train = np.load(os.path.join(DATA_DIR, 'y_train.npy'))
-    X_val = np.load(os.path.join(DATA_DIR, 'X_val.npy'))
-    y_val = np.load(os.path.join(DATA_DIR, 'y_val.npy'))
+    # Windows are cut on the fly from memory-mapped signals
+    train_set = WindowDataset('train', DATA_DIR)
+    val_set = WindowDataset('val', DATA_DIR)
+    y_train = train_set.labels
     
-    print(f"Training samples: {len(X_train)}")
-    print(f"Validation samples: {len(X_val)}")
+    print(f"Training samples: {len(train_set)}")
+    print(f"Validation samples: {len(val_set)}")
     
     # Determine initial epoch and load model if checkpoint exists
     initial_epoch = 0
@@ -169,8 +293,18 @@ def train_model():
     # Calculate class weights
     class_weights = create_class_weights(y_train)
     
+    # Input pipeline
+    if pipeline == 'tfdata':
+        train_data = make_tf_dataset(train_set, batch_size, shuffle=True, shuffle_buffer=shuffle_buffer)
+        val_data = make_tf_dataset(val_set, batch_size)
+    else:
+        train_data = WindowSequence(train_set, batch_size=batch_size, shuffle=True)
+        val_data = WindowSequence(val_set, batch_size=batch_size)
+    
     # Callbacks
     callback_list = [
+        # First, so samples/sec is in the logs saved by the history callback
+        ThroughputLogger(len(train_set)),
         # Save every epoch to allow resuming
         callbacks.ModelCheckpoint(
             checkpoint_path,
@@ -215,11 +349,10 @@ def train_model():
         print("-" * 60)
         
         history = model.fit(
-            X_train, y_train,
-            validation_data=(X_val, y_val),
+            train_data,
+            validation_data=val_data,
             initial_epoch=initial_epoch,
             epochs=50,
-            batch_size=32,
             class_weight=class_weights,
             callbacks=callback_list,
             verbose=1
@@ -287,4 +420,19 @@ def save_model_config(window_size, num_features, model_dir):
 
 
 if __name__ == '__main__':
-    train_model()
+    parser = argparse.ArgumentParser(description='Train CNN-LSTM AF detection model')
+    parser.add_argument('--pipeline', choices=['sequence', 'tfdata'], default='sequence',
+                        help='Input pipeline (default: sequence)')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--shuffle-buffer', type=int, default=10000,
+                        help='tf.data shuffle buffer size (default: 10000)')
+    parser.add_argument('--bf16', action='store_true',
+                        help='Use mixed bfloat16 precision on CPUs that support it')
+    args = parser.parse_args()
+    
+    train_model(
+        pipeline=args.pipeline,
+        batch_size=args.batch_size,
+        shuffle_buffer=args.shuffle_buffer,
+        bfloat16=args.bf16
+    )
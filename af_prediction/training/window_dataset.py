@@ -0,0 +1,82 @@
+"""
+Virtual window dataset over memory-mapped continuous signals
+
+preprocess.py stores each record once as a continuous signal
+(signals/<record>.npy) plus a (record, offset, label) index per split.
+WindowDataset cuts the 10-second windows on the fly, so only the
+batches actually requested are ever materialized in RAM.
+
+Usage:
+    train_set = WindowDataset('train')
+    for X, y in train_set.iter_batches(batch_size=32, shuffle=True):
+        ...
+"""
+
+import os
+import pickle
+
+import numpy as np
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'processed')
+
+
+class WindowDataset:
+    """
+    Window sampler for one split (train / val / test)
+
+    Windows are returned as float32 arrays of shape (n, window_size, 1),
+    whatever the storage dtype of the signals. An explicit index (e.g. a
+    cross-validation fold from cross_validate.py) replaces the split file.
+    """
+
+    def __init__(self, split, data_dir=DATA_DIR, index=None):
+        with open(os.path.join(data_dir, 'metadata.pkl'), 'rb') as f:
+            self.metadata = pickle.load(f)
+
+        self.split = split
+        self.window_size = self.metadata['window_size']
+        if index is None:
+            index = np.load(os.path.join(data_dir, f'index_{split}.npy'))
+        self.index = index
+
+        # Memory-mapped: pages are read from disk only when a window touches them
+        self.signals = [
+            np.load(os.path.join(data_dir, 'signals', f'{record}.npy'), mmap_mode='r')
+            for record in self.metadata['records']
+        ]
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def labels(self):
+        return self.index['label'].astype(np.int64)
+
+    def get_windows(self, positions):
+        """
+        Cut windows for the given positions in the split index
+
+        Returns:
+            X: float32 array (len(positions), window_size, 1)
+            y: int64 labels
+        """
+        entries = self.index[positions]
+        X = np.empty((len(entries), self.window_size, 1), dtype=np.float32)
+
+        for i, (record, offset, _) in enumerate(entries):
+            X[i, :, 0] = self.signals[record][offset:offset + self.window_size]
+
+        return X, entries['label'].astype(np.int64)
+
+    def iter_batches(self, batch_size=32, shuffle=False, seed=None):
+        """Yield (X, y) batches, optionally in a shuffled order"""
+        order = np.arange(len(self))
+        if shuffle:
+            np.random.default_rng(seed).shuffle(order)
+
+        for start in range(0, len(order), batch_size):
+            yield self.get_windows(order[start:start + batch_size])
+
+    def load_all(self):
+        """Materialize the whole split (only for small splits)"""
+        return self.get_windows(np.arange(len(self)))
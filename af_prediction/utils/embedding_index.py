@@ -0,0 +1,388 @@
+"""
+Persistent window embedding index for similar-episode search
+
+AFPredictor can return the penultimate Dense layer output (64 values for
+the CNN-LSTM) of every window from the same model call as the AF
+probability. Those embeddings are stored here, one row per 10-second
+window, so "find episodes like this one" is a vector search over the
+archive instead of a model re-run.
+
+On disk (one directory per model tier; embeddings of different models
+are not comparable):
+- vectors.f32: append-only L2-normalized float32 vectors (count, dim)
+- items.bin: append-only (recording, start_seconds, probability) rows
+- meta.json: dim and committed count, replaced atomically after the data
+  is written, with adds holding a file lock (as in SignalStore)
+- ivf.npz: optional IVF-PQ structure built by build_ivf()
+
+Search (cosine similarity, i.e. inner product of normalized vectors):
+- exact: blocked matrix-vector products over the memory-mapped vectors
+- approximate: IVF (k-means coarse lists, nprobe lists scanned) with
+  product-quantized residuals scored by table lookup (asymmetric
+  distance), then the best candidates re-ranked with the exact vectors.
+  Vectors added after the last build are scanned exactly.
+
+Usage:
+    index = EmbeddingIndex()
+    index.add(42, embeddings, start_seconds, probabilities)
+    index.build_ivf()
+    query = index.query_vector(42, start_seconds=600, end_seconds=660)
+    hits = index.search(query, k=10)
+"""
+
+import os
+import json
+import threading
+import warnings
+from contextlib import contextmanager
+
+import numpy as np
+from scipy.cluster.vq import kmeans2
+
+from utils.file_lock import file_lock
+
+EMBEDDING_INDEX_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'embeddings')
+
+DTYPE = np.float32
+ITEM_DTYPE = np.dtype([('recording', '<i8'), ('start_seconds', '<f4'), ('probability', '<f4')])
+
+# Rows per block for exact scans
+SEARCH_BLOCK = 1 << 16
+
+# Score-matrix elements per block when assigning vectors to lists/codewords
+ASSIGN_BLOCK_ELEMENTS = 1 << 24
+
+# Product quantization: 256 centroids per subvector (uint8 codes)
+PQ_CENTROIDS = 256
+
+
+def normalize(vectors):
+    """L2-normalize rows (zero rows stay zero)"""
+    vectors = np.asarray(vectors, dtype=DTYPE)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k(scores, ids, k):
+    """The k highest scores (descending) with their ids"""
+    if len(scores) > k:
+        keep = np.argpartition(-scores, k - 1)[:k]
+        scores, ids = scores[keep], ids[keep]
+    order = np.argsort(-scores, kind='stable')
+    return scores[order], ids[order]
+
+
+class EmbeddingIndex:
+    """Append-only window embeddings with exact and IVF-PQ search"""
+    
+    def __init__(self, root=EMBEDDING_INDEX_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        self._ivf = None
+        self._ivf_mtime = None
+    
+    def _path(self, name):
+        return os.path.join(self.root, name)
+    
+    @contextmanager
+    def _locked(self):
+        """self._lock, then the index file lock (other worker processes)"""
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock, file_lock(self._path('.lock')):
+            yield
+    
+    def meta(self):
+        if not os.path.exists(self._path('meta.json')):
+            return {'dim': None, 'count': 0}
+        with open(self._path('meta.json')) as f:
+            return json.load(f)
+    
+    def _write_meta(self, meta):
+        path = self._path('meta.json')
+        tmp_path = f'{path}.tmp{os.getpid()}'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)
+    
+    def __len__(self):
+        return self.meta()['count']
+    
+    def vectors(self, meta=None):
+        meta = meta or self.meta()
+        if meta['count'] == 0:
+            return np.empty((0, meta['dim'] or 0), dtype=DTYPE)
+        return np.memmap(self._path('vectors.f32'), dtype=DTYPE, mode='r', shape=(meta['count'], meta['dim']))
+    
+    def items(self, meta=None):
+        meta = meta or self.meta()
+        if meta['count'] == 0:
+            return np.empty(0, dtype=ITEM_DTYPE)
+        return np.memmap(self._path('items.bin'), dtype=ITEM_DTYPE, mode='r', shape=(meta['count'],))
+    
+    def contains(self, recording_id):
+        return bool(np.any(self.items()['recording'] == int(recording_id)))
+    
+    def add(self, recording_id, embeddings, start_seconds, probabilities):
+        """
+        Append the window embeddings of one recording
+        
+        Args:
+            recording_id: Recording id
+            embeddings: (windows, dim) embeddings; rows with NaN (windows
+                skipped by quality gating) are not stored
+            start_seconds: Window start times (seconds)
+            probabilities: AF probability per window
+        
+        Returns:
+            Number of windows added
+        """
+        with self._locked():
+            return self._append(recording_id, embeddings, start_seconds, probabilities)
+    
+    def add_if_absent(self, recording_id, embeddings, start_seconds, probabilities):
+        """
+        add() unless the recording is already indexed, checked under the
+        same locks as the append (concurrent predictions of one recording
+        store its windows once)
+        
+        Returns:
+            Number of windows added (0 if the recording was indexed)
+        """
+        with self._locked():
+            if self.contains(recording_id):
+                return 0
+            return self._append(recording_id, embeddings, start_seconds, probabilities)
+    
+    def _append(self, recording_id, embeddings, start_seconds, probabilities):
+        """add() body; the caller holds self._locked()"""
+        embeddings = np.asarray(embeddings, dtype=DTYPE)
+        keep = ~np.isnan(embeddings).any(axis=1)
+        
+        items = np.zeros(int(keep.sum()), dtype=ITEM_DTYPE)
+        items['recording'] = int(recording_id)
+        items['start_seconds'] = np.asarray(start_seconds)[keep]
+        items['probability'] = np.asarray(probabilities, dtype=DTYPE)[keep]
+        vectors = normalize(embeddings[keep])
+        
+        meta = self.meta()
+        if meta['dim'] is None:
+            meta['dim'] = embeddings.shape[1]
+        elif embeddings.shape[1] != meta['dim']:
+            raise ValueError(f"Embedding size {embeddings.shape[1]} does not match index ({meta['dim']})")
+        
+        for filename, data, row_bytes in (('vectors.f32', vectors, meta['dim'] * DTYPE().itemsize),
+                                          ('items.bin', items, ITEM_DTYPE.itemsize)):
+            with open(self._path(filename), 'ab') as f:
+                # Drop anything beyond the committed count (an interrupted add)
+                f.truncate(meta['count'] * row_bytes)
+                data.tofile(f)
+        
+        meta['count'] += len(items)
+        self._write_meta(meta)
+        
+        return len(items)
+    
+    def query_vector(self, recording_id, start_seconds=0.0, end_seconds=None):
+        """
+        Query for an episode: mean of the normalized embeddings of the
+        recording's windows starting in [start_seconds, end_seconds)
+        
+        Returns:
+            Normalized query vector, or None if no window is indexed there
+        """
+        meta = self.meta()
+        items = self.items(meta)
+        mask = (items['recording'] == int(recording_id)) & (items['start_seconds'] >= start_seconds)
+        if end_seconds is not None:
+            mask &= items['start_seconds'] < end_seconds
+        rows = np.flatnonzero(mask)
+        if len(rows) == 0:
+            return None
+        return normalize(np.asarray(self.vectors(meta)[rows]).mean(axis=0))
+    
+    def _exact_scores(self, vectors, query, start=0, stop=None):
+        """(scores, ids) of rows start..stop, scanned block by block"""
+        stop = len(vectors) if stop is None else stop
+        scores = np.empty(stop - start, dtype=DTYPE)
+        for block in range(start, stop, SEARCH_BLOCK):
+            end = min(block + SEARCH_BLOCK, stop)
+            scores[block - start:end - start] = vectors[block:end] @ query
+        return scores, np.arange(start, stop)
+    
+    def search(self, query, k=10, mode='approximate', nprobe=16, refine=500, exclude_recording_id=None):
+        """
+        Most similar windows to a query vector
+        
+        Args:
+            query: Query embedding (normalized here)
+            k: Number of hits
+            mode: 'exact' or 'approximate' (IVF-PQ; exact if not built)
+            nprobe: IVF lists scanned
+            refine: Approximate candidates re-ranked with exact vectors
+            exclude_recording_id: Skip windows of this recording (e.g. the
+                recording the query comes from)
+        
+        Returns:
+            Hits (best first): dicts with id, recording_id, start_seconds,
+            probability and score (cosine similarity)
+        """
+        if mode not in ('exact', 'approximate'):
+            raise ValueError(f"Unknown search mode: {mode}")
+        
+        meta = self.meta()
+        if meta['count'] == 0:
+            return []
+        vectors = self.vectors(meta)
+        items = self.items(meta)
+        query = normalize(query)
+        
+        def included(scores, ids):
+            if exclude_recording_id is None:
+                return scores, ids
+            keep = items['recording'][ids] != int(exclude_recording_id)
+            return scores[keep], ids[keep]
+        
+        ivf = self._load_ivf() if mode == 'approximate' else None
+        if ivf is None:
+            scores, ids = top_k(*included(*self._exact_scores(vectors, query)), k)
+        else:
+            candidates = self._ivf_candidates(ivf, query, nprobe, max(k, refine), included)
+            # Re-rank with exact vectors (sorted ids read the memmap in order)
+            candidates = np.sort(candidates)
+            scores, ids = np.asarray(vectors[candidates]) @ query, candidates
+            
+            # Vectors added after the last build
+            indexed = int(ivf['indexed_count'])
+            if indexed < meta['count']:
+                tail_scores, tail_ids = included(*self._exact_scores(vectors, query, indexed, meta['count']))
+                scores, ids = np.concatenate([scores, tail_scores]), np.concatenate([ids, tail_ids])
+            scores, ids = top_k(scores, ids, k)
+        
+        items = items[ids]
+        return [
+            {
+                'id': int(i),
+                'recording_id': int(item['recording']),
+                'start_seconds': float(item['start_seconds']),
+                'probability': float(item['probability']),
+                'score': float(score)
+            }
+            for i, item, score in zip(ids, items, scores)
+        ]
+    
+    def _ivf_candidates(self, ivf, query, nprobe, n_candidates, included):
+        """Ids of the best candidates by asymmetric PQ distance in the nprobe nearest lists"""
+        centroids, codebooks = ivf['centroids'], ivf['codebooks']
+        offsets, codes, ids = ivf['offsets'], ivf['codes'], ivf['ids']
+        
+        list_scores = centroids @ query
+        lists = np.argsort(-list_scores)[:min(nprobe, len(centroids))]
+        
+        # Lookup table: query subvector . codeword, (subvectors, PQ_CENTROIDS)
+        n_sub = codebooks.shape[0]
+        table = np.einsum('mcd,md->mc', codebooks, query.reshape(n_sub, -1))
+        
+        all_scores = []
+        all_ids = []
+        for lst in lists:
+            first, last = offsets[lst], offsets[lst + 1]
+            if first == last:
+                continue
+            list_codes = codes[first:last]
+            # q . (centroid + residual) = q . centroid + sum_j table[j, code_j]
+            all_scores.append(list_scores[lst] + table[np.arange(n_sub), list_codes].sum(axis=1))
+            all_ids.append(ids[first:last])
+        
+        if not all_scores:
+            return np.empty(0, dtype=np.int64)
+        _, candidates = top_k(*included(np.concatenate(all_scores), np.concatenate(all_ids)), n_candidates)
+        return candidates
+    
+    def _load_ivf(self):
+        path = self._path('ivf.npz')
+        if not os.path.exists(path):
+            return None
+        mtime = os.path.getmtime(path)
+        if self._ivf is None or self._ivf_mtime != mtime:
+            with np.load(path) as data:
+                self._ivf = {key: data[key] for key in data.files}
+            self._ivf_mtime = mtime
+        return self._ivf
+    
+    def build_ivf(self, n_lists=None, n_subvectors=16, train_size=100000, seed=42):
+        """
+        Train the IVF-PQ structure over all vectors stored so far
+        
+        Args:
+            n_lists: Coarse k-means lists (default: sqrt(count))
+            n_subvectors: PQ subvectors (must divide the embedding size)
+            train_size: Vectors sampled to train the k-means codebooks
+            seed: Random seed
+        
+        Returns:
+            Build summary
+        """
+        meta = self.meta()
+        count, dim = meta['count'], meta['dim']
+        if count == 0:
+            raise ValueError("Embedding index is empty")
+        if dim % n_subvectors != 0:
+            raise ValueError(f"n_subvectors ({n_subvectors}) must divide the embedding size ({dim})")
+        
+        vectors = self.vectors(meta)
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(vectors[np.sort(rng.choice(count, min(count, train_size), replace=False))], dtype=np.float64)
+        n_lists = min(n_lists or max(int(np.sqrt(count)), 1), len(sample))
+        
+        with warnings.catch_warnings():
+            # Empty clusters are expected for small or very clustered data
+            warnings.simplefilter('ignore')
+            centroids, _ = kmeans2(sample, n_lists, minit='points', seed=seed)
+            sample_residuals = sample - centroids[self._nearest(sample, centroids)]
+            sub_dim = dim // n_subvectors
+            n_codes = min(PQ_CENTROIDS, len(sample))
+            codebooks = np.zeros((n_subvectors, PQ_CENTROIDS, sub_dim))
+            for j in range(n_subvectors):
+                codebooks[j, :n_codes], _ = kmeans2(
+                    sample_residuals[:, j * sub_dim:(j + 1) * sub_dim], n_codes, minit='points', seed=seed + j
+                )
+        
+        assignments = np.empty(count, dtype=np.int64)
+        codes = np.empty((count, n_subvectors), dtype=np.uint8)
+        block_rows = max(ASSIGN_BLOCK_ELEMENTS // max(n_lists, PQ_CENTROIDS), 1)
+        for block in range(0, count, block_rows):
+            end = min(block + block_rows, count)
+            x = np.asarray(vectors[block:end], dtype=np.float64)
+            assignments[block:end] = self._nearest(x, centroids)
+            residuals = x - centroids[assignments[block:end]]
+            for j in range(n_subvectors):
+                codes[block:end, j] = self._nearest(residuals[:, j * sub_dim:(j + 1) * sub_dim], codebooks[j, :n_codes])
+        
+        # Group by list: list l holds ids[offsets[l]:offsets[l + 1]]
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))])
+        
+        path = self._path('ivf.npz')
+        tmp_path = f'{path}.tmp{os.getpid()}.npz'
+        np.savez(
+            tmp_path,
+            centroids=centroids.astype(DTYPE),
+            codebooks=codebooks.astype(DTYPE),
+            codes=codes[order],
+            ids=order,
+            offsets=offsets,
+            indexed_count=count
+        )
+        os.replace(tmp_path, path)
+        
+        return {
+            'indexed_count': count,
+            'n_lists': n_lists,
+            'n_subvectors': n_subvectors,
+            'bytes_per_vector': n_subvectors
+        }
+    
+    @staticmethod
+    def _nearest(x, centroids):
+        """Index of the nearest centroid (L2) per row"""
+        return np.argmax(x @ centroids.T - 0.5 * np.sum(centroids ** 2, axis=1), axis=1)
@@ -0,0 +1,37 @@
+"""
+Inter-process file lock for the on-disk stores
+
+SignalStore and EmbeddingIndex serialize their appends with a
+threading.Lock, which only covers the threads of one process. With
+AF_ASGI_EXECUTOR=process (or several gunicorn workers) every worker
+process has its own lock, so the stores also take an exclusive
+fcntl.flock on a lock file next to the data while they append and
+replace meta.json.
+
+Usage:
+    with file_lock(os.path.join(directory, '.lock')):
+        ...  # append data, write meta.json
+"""
+
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Not POSIX (e.g. Windows): only the threading locks apply
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on `path` (created if missing)"""
+    if fcntl is None:
+        yield
+        return
+    
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,136 @@
+"""
+Decoding of compressed request bodies
+
+ECG sample arrays compress to a fraction of their JSON size, so clients
+may send request bodies with Content-Encoding gzip, deflate or zstd.
+The body is read from the request stream in chunks and decompressed
+incrementally, and decompression stops as soon as the output exceeds
+the size limit (protection against decompression bombs). The decoded
+body itself is not streamed: it is collected into one buffer for
+json.loads, so a request costs up to max_size bytes of memory for the
+decoded JSON plus the parsed object; the limit is what bounds it.
+
+zstd needs the optional `zstandard` package.
+
+Usage:
+    body = read_body(request.stream, request.headers.get('Content-Encoding'))
+    data = json.loads(body)
+"""
+
+import zlib
+
+CHUNK_SIZE = 1 << 20  # 1 MiB
+DEFAULT_MAX_BODY_BYTES = 512 << 20  # ~24 h at 400 Hz as JSON, with headroom
+
+SUPPORTED_ENCODINGS = ('identity', 'gzip', 'x-gzip', 'deflate', 'zstd')
+
+
+class BodyDecodingError(ValueError):
+    """Request body cannot be decoded"""
+
+
+class UnsupportedEncoding(BodyDecodingError):
+    """Content-Encoding not supported"""
+
+
+class BodyTooLarge(BodyDecodingError):
+    """Decoded body exceeds the size limit"""
+
+
+def _read_chunks(stream):
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+def _zlib_chunks(stream, wbits):
+    """Inflate chunk by chunk, never producing more than CHUNK_SIZE at once"""
+    decompressor = None
+    for chunk in _read_chunks(stream):
+        if decompressor is None:
+            if wbits is None:
+                # 'deflate' is zlib-wrapped per RFC 9110, but some clients send raw deflate
+                is_zlib = len(chunk) >= 2 and chunk[0] & 0x0F == 8 and (chunk[0] << 8 | chunk[1]) % 31 == 0
+                wbits = zlib.MAX_WBITS if is_zlib else -zlib.MAX_WBITS
+            decompressor = zlib.decompressobj(wbits)
+        
+        data = chunk
+        while data:
+            yield decompressor.decompress(data, CHUNK_SIZE)
+            data = decompressor.unconsumed_tail
+    
+    if decompressor is not None:
+        yield decompressor.flush()
+        if not decompressor.eof:
+            raise BodyDecodingError('Truncated compressed body')
+
+
+def _zstd_chunks(stream):
+    try:
+        import zstandard
+    except ImportError:
+        raise UnsupportedEncoding('zstd request bodies require the zstandard package')
+    
+    reader = zstandard.ZstdDecompressor().stream_reader(stream, read_size=CHUNK_SIZE)
+    try:
+        while True:
+            chunk = reader.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    except zstandard.ZstdError as e:
+        raise BodyDecodingError(f'Invalid zstd body: {e}')
+
+
+def decoded_chunks(stream, content_encoding=None):
+    """
+    Yield the decoded body of a request stream chunk by chunk
+    
+    Args:
+        stream: File-like object with the raw body (e.g. request.stream)
+        content_encoding: Content-Encoding header value (None = identity)
+    """
+    encoding = (content_encoding or 'identity').strip().lower()
+    
+    if encoding == 'identity':
+        return _read_chunks(stream)
+    if encoding in ('gzip', 'x-gzip'):
+        return _zlib_chunks(stream, 16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        return _zlib_chunks(stream, None)
+    if encoding == 'zstd':
+        return _zstd_chunks(stream)
+    raise UnsupportedEncoding(
+        f"Unsupported Content-Encoding: {content_encoding} (supported: gzip, deflate, zstd)"
+    )
+
+
+def read_body(stream, content_encoding=None, max_size=DEFAULT_MAX_BODY_BYTES):
+    """
+    Read and decode a request body, enforcing a decoded-size limit
+    
+    Decompression is incremental, but the whole decoded body is returned
+    in memory (at most max_size bytes).
+    
+    Args:
+        stream: File-like object with the raw body
+        content_encoding: Content-Encoding header value
+        max_size: Maximum decoded size in bytes
+    
+    Returns:
+        bytearray with the decoded body (accepted by json.loads)
+    
+    Raises:
+        UnsupportedEncoding, BodyTooLarge, BodyDecodingError
+    """
+    body = bytearray()
+    try:
+        for chunk in decoded_chunks(stream, content_encoding):
+            if len(body) + len(chunk) > max_size:
+                raise BodyTooLarge(f'Decoded request body exceeds {max_size} bytes')
+            body += chunk
+    except zlib.error as e:
+        raise BodyDecodingError(f'Invalid {content_encoding} body: {e}')
+    return body
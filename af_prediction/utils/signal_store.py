@@ -0,0 +1,242 @@
+"""
+Per-recording signal store with memory-mapped range reads
+
+Each recording is kept on disk as two append-only float32 tracks:
+- device.f32: samples at the device rate, exactly as received
+- model.f32: the same signal resampled to the model rate (250 Hz)
+
+Range analysis (e.g. a time range selected in the annotation UI) then
+reads only the requested slice of the 250 Hz track through np.memmap,
+instead of re-fetching and resampling the whole recording.
+
+The 250 Hz track is extended on every append with a polyphase filter
+(scipy.signal.resample_poly) over block boundaries aligned to the
+resampling ratio, with enough context on both sides that the stored
+samples are identical to resampling the whole recording at once. The
+last few samples wait for more input until the recording is finalized.
+AFPredictor.preprocess_signal uses the same resample_poly filter, so
+range analysis and whole-recording analysis see the same 250 Hz signal
+(up to float rounding).
+
+Lengths live in meta.json, which is replaced atomically after the data
+is written, so readers never see a partially appended block. Appends
+hold a per-recording file lock (utils/file_lock.py), so worker
+processes sharing the store append one at a time.
+
+Usage:
+    store = SignalStore()
+    store.append(42, samples, sample_rate=400, final=True)
+    segment = store.read(42, start_seconds=600, end_seconds=900)  # 250 Hz
+"""
+
+import os
+import json
+import threading
+from fractions import Fraction
+from contextlib import contextmanager
+
+import numpy as np
+from scipy import signal as scipy_signal
+
+from utils.file_lock import file_lock
+
+SIGNAL_STORE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'signals')
+
+MODEL_SAMPLE_RATE = 250
+DTYPE = np.float32
+
+# The default resample_poly filter reaches 10 * max(up, down) samples
+# either side at the upsampled rate; context kept around each block
+FILTER_HALF_WIDTH = 10
+
+# Largest denominator of a non-integer device rate (128.5 Hz -> 257/2)
+MAX_RATE_DENOMINATOR = 1000
+
+
+def resample_ratio(sample_rate, target_rate=MODEL_SAMPLE_RATE):
+    """
+    (up, down) of resample_poly from sample_rate to target_rate
+    
+    Non-integer rates are taken as the nearest fraction with a
+    denominator up to MAX_RATE_DENOMINATOR instead of being rounded.
+    """
+    if not sample_rate > 0:
+        raise ValueError(f"Invalid sample rate: {sample_rate}")
+    ratio = Fraction(target_rate) / Fraction(sample_rate).limit_denominator(MAX_RATE_DENOMINATOR)
+    return ratio.numerator, ratio.denominator
+
+
+class SignalStore:
+    """Append-only device-rate and 250 Hz tracks per recording"""
+    
+    def __init__(self, root=SIGNAL_STORE_DIR, model_rate=MODEL_SAMPLE_RATE):
+        self.root = root
+        self.model_rate = model_rate
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+    
+    def _dir(self, recording_id):
+        return os.path.join(self.root, f'recording_{int(recording_id)}')
+    
+    @contextmanager
+    def _lock(self, recording_id):
+        """The recording's thread lock, then its file lock (other processes)"""
+        with self._locks_guard:
+            lock = self._locks.setdefault(int(recording_id), threading.Lock())
+        directory = self._dir(recording_id)
+        os.makedirs(directory, exist_ok=True)
+        with lock, file_lock(os.path.join(directory, '.lock')):
+            yield
+    
+    def exists(self, recording_id):
+        return os.path.exists(os.path.join(self._dir(recording_id), 'meta.json'))
+    
+    def meta(self, recording_id):
+        with open(os.path.join(self._dir(recording_id), 'meta.json')) as f:
+            return json.load(f)
+    
+    def _write_meta(self, recording_id, meta):
+        path = os.path.join(self._dir(recording_id), 'meta.json')
+        tmp_path = f'{path}.tmp{os.getpid()}'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)
+    
+    def _ratio(self, sample_rate):
+        return resample_ratio(sample_rate, self.model_rate)
+    
+    @staticmethod
+    def _margin(up, down):
+        """Input samples of context needed for exact block-wise resampling"""
+        return FILTER_HALF_WIDTH * max(up, down) // up + 2
+    
+    def append(self, recording_id, samples, sample_rate, final=False, start_sample=None):
+        """
+        Append device-rate samples and extend the 250 Hz track
+        
+        Args:
+            recording_id: Recording id
+            samples: New samples at the device rate
+            sample_rate: Device sample rate (Hz); must match earlier appends
+            final: The recording is complete; resample the remaining tail
+            start_sample: Device-sample position of samples[0] (re-sync
+                from a full copy of the recording); samples the store
+                already has are skipped instead of appended again
+        
+        Returns:
+            Updated metadata
+        """
+        samples = np.asarray(samples, dtype=DTYPE)
+        
+        with self._lock(recording_id):
+            directory = self._dir(recording_id)
+            if self.exists(recording_id):
+                meta = self.meta(recording_id)
+                if start_sample is not None:
+                    if start_sample > meta['device_samples']:
+                        raise ValueError(
+                            f"Gap: store has {meta['device_samples']} samples, got samples from {start_sample}"
+                        )
+                    samples = samples[meta['device_samples'] - start_sample:]
+                    if meta['final'] and len(samples) == 0:
+                        return meta
+                if meta['final']:
+                    raise ValueError(f"Recording {recording_id} is finalized")
+                if float(sample_rate) != meta['sample_rate']:
+                    raise ValueError(
+                        f"Sample rate {sample_rate} does not match stored {meta['sample_rate']}"
+                    )
+            else:
+                meta = {
+                    'sample_rate': float(sample_rate),
+                    'model_rate': self.model_rate,
+                    'device_samples': 0,
+                    'model_samples': 0,
+                    'resampled_through': 0,  # Device samples already covered by model.f32
+                    'final': False
+                }
+            
+            device_path = os.path.join(directory, 'device.f32')
+            with open(device_path, 'ab') as f:
+                # Drop anything beyond the committed length (an interrupted append)
+                f.truncate(meta['device_samples'] * DTYPE().itemsize)
+                samples.tofile(f)
+            meta['device_samples'] += len(samples)
+            
+            self._extend_model_track(directory, meta, final)
+            meta['final'] = bool(final)
+            self._write_meta(recording_id, meta)
+            return meta
+    
+    def _extend_model_track(self, directory, meta, final):
+        total = meta['device_samples']
+        start = meta['resampled_through']
+        up, down = self._ratio(meta['sample_rate'])
+        margin = self._margin(up, down)
+        
+        if final:
+            end = total
+        else:
+            # Block end aligned to the ratio, leaving right-hand context
+            end = (max(total - margin, start) // down) * down
+        if end <= start:
+            return
+        
+        device = np.memmap(os.path.join(directory, 'device.f32'), dtype=DTYPE, mode='r', shape=(total,))
+        context_start = max(start - margin, 0)
+        context_start -= context_start % down
+        context_end = min(end + margin, total) if not final else total
+        
+        if up == down:
+            resampled = np.asarray(device[start:end])
+        else:
+            block = scipy_signal.resample_poly(np.asarray(device[context_start:context_end], dtype=np.float64), up, down)
+            first = (start - context_start) * up // down
+            if final:
+                # Whole-signal output length is ceil(total * up / down)
+                count = -(-total * up // down) - meta['model_samples']
+            else:
+                count = (end - start) * up // down
+            resampled = block[first:first + count]
+        del device
+        
+        model_path = os.path.join(directory, 'model.f32')
+        with open(model_path, 'ab') as f:
+            f.truncate(meta['model_samples'] * DTYPE().itemsize)
+            resampled.astype(DTYPE).tofile(f)
+        
+        meta['model_samples'] += len(resampled)
+        meta['resampled_through'] = end
+    
+    def read(self, recording_id, start_seconds=0.0, end_seconds=None, track='model'):
+        """
+        Read a time range of one track
+        
+        Args:
+            recording_id: Recording id
+            start_seconds, end_seconds: Range (end None = end of the track)
+            track: 'model' (250 Hz) or 'device'
+        
+        Returns:
+            (samples, sample_rate); samples is a float32 copy of only the
+            requested range
+        """
+        meta = self.meta(recording_id)
+        if track == 'model':
+            rate, length, filename = meta['model_rate'], meta['model_samples'], 'model.f32'
+        elif track == 'device':
+            rate, length, filename = meta['sample_rate'], meta['device_samples'], 'device.f32'
+        else:
+            raise ValueError(f"Unknown track: {track}")
+        
+        first = max(int(round(start_seconds * rate)), 0)
+        last = length if end_seconds is None else min(int(round(end_seconds * rate)), length)
+        if last <= first:
+            return np.empty(0, dtype=DTYPE), rate
+        
+        data = np.memmap(os.path.join(self._dir(recording_id), filename), dtype=DTYPE, mode='r', shape=(length,))
+        return np.array(data[first:last]), rate
+    
+    def duration_seconds(self, recording_id):
+        meta = self.meta(recording_id)
+        return meta['device_samples'] / meta['sample_rate']
@@ -9,12 +9,21 @@
 #   result[:summary] # => Summary statistics
 #   result[:heart_rate] # => Heart rate stats
 #
+#   AfPredictionService.predict_range(recording, 600, 900) # => Same, for 10:00-15:00 only
+#
 class AfPredictionService
   AF_API_URL = ENV.fetch("AF_PREDICTION_API_URL", "http://localhost:5050")
   AF_API_TIMEOUT = ENV.fetch("AF_PREDICTION_TIMEOUT", 60).to_i
+  # When enabled, the Python service reads the batches from the database itself
+  # (requires AF_DATABASE_URL on the Python side) instead of receiving them as JSON
+  AF_FETCH_FROM_DB = ENV.fetch("AF_PREDICTION_FETCH_FROM_DB", "false") == "true"
+  # Gzip request bodies (ECG sample arrays shrink ~5x); the API decodes Content-Encoding
+  AF_GZIP_REQUESTS = ENV.fetch("AF_PREDICTION_GZIP", "false") == "true"
 
   class << self
     def predict(recording)
+      return predict_from_database(recording) if AF_FETCH_FROM_DB
+
       # Get samples from biopotential batches
       samples = prepare_samples(recording)
 
@@ -34,17 +43,50 @@ class AfPredictionService
       # Parse and return response
       parse_response(response)
     rescue StandardError => e
-      Rails.logger.error("AF Prediction Error: #{e.message}")
-      Rails.logger.error(e.backtrace.join("\n"))
+      error_result(e)
+    end
+
+    # Analyze only a time range of a recording (e.g. a selection in the annotation UI);
+    # the Python service reads the range from its signal store
+    def predict_range(recording, start_seconds, end_seconds, threshold: 0.5)
+      body = { start_seconds: start_seconds.to_f, end_seconds: end_seconds.to_f, threshold: threshold }
+
+      parse_response(post_json("/api/predict-af/recording/#{recording.id}/range", body))
+    rescue StandardError => e
+      error_result(e)
+    end
+
+    private
+
+    def predict_from_database(recording)
+      unless recording.biopotential_batches.exists?
+        return {
+          status: "error",
+          message: "Tidak ada data EKG tersedia untuk recording ini"
+        }
+      end
+
+      Rails.logger.info("AF Prediction: Requesting database fetch of recording #{recording.id}")
+
+      body = {}
+      body[:sample_rate] = recording.sample_rate.to_i if recording.sample_rate.present?
+
+      parse_response(post_json("/api/predict-af/recording/#{recording.id}", body))
+    rescue StandardError => e
+      error_result(e)
+    end
+
+    # Log a failed prediction and return it as an error result
+    def error_result(error)
+      Rails.logger.error("AF Prediction Error: #{error.message}")
+      Rails.logger.error(error.backtrace.join("\n"))
 
       {
         status: "error",
-        message: "Gagal melakukan prediksi AF: #{e.message}"
+        message: "Gagal melakukan prediksi AF: #{error.message}"
       }
     end
 
-    private
-
     def prepare_samples(recording)
       samples = []
 
@@ -62,10 +104,16 @@ class AfPredictionService
     end
 
     def make_request(samples, sample_rate)
+      Rails.logger.info("AF Prediction: Sending #{samples.size} samples to #{AF_API_URL}")
+
+      post_json("/api/predict-af", { samples: samples, sample_rate: sample_rate })
+    end
+
+    def post_json(path, payload)
       require "net/http"
       require "json"
 
-      uri = URI.parse("#{AF_API_URL}/api/predict-af")
+      uri = URI.parse("#{AF_API_URL}#{path}")
 
       http = Net::HTTP.new(uri.host, uri.port)
       http.read_timeout = AF_API_TIMEOUT
@@ -73,12 +121,13 @@ class AfPredictionService
 
       request = Net::HTTP::Post.new(uri.path)
       request["Content-Type"] = "application/json"
-      request.body = {
-        samples: samples,
-        sample_rate: sample_rate
-      }.to_json
 
-      Rails.logger.info("AF Prediction: Sending #{samples.size} samples to #{AF_API_URL}")
+      if AF_GZIP_REQUESTS
+        request["Content-Encoding"] = "gzip"
+        request.body = ActiveSupport::Gzip.compress(payload.to_json)
+      else
+        request.body = payload.to_json
+      end
 
       response = http.request(request)
 